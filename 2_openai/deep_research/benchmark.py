@@ -0,0 +1,67 @@
+"""
+Measure the deep research pipeline against the live APIs.
+
+Usage: uv run benchmark.py "query"
+Set HOW_MANY_SEARCHES to benchmark a larger plan, e.g. HOW_MANY_SEARCHES=50
+"""
+
+import asyncio
+import sys
+import time
+from dotenv import load_dotenv
+from research_manager import ResearchManager
+from search_cache import SearchCache
+from search_executor import SearchExecutor, HEDGE_AFTER_SECONDS
+
+load_dotenv(override=True)
+
+
+async def search_latency(query: str):
+    """ Time until the writer can start, planning then searching versus the pipeline, each without cached searches """
+    for pipeline in (False, True):
+        manager = ResearchManager(pipeline=pipeline, cache=SearchCache(":memory:"))
+        start = time.perf_counter()
+        if pipeline:
+            results = await manager.plan_and_search(query)
+        else:
+            results = await manager.perform_searches(await manager.plan_searches(query))
+        label = "pipelined" if pipeline else "staged"
+        print(f"{label}: {len(results)} search results after {time.perf_counter() - start:.1f}s")
+
+
+async def search_tail(query: str):
+    """ The spread of search durations and the failures for the same plan, with and without hedging the slow searches """
+    search_plan = await ResearchManager().plan_searches(query)
+    for hedge_after in (None, HEDGE_AFTER_SECONDS):
+        manager = ResearchManager(cache=SearchCache(":memory:"), executor=SearchExecutor(hedge_after=hedge_after))
+        start = time.perf_counter()
+        await manager.perform_searches(search_plan)
+        label = "hedged" if hedge_after else "unhedged"
+        print(f"{label}: {manager.executor.summary()} in {time.perf_counter() - start:.1f}s")
+
+
+async def report_latency(query: str):
+    """ Time to the first report text and to the whole report, blocking versus streamed, for the same search results """
+    manager = ResearchManager()
+    search_plan = await manager.plan_searches(query)
+    search_results = await manager.perform_searches(search_plan)
+    for stream in (False, True):
+        manager = ResearchManager(stream=stream)
+        if stream:
+            async for _ in manager.write_report_streamed(query, search_results):
+                pass
+        else:
+            await manager.write_report(query, search_results)
+        label = "streamed" if stream else "blocking"
+        print(f"{label}: first text after {manager.timings['report_first_token']:.1f}s, "
+              f"whole report after {manager.timings['report_complete']:.1f}s")
+
+
+async def main(query: str):
+    await search_latency(query)
+    await search_tail(query)
+    await report_latency(query)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else "Latest AI Agent frameworks in 2025"))
@@ -1,23 +1,52 @@
+from contextlib import asynccontextmanager
 import gradio as gr
+import uvicorn
 from dotenv import load_dotenv
-from research_manager import ResearchManager
+from fastapi import FastAPI
+from research_service import ResearchService
 
 load_dotenv(override=True)
 
+service = ResearchService()
 
-async def run(query: str):
-    async for chunk in ResearchManager().run(query):
+
+async def run(user: str, query: str):
+    try:
+        job_id = await service.submit(user.strip() or "anonymous", query)
+    except ValueError as e:
+        yield "", str(e)
+        return
+    async for chunk in service.follow(job_id):
+        yield job_id, chunk
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Jobs left unfinished by a previous run resume once, as the server starts, rather than when the page is opened
+    service.start()
+    yield
+
+
+async def follow(job_id: str):
+    async for chunk in service.follow(job_id.strip()):
         yield chunk
 
 
 with gr.Blocks(theme=gr.themes.Default(primary_hue="sky")) as ui:
     gr.Markdown("# Deep Research")
+    user_textbox = gr.Textbox(label="Your name")
     query_textbox = gr.Textbox(label="What topic would you like to research?")
     run_button = gr.Button("Run", variant="primary")
+    with gr.Row():
+        job_textbox = gr.Textbox(label="Job id, to follow a job you started earlier")
+        follow_button = gr.Button("Follow")
     report = gr.Markdown(label="Report")
-    
-    run_button.click(fn=run, inputs=query_textbox, outputs=report)
-    query_textbox.submit(fn=run, inputs=query_textbox, outputs=report)
 
-ui.launch(inbrowser=True)
+    # The service does the queueing, so Gradio lets every user's request through to it rather than one at a time
+    run_button.click(fn=run, inputs=[user_textbox, query_textbox], outputs=[job_textbox, report], concurrency_limit=None)
+    query_textbox.submit(fn=run, inputs=[user_textbox, query_textbox], outputs=[job_textbox, report], concurrency_limit=None)
+    follow_button.click(fn=follow, inputs=job_textbox, outputs=report, concurrency_limit=None)
 
+# Served by uvicorn so that the service starts with the server, on the event loop the handlers run on
+app = gr.mount_gradio_app(FastAPI(lifespan=lifespan), ui, path="/")
+uvicorn.run(app, host="127.0.0.1", port=7860)
@@ -1,7 +1,9 @@
+import os
 from pydantic import BaseModel, Field
 from agents import Agent
 
-HOW_MANY_SEARCHES = 5
+# The search executor bounds how many of these run at once, so the plan can grow well past the default
+HOW_MANY_SEARCHES = int(os.getenv("HOW_MANY_SEARCHES", "5"))
 
 INSTRUCTIONS = f"You are a helpful research assistant. Given a query, come up with a set of web searches \
 to perform to best answer the query. Output {HOW_MANY_SEARCHES} terms to query for."
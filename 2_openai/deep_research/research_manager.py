@@ -1,29 +1,75 @@
 from agents import Runner, trace, gen_trace_id
+from openai.types.responses import ResponseTextDeltaEvent
 from search_agent import search_agent
 from planner_agent import planner_agent, WebSearchItem, WebSearchPlan
 from writer_agent import writer_agent, ReportData
 from email_agent import email_agent
+from streaming import StreamedArrayItems, StreamedStringField
+from search_cache import SearchCache
+from search_executor import SearchExecutor
 import asyncio
+import math
+import time
+
+# While streaming, the report shown so far is re-sent at most this often rather than on every token
+STREAM_INTERVAL_SECONDS = 0.1
+# The report is started once this fraction of the searches is back and the rest have had STRAGGLER_SECONDS more
+SEARCH_QUORUM = 0.8
+STRAGGLER_SECONDS = 15
 
 class ResearchManager:
 
+    def __init__(
+        self,
+        stream: bool = True,
+        pipeline: bool = True,
+        cache: SearchCache | None = None,
+        executor: SearchExecutor | None = None,
+    ):
+        self.stream = stream
+        self.pipeline = pipeline
+        self.cache = cache or SearchCache()
+        self.executor = executor or SearchExecutor()
+        self.report: ReportData | None = None
+        self.timings: dict[str, float] = {}
+
     async def run(self, query: str):
         """ Run the deep research process, yielding the status updates and the final report"""
         trace_id = gen_trace_id()
         with trace("Research trace", trace_id=trace_id):
-            print(f"View trace: https://platform.openai.com/traces/trace?trace_id={trace_id}")
-            yield f"View trace: https://platform.openai.com/traces/trace?trace_id={trace_id}"
-            print("Starting research...")
-            search_plan = await self.plan_searches(query)
-            yield "Searches planned, starting to search..."     
-            search_results = await self.perform_searches(search_plan)
-            yield "Searches complete, writing report..."
-            report = await self.write_report(query, search_results)
-            yield "Report written, sending email..."
-            await self.send_email(report)
-            yield "Email sent, research complete"
-            yield report.markdown_report
-        
+            try:
+                print(f"View trace: https://platform.openai.com/traces/trace?trace_id={trace_id}")
+                yield f"View trace: https://platform.openai.com/traces/trace?trace_id={trace_id}"
+                print("Starting research...")
+                start = time.perf_counter()
+                if self.pipeline:
+                    yield "Planning searches, starting each one as soon as it is planned..."
+                    search_results = await self.plan_and_search(query)
+                else:
+                    search_plan = await self.plan_searches(query)
+                    yield "Searches planned, starting to search..."
+                    search_results = await self.perform_searches(search_plan)
+                self.timings["searches_complete"] = time.perf_counter() - start
+                stats = self.cache.report()
+                failed = sum(timing.outcome != "completed" for timing in self.executor.timings)
+                yield f"Searches complete, {stats['hit_rate']:.0%} reused from earlier searches, {failed} failed, writing report..."
+                if self.stream:
+                    # The report stays on screen while the email is sent
+                    async for markdown in self.write_report_streamed(query, search_results):
+                        yield markdown
+                    report = self.report
+                    await self.send_email(report)
+                    # Each update replaces the last, so the status goes under the report rather than in its place
+                    yield f"{report.markdown_report}\n\n*Email sent, research complete*"
+                else:
+                    report = await self.write_report(query, search_results)
+                    yield "Report written, sending email..."
+                    await self.send_email(report)
+                    yield "Email sent, research complete"
+                    yield report.markdown_report
+            finally:
+                # Searches other runs are waiting on keep the cache open until they finish
+                self.cache.close()
 
     async def plan_searches(self, query: str) -> WebSearchPlan:
         """ Plan the searches to perform for the query """
@@ -35,44 +81,121 @@ class ResearchManager:
         print(f"Will perform {len(result.final_output.searches)} searches")
         return result.final_output_as(WebSearchPlan)
 
+    async def plan_searches_streamed(self, query: str):
+        """ Plan the searches to perform for the query, yielding each one as soon as the planner has written it """
+        print("Planning searches...")
+        result = Runner.run_streamed(
+            planner_agent,
+            f"Query: {query}",
+        )
+        searches = StreamedArrayItems("searches")
+        async for event in result.stream_events():
+            if event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
+                for item in searches.feed(event.data.delta):
+                    yield WebSearchItem(**item)
+
+    async def plan_and_search(self, query: str) -> list[str]:
+        """ Plan the searches and perform them as a pipeline, each search starting as soon as it is planned """
+        tasks = []
+        async for item in self.plan_searches_streamed(query):
+            print(f"Searching for {item.query}")
+            tasks.append(asyncio.create_task(self.search(item)))
+        print(f"Planned {len(tasks)} searches")
+        return await self.collect_searches(tasks)
+
     async def perform_searches(self, search_plan: WebSearchPlan) -> list[str]:
         """ Perform the searches to perform for the query """
         print("Searching...")
-        num_completed = 0
+        # All the queries are embedded in one request, before any of them is looked up in the cache
+        await self.cache.embed([item.query for item in search_plan.searches])
         tasks = [asyncio.create_task(self.search(item)) for item in search_plan.searches]
+        return await self.collect_searches(tasks)
+
+    async def collect_searches(self, tasks: list[asyncio.Task]) -> list[str]:
+        """ Wait for a quorum of the searches, then for the stragglers until the deadline, cancelling any still running """
+        quorum = math.ceil(len(tasks) * SEARCH_QUORUM)
         results = []
-        for task in asyncio.as_completed(tasks):
-            result = await task
-            if result is not None:
-                results.append(result)
-            num_completed += 1
-            print(f"Searching... {num_completed}/{len(tasks)} completed")
-        print("Finished searching")
+        num_completed = 0
+        deadline = None
+        pending = set(tasks)
+        while pending:
+            timeout = None if deadline is None else max(0.0, deadline - time.perf_counter())
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for task in done:
+                result = task.result()
+                # Near-duplicate searches share a summary, which the writer only needs once
+                if result is not None and result not in results:
+                    results.append(result)
+                num_completed += 1
+                print(f"Searching... {num_completed}/{len(tasks)} completed")
+            if deadline is None and num_completed >= quorum:
+                deadline = time.perf_counter() + STRAGGLER_SECONDS
+        for task in pending:
+            task.cancel()
+        if pending:
+            print(f"Cut off {len(pending)} searches that were still running {STRAGGLER_SECONDS}s after the quorum")
+        stats = self.cache.report()
+        print(f"Finished searching: {stats['hit_rate']:.0%} of searches reused, saving about ${stats['saved_dollars']:.2f}")
+        print(f"Search timings: {self.executor.summary()}")
         return results
 
     async def search(self, item: WebSearchItem) -> str | None:
-        """ Perform a search for the query """
+        """ Perform a search for the query, unless the cache has it or a near-duplicate of it """
+        return await self.cache.get_or_search(item.query, lambda: self.run_search(item))
+
+    async def run_search(self, item: WebSearchItem) -> str | None:
+        """ Run the search agent for the query through the executor, which bounds, times out, retries and hedges it """
         input = f"Search term: {item.query}\nReason for searching: {item.reason}"
-        try:
+
+        async def attempt() -> str:
             result = await Runner.run(
                 search_agent,
                 input,
             )
             return str(result.final_output)
-        except Exception:
-            return None
+
+        return await self.executor.run(item.query, attempt)
 
     async def write_report(self, query: str, search_results: list[str]) -> ReportData:
         """ Write the report for the query """
         print("Thinking about report...")
+        start = time.perf_counter()
         input = f"Original query: {query}\nSummarized search results: {search_results}"
         result = await Runner.run(
             writer_agent,
             input,
         )
+        # Nothing can be shown until the whole report is back
+        self.timings["report_first_token"] = self.timings["report_complete"] = time.perf_counter() - start
+        print(f"Finished writing report in {self.timings['report_complete']:.1f}s")
+        self.report = result.final_output_as(ReportData)
+        return self.report
 
-        print("Finished writing report")
-        return result.final_output_as(ReportData)
+    async def write_report_streamed(self, query: str, search_results: list[str]):
+        """ Write the report for the query, yielding the markdown written so far as it streams in """
+        print("Thinking about report...")
+        start = time.perf_counter()
+        input = f"Original query: {query}\nSummarized search results: {search_results}"
+        result = Runner.run_streamed(
+            writer_agent,
+            input,
+        )
+        markdown = StreamedStringField("markdown_report")
+        last_yield = 0.0
+        async for event in result.stream_events():
+            if event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
+                if markdown.feed(event.data.delta) and "report_first_token" not in self.timings:
+                    self.timings["report_first_token"] = time.perf_counter() - start
+                    print(f"First report text after {self.timings['report_first_token']:.1f}s")
+                if markdown.value and time.perf_counter() - last_yield >= STREAM_INTERVAL_SECONDS:
+                    last_yield = time.perf_counter()
+                    yield markdown.value
+        self.timings["report_complete"] = time.perf_counter() - start
+        print(f"Finished writing report in {self.timings['report_complete']:.1f}s")
+        self.report = result.final_output_as(ReportData)
+        yield self.report.markdown_report
     
     async def send_email(self, report: ReportData) -> None:
         print("Writing email...")
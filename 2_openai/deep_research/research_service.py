@@ -0,0 +1,242 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from agents import trace, gen_trace_id
+from research_manager import ResearchManager
+from search_cache import SearchCache
+from search_executor import SearchExecutor, MAX_CONCURRENT_SEARCHES
+from writer_agent import ReportData
+
+JOBS_DB = os.getenv("RESEARCH_JOBS_DB", "research_jobs.db")
+# How many research jobs run at once across all users, and for any one user
+MAX_CONCURRENT_JOBS = int(os.getenv("RESEARCH_MAX_CONCURRENT_JOBS", "4"))
+MAX_JOBS_PER_USER = int(os.getenv("RESEARCH_MAX_JOBS_PER_USER", "1"))
+# A user can have at most this many jobs waiting; further submissions are refused until some have run
+MAX_QUEUED_PER_USER = int(os.getenv("RESEARCH_MAX_QUEUED_PER_USER", "5"))
+FINISHED = ("completed", "failed")
+
+
+def job_key(query: str) -> str:
+    """ The key identical queries share: only case and whitespace are ignored, as reordered words can ask another question """
+    return " ".join(query.lower().split())
+
+
+class ResearchService:
+    """
+    Runs deep research as jobs from a queue persisted in SQLite, shared by every user of the app.
+    Jobs are started oldest first, favouring users with the fewest jobs running, within per-user and overall quotas.
+    A query already queued or running is not run again: submitting it returns the existing job's id.
+    Each job checkpoints its search results, report and email, so after a restart it resumes from the last one.
+    Progress is published by job id, for any number of followers.
+    The database is only used from worker threads, one at a time, so a slow write never stalls the event loop.
+    """
+
+    def __init__(self, path: str = JOBS_DB, max_jobs: int = MAX_CONCURRENT_JOBS, max_per_user: int = MAX_JOBS_PER_USER):
+        self.max_jobs = max_jobs
+        self.max_per_user = max_per_user
+        # Every query after this one runs in a worker thread, holding the lock
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                user TEXT NOT NULL,
+                query TEXT NOT NULL,
+                key TEXT NOT NULL,
+                status TEXT NOT NULL,
+                progress TEXT NOT NULL,
+                results TEXT,
+                report TEXT,
+                emailed INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created REAL NOT NULL,
+                finished REAL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created)")
+        self._running: dict[str, asyncio.Task] = {}
+        self._progress: dict[str, str] = {}
+        self._versions: dict[str, int] = {}
+        self._changed: asyncio.Condition | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._scheduler: asyncio.Task | None = None
+        # Searches are capped across all the jobs, and a search in flight for one job is reused by the others
+        self._search_slots = asyncio.Semaphore(MAX_CONCURRENT_SEARCHES)
+        self._searches_in_flight: dict = {}
+
+    def start(self) -> None:
+        """ Start scheduling on the running event loop; the scheduler first requeues the jobs a previous run left unfinished """
+        if self._scheduler is not None:
+            return
+        self._changed = asyncio.Condition()
+        self._wakeup = asyncio.Event()
+        self._scheduler = asyncio.create_task(self._schedule())
+
+    async def _db(self, fn, *args):
+        """ Run fn(*args) in a worker thread, holding the lock, so the connection is used by one thread at a time """
+        def locked():
+            with self._lock:
+                return fn(*args)
+        return await asyncio.to_thread(locked)
+
+    def _query(self, sql: str, params: tuple = ()) -> list[sqlite3.Row]:
+        return self._conn.execute(sql, params).fetchall()
+
+    def _update(self, sql: str, params: tuple = ()) -> int:
+        with self._conn:
+            return self._conn.execute(sql, params).rowcount
+
+    async def job(self, job_id: str) -> dict | None:
+        rows = await self._db(self._query, "SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return dict(rows[0]) if rows else None
+
+    async def submit(self, user: str, query: str) -> str:
+        """ Queue research on the query for the user, returning the job id, or the id of an identical job in flight """
+        job_id = await self._db(self._submit, user, query)
+        self.start()
+        self._wakeup.set()
+        return job_id
+
+    def _submit(self, user: str, query: str) -> str:
+        key = job_key(query)
+        existing = self._conn.execute(
+            "SELECT id FROM jobs WHERE key = ? AND status NOT IN (?, ?) ORDER BY created LIMIT 1", (key, *FINISHED)
+        ).fetchone()
+        if existing:
+            print(f"Coalescing {user}'s research on {query} into job {existing['id']}")
+            return existing["id"]
+        queued = self._conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE user = ? AND status = 'queued'", (user,)
+        ).fetchone()[0]
+        if queued >= MAX_QUEUED_PER_USER:
+            raise ValueError(f"{user} already has {queued} research jobs waiting; try again once they have started")
+        job_id = uuid.uuid4().hex[:12]
+        with self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, user, query, key, status, progress, created) VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+                (job_id, user, query, key, "Queued...", time.time()),
+            )
+        return job_id
+
+    async def follow(self, job_id: str):
+        """ Yield the job's progress as it changes, ending with its report, or why it failed """
+        self.start()
+        seen = -1
+        while True:
+            job = await self.job(job_id)
+            if job is None:
+                yield f"There is no research job {job_id}"
+                return
+            if job["status"] == "completed":
+                yield ReportData.model_validate_json(job["report"]).markdown_report
+                return
+            if job["status"] == "failed":
+                yield f"Research failed: {job['error']}"
+                return
+            async with self._changed:
+                if self._versions.get(job_id, 0) == seen:
+                    await self._changed.wait_for(lambda: self._versions.get(job_id, 0) != seen)
+                seen = self._versions.get(job_id, 0)
+                progress = self._progress.get(job_id, job["progress"])
+            yield progress
+
+    async def _publish(self, job_id: str, progress: str, persist: bool = True) -> None:
+        """ Pass progress on to the job's followers; status messages are also stored, the streamed report isn't """
+        if persist:
+            await self._db(self._update, "UPDATE jobs SET progress = ? WHERE id = ?", (progress, job_id))
+        async with self._changed:
+            self._progress[job_id] = progress
+            self._versions[job_id] = self._versions.get(job_id, 0) + 1
+            self._changed.notify_all()
+
+    def _claim_jobs(self, running: list[str]) -> list[str]:
+        """
+        Mark the queued jobs to start now as running and return them:
+        oldest first, favouring users with fewer jobs running, within the quotas
+        """
+        running_per_user = {}
+        for row in self._conn.execute(f"SELECT user FROM jobs WHERE id IN ({','.join('?' * len(running))})", running):
+            running_per_user[row["user"]] = running_per_user.get(row["user"], 0) + 1
+        queued = self._conn.execute("SELECT id, user FROM jobs WHERE status = 'queued' ORDER BY created").fetchall()
+        selected = []
+        for row in sorted(queued, key=lambda row: running_per_user.get(row["user"], 0)):
+            if len(running) + len(selected) >= self.max_jobs:
+                break
+            if running_per_user.get(row["user"], 0) < self.max_per_user:
+                running_per_user[row["user"]] = running_per_user.get(row["user"], 0) + 1
+                selected.append(row["id"])
+        with self._conn:
+            self._conn.executemany("UPDATE jobs SET status = 'running' WHERE id = ?", [(job_id,) for job_id in selected])
+        return selected
+
+    async def _schedule(self) -> None:
+        resumed = await self._db(
+            self._update,
+            "UPDATE jobs SET status = 'queued', progress = 'Resuming after a restart...' WHERE status = 'running'",
+        )
+        if resumed:
+            print(f"Resuming {resumed} research jobs")
+        while True:
+            for job_id in await self._db(self._claim_jobs, list(self._running)):
+                self._running[job_id] = asyncio.create_task(self._run_job(job_id))
+            await self._wakeup.wait()
+            self._wakeup.clear()
+
+    async def _run_job(self, job_id: str) -> None:
+        try:
+            await self._research(job_id)
+        except Exception as e:
+            if asyncio.current_task().cancelling():
+                # Shutting down: a cancelled agent run can surface as some other error, and the job is left to resume
+                raise asyncio.CancelledError from e
+            print(f"Research job {job_id} failed: {e}")
+            await self._db(
+                self._update,
+                "UPDATE jobs SET status = 'failed', error = ?, finished = ? WHERE id = ?", (str(e), time.time(), job_id),
+            )
+            await self._publish(job_id, f"Research failed: {e}")
+        finally:
+            del self._running[job_id]
+            self._wakeup.set()
+
+    async def _research(self, job_id: str) -> None:
+        """ Run the job's remaining stages, checkpointing after each one """
+        job = await self.job(job_id)
+        query = job["query"]
+        manager = ResearchManager(
+            cache=SearchCache(in_flight=self._searches_in_flight),
+            executor=SearchExecutor(semaphore=self._search_slots),
+        )
+        trace_id = gen_trace_id()
+        try:
+            with trace("Research trace", trace_id=trace_id):
+                print(f"Research job {job_id}: https://platform.openai.com/traces/trace?trace_id={trace_id}")
+                if job["results"] is None:
+                    await self._publish(job_id, "Planning searches, starting each one as soon as it is planned...")
+                    # Searches finished before a restart are in the search cache, so they aren't run again
+                    search_results = await manager.plan_and_search(query)
+                    await self._db(self._update, "UPDATE jobs SET results = ? WHERE id = ?", (json.dumps(search_results), job_id))
+                else:
+                    search_results = json.loads(job["results"])
+                if job["report"] is None:
+                    await self._publish(job_id, "Searches complete, writing report...")
+                    async for markdown in manager.write_report_streamed(query, search_results):
+                        await self._publish(job_id, markdown, persist=False)
+                    report = manager.report
+                    await self._db(self._update, "UPDATE jobs SET report = ? WHERE id = ?", (report.model_dump_json(), job_id))
+                else:
+                    report = ReportData.model_validate_json(job["report"])
+                if not job["emailed"]:
+                    # The report stays on screen while the email is sent
+                    await manager.send_email(report)
+        finally:
+            manager.cache.close()
+        await self._db(
+            self._update, "UPDATE jobs SET emailed = 1, status = 'completed', finished = ? WHERE id = ?", (time.time(), job_id)
+        )
+        await self._publish(job_id, report.markdown_report, persist=False)
@@ -0,0 +1,227 @@
+import asyncio
+import os
+import re
+import sqlite3
+import time
+from typing import Awaitable, Callable
+import numpy as np
+from openai import AsyncOpenAI, OpenAIError
+
+CACHE_DB = os.getenv("SEARCH_CACHE_DB", "search_cache.db")
+# Cached summaries are reused for this long, after which the search is run again
+CACHE_TTL_SECONDS = float(os.getenv("SEARCH_CACHE_TTL_HOURS", "24")) * 3600
+# Searches whose query embeddings are at least this similar are treated as the same search
+SIMILARITY_THRESHOLD = float(os.getenv("SEARCH_SIMILARITY_THRESHOLD", "0.92"))
+EMBEDDING_MODEL = "text-embedding-3-small"
+# Roughly what one search costs: the WebSearchTool call plus the search agent's tokens
+SEARCH_COST_DOLLARS = float(os.getenv("SEARCH_COST_DOLLARS", "0.03"))
+
+
+def normalize(query: str) -> str:
+    """ The cache key for a query: lower case words without punctuation, in sorted order """
+    return " ".join(sorted(set(re.findall(r"\w+", query.lower()))))
+
+
+class InFlightSearch:
+    """
+    A search shared by every run waiting on it. It runs in its own task, so one run giving up on it,
+    e.g. at its quorum cut-off, doesn't cut it short for the others; it is only cancelled once nobody is waiting.
+    """
+
+    def __init__(self, embedding: np.ndarray | None, search: Awaitable[str | None]):
+        self.embedding = embedding
+        self.task = asyncio.ensure_future(search)
+        self.waiters = 0
+
+    async def wait(self) -> str | None:
+        self.waiters += 1
+        try:
+            return await asyncio.shield(self.task)
+        finally:
+            self.waiters -= 1
+            if not self.waiters:
+                self.task.cancel()
+
+
+class SearchCache:
+    """
+    A persistent cache of search summaries, shared across runs in a SQLite file.
+    A search is reused if an earlier one has the same normalized query, or a query whose embedding is similar enough,
+    including searches still in flight in this run. Each instance counts its own hits, so it is made per run;
+    runs that pass the same in_flight dict also share the searches each other has in flight.
+    Call close once the run is over.
+    """
+
+    def __init__(
+        self,
+        path: str = CACHE_DB,
+        ttl: float = CACHE_TTL_SECONDS,
+        threshold: float = SIMILARITY_THRESHOLD,
+        in_flight: dict | None = None,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.threshold = threshold
+        self.stats = {"searches": 0, "exact_hits": 0, "similar_hits": 0, "coalesced": 0, "misses": 0}
+        self._client: AsyncOpenAI | None = None
+        self._embedding_failed = False
+        self._embedding: dict[str, asyncio.Future] = {}
+        self._batch: list[str] = []
+        self._embedder: asyncio.Task | None = None
+        self._embeddings: dict[str, np.ndarray | None] = {}
+        self._keys: list[str] = []
+        self._summaries: dict[str, str] = {}
+        self._matrix = np.empty((0, 0), dtype=np.float32)
+        self._in_flight: dict[str, InFlightSearch] = {} if in_flight is None else in_flight
+        self._searching = 0
+        self._closed = False
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS searches (
+                key TEXT PRIMARY KEY,
+                query TEXT NOT NULL,
+                summary TEXT NOT NULL,
+                embedding BLOB,
+                created REAL NOT NULL
+            )
+        """)
+        self._load()
+
+    def _load(self) -> None:
+        with self._conn:
+            self._conn.execute("DELETE FROM searches WHERE created < ?", (time.time() - self.ttl,))
+        rows = self._conn.execute("SELECT key, summary, embedding FROM searches").fetchall()
+        self._summaries = {key: summary for key, summary, _ in rows}
+        embedded = [(key, np.frombuffer(embedding, dtype=np.float32)) for key, _, embedding in rows if embedding]
+        self._keys = [key for key, _ in embedded]
+        if embedded:
+            self._matrix = np.vstack([embedding for _, embedding in embedded])
+
+    async def embed(self, queries: list[str]) -> None:
+        """
+        Embed the queries that haven't been yet, skipping those with an exact match; a query that can't be embedded
+        is only matched exactly. Queries passed while a request is out, e.g. as the planner streams them in,
+        wait to go together in the next request rather than each making its own
+        """
+        loop = asyncio.get_running_loop()
+        waiting = []
+        for query in dict.fromkeys(queries):
+            if query in self._embeddings or normalize(query) in self._summaries:
+                continue
+            if query not in self._embedding:
+                self._embedding[query] = loop.create_future()
+                self._batch.append(query)
+            waiting.append(self._embedding[query])
+        if self._batch and self._embedder is None:
+            self._embedder = asyncio.create_task(self._embed_batches())
+        if waiting:
+            await asyncio.gather(*(asyncio.shield(future) for future in waiting))
+
+    async def _embed_batches(self) -> None:
+        try:
+            while self._batch:
+                batch, self._batch = self._batch, []
+                await self._embed_batch(batch)
+        finally:
+            self._embedder = None
+
+    async def _embed_batch(self, batch: list[str]) -> None:
+        try:
+            if not self._embedding_failed:
+                self._client = self._client or AsyncOpenAI()
+                response = await self._client.embeddings.create(model=EMBEDDING_MODEL, input=batch)
+                for query, item in zip(batch, response.data):
+                    vector = np.asarray(item.embedding, dtype=np.float32)
+                    self._embeddings[query] = vector / np.linalg.norm(vector)
+        except OpenAIError as e:
+            print(f"Could not embed the search queries, only matching them exactly: {e}")
+            # Not retried for the rest of the run, which would only repeat the failure for every query
+            self._embedding_failed = True
+        finally:
+            for query in batch:
+                self._embeddings.setdefault(query, None)
+                self._embedding.pop(query).set_result(None)
+
+    def _similar(self, embedding: np.ndarray | None) -> str | None:
+        if embedding is None or not self._keys:
+            return None
+        similarities = self._matrix @ embedding
+        best = int(np.argmax(similarities))
+        return self._keys[best] if similarities[best] >= self.threshold else None
+
+    def _similar_in_flight(self, key: str, embedding: np.ndarray | None) -> InFlightSearch | None:
+        if key in self._in_flight:
+            return self._in_flight[key]
+        for search in self._in_flight.values():
+            if embedding is not None and search.embedding is not None and float(search.embedding @ embedding) >= self.threshold:
+                return search
+        return None
+
+    async def get_or_search(self, query: str, search: Callable[[], Awaitable[str | None]]) -> str | None:
+        """ Return the cached summary for the query or a near-duplicate of it, otherwise run the search and cache its result """
+        key = normalize(query)
+        self.stats["searches"] += 1
+        if key in self._summaries:
+            self.stats["exact_hits"] += 1
+            return self._summaries[key]
+        if key in self._in_flight:
+            self.stats["coalesced"] += 1
+            return await self._in_flight[key].wait()
+        # Only a query without an exact match is embedded, to look for similar ones
+        await self.embed([query])
+        embedding = self._embeddings.get(query)
+        similar = self._similar(embedding)
+        if similar:
+            self.stats["similar_hits"] += 1
+            return self._summaries[similar]
+        in_flight = self._similar_in_flight(key, embedding)
+        if in_flight:
+            self.stats["coalesced"] += 1
+            return await in_flight.wait()
+        self.stats["misses"] += 1
+        in_flight = InFlightSearch(embedding, self._search_and_put(key, query, embedding, search))
+        self._in_flight[key] = in_flight
+        # Removed however the task ends, including when it is cancelled before it has started
+        in_flight.task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await in_flight.wait()
+
+    async def _search_and_put(
+        self, key: str, query: str, embedding: np.ndarray | None, search: Callable[[], Awaitable[str | None]]
+    ) -> str | None:
+        self._searching += 1
+        try:
+            summary = await search()
+            if summary:
+                self._put(key, query, summary, embedding)
+            return summary
+        finally:
+            self._searching -= 1
+            if self._closed and not self._searching:
+                self._conn.close()
+
+    def _put(self, key: str, query: str, summary: str, embedding: np.ndarray | None) -> None:
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO searches (key, query, summary, embedding, created) VALUES (?, ?, ?, ?, ?)",
+                (key, query, summary, embedding.tobytes() if embedding is not None else None, time.time()),
+            )
+        self._summaries[key] = summary
+        if embedding is not None:
+            self._keys.append(key)
+            self._matrix = np.vstack([self._matrix, embedding]) if self._matrix.size else embedding[np.newaxis, :]
+
+    def close(self) -> None:
+        """ Close the database now, or once the searches started here are done, as other runs may be waiting on them """
+        self._closed = True
+        if not self._searching:
+            self._conn.close()
+
+    def report(self) -> dict:
+        """ The run's hit counts, hit rate and roughly what the hits saved """
+        hits = self.stats["exact_hits"] + self.stats["similar_hits"] + self.stats["coalesced"]
+        searches = self.stats["searches"]
+        return {
+            **self.stats,
+            "hit_rate": hits / searches if searches else 0.0,
+            "saved_dollars": hits * SEARCH_COST_DOLLARS,
+        }
@@ -0,0 +1,152 @@
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable
+from pydantic import BaseModel
+from openai import RateLimitError
+
+# At most this many searches run at once; the rest wait their turn, so a large plan doesn't trip the provider's limits
+MAX_CONCURRENT_SEARCHES = 8
+# An attempt that runs for longer than this, not counting the time waiting for a slot, is abandoned and retried
+SEARCH_TIMEOUT_SECONDS = 60
+MAX_ATTEMPTS = 3
+BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 30.0
+# A search still running after this long, or after the slowest 10% of searches so far once there are enough of them,
+# gets a duplicate request if there is a free slot; whichever answers first is used
+HEDGE_AFTER_SECONDS = 20.0
+HEDGE_PERCENTILE = 0.9
+HEDGE_MIN_SAMPLES = 10
+
+
+class SearchTiming(BaseModel):
+    label: str
+    outcome: str = "running"
+    attempts: int = 0
+    hedged: bool = False
+    queued_seconds: float = 0.0
+    seconds: float = 0.0
+    error: str | None = None
+
+
+class SearchExecutor:
+    """
+    Runs searches with a cap on how many are in flight, a timeout per attempt, retries with jittered backoff
+    on rate limits and timeouts, and a hedged duplicate request for searches in the slow tail.
+    Every search gets a SearchTiming, so failures are counted rather than silently dropped.
+    Executors that are given the same semaphore share one cap between them.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = MAX_CONCURRENT_SEARCHES,
+        timeout: float = SEARCH_TIMEOUT_SECONDS,
+        max_attempts: int = MAX_ATTEMPTS,
+        hedge_after: float | None = HEDGE_AFTER_SECONDS,
+        semaphore: asyncio.Semaphore | None = None,
+    ):
+        self.semaphore = semaphore or asyncio.Semaphore(max_concurrent)
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.hedge_after = hedge_after
+        self.timings: list[SearchTiming] = []
+        self._durations: list[float] = []
+
+    def hedge_delay(self) -> float | None:
+        """ How long an attempt may run before it is hedged, or None if hedging is off """
+        if self.hedge_after is None:
+            return None
+        if len(self._durations) < HEDGE_MIN_SAMPLES:
+            return self.hedge_after
+        durations = sorted(self._durations)
+        return min(self.hedge_after, durations[int(HEDGE_PERCENTILE * (len(durations) - 1))])
+
+    @staticmethod
+    def backoff(attempt: int, error: Exception | None = None) -> float:
+        delay = random.uniform(0, min(MAX_BACKOFF_SECONDS, BACKOFF_SECONDS * 2**attempt))
+        try:
+            retry_after = float(error.response.headers.get("retry-after", 0))
+        except (AttributeError, ValueError):
+            retry_after = 0.0
+        return max(delay, retry_after)
+
+    async def _attempt(self, search: Callable[[], Awaitable[str]], timing: SearchTiming, started: asyncio.Event) -> str:
+        queued = time.perf_counter()
+        async with self.semaphore:
+            timing.queued_seconds += time.perf_counter() - queued
+            started.set()
+            start = time.perf_counter()
+            result = await asyncio.wait_for(search(), self.timeout)
+            self._durations.append(time.perf_counter() - start)
+            return result
+
+    async def _hedged(self, search: Callable[[], Awaitable[str]], timing: SearchTiming) -> str:
+        started = asyncio.Event()
+        tasks = {asyncio.create_task(self._attempt(search, timing, started))}
+        try:
+            delay = self.hedge_delay()
+            if delay is not None:
+                # Only the time spent running counts towards hedging, not the time waiting for a slot
+                await started.wait()
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and not self.semaphore.locked():
+                    timing.hedged = True
+                    tasks.add(asyncio.create_task(self._attempt(search, timing, asyncio.Event())))
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def run(self, label: str, search: Callable[[], Awaitable[str]]) -> str | None:
+        """ Run the search, returning its result, or None once it has failed or run out of attempts """
+        timing = SearchTiming(label=label)
+        self.timings.append(timing)
+        start = time.perf_counter()
+        try:
+            for attempt in range(self.max_attempts):
+                timing.attempts = attempt + 1
+                try:
+                    result = await self._hedged(search, timing)
+                    timing.outcome = "completed"
+                    return result
+                except asyncio.TimeoutError as e:
+                    timing.outcome, error = "timed_out", e
+                except RateLimitError as e:
+                    timing.outcome, error = "rate_limited", e
+                except Exception as e:
+                    timing.outcome, timing.error = "failed", str(e)
+                    print(f"Search for {label} failed: {e}")
+                    return None
+                if attempt + 1 < self.max_attempts:
+                    await asyncio.sleep(self.backoff(attempt, error))
+            timing.error = f"{timing.outcome} after {timing.attempts} attempts"
+            print(f"Search for {label} gave up: {timing.error}")
+            return None
+        except asyncio.CancelledError:
+            timing.outcome = "cancelled"
+            raise
+        finally:
+            timing.seconds = time.perf_counter() - start
+
+    def summary(self) -> dict:
+        """ How the searches went: counts by outcome, retries and hedges, and the spread of their durations """
+        outcomes = {}
+        for timing in self.timings:
+            outcomes[timing.outcome] = outcomes.get(timing.outcome, 0) + 1
+        seconds = sorted(timing.seconds for timing in self.timings)
+        return {
+            "searches": len(self.timings),
+            **outcomes,
+            "retries": sum(max(0, timing.attempts - 1) for timing in self.timings),
+            "hedged": sum(timing.hedged for timing in self.timings),
+            "p50_seconds": seconds[len(seconds) // 2] if seconds else None,
+            "p95_seconds": seconds[int(0.95 * (len(seconds) - 1))] if seconds else None,
+            "max_queued_seconds": max((timing.queued_seconds for timing in self.timings), default=0.0),
+        }
@@ -0,0 +1,103 @@
+import json
+import re
+
+
+class StreamedStringField:
+    """ Decode one string field of a JSON object while the object is still streaming in, a few characters at a time """
+
+    def __init__(self, field: str):
+        self.pattern = re.compile(rf'"{re.escape(field)}"\s*:\s*"')
+        self.buffer = ""
+        self.position = None
+        self.value = ""
+        self.done = False
+
+    def feed(self, delta: str) -> str:
+        """ Add the next piece of the JSON, returning the newly decoded text of the field """
+        self.buffer += delta
+        if self.position is None:
+            match = self.pattern.search(self.buffer)
+            if not match:
+                return ""
+            self.position = match.end()
+        decoded = []
+        buffer, position = self.buffer, self.position
+        while position < len(buffer) and not self.done:
+            char = buffer[position]
+            if char == '"':
+                self.done = True
+            elif char == "\\":
+                # An escape sequence split across deltas is decoded once the rest of it arrives
+                length = self._escape_length(buffer, position)
+                if position + length > len(buffer):
+                    break
+                decoded.append(json.loads(f'"{buffer[position:position + length]}"'))
+                position += length
+            else:
+                decoded.append(char)
+                position += 1
+        self.position = position
+        text = "".join(decoded)
+        self.value += text
+        return text
+
+    @staticmethod
+    def _escape_length(buffer: str, position: int) -> int:
+        if buffer[position + 1 : position + 2] != "u":
+            return 2
+        # A high surrogate is only decodable together with the low surrogate that follows it
+        code = buffer[position + 2 : position + 6]
+        if len(code) == 4 and 0xD800 <= int(code, 16) < 0xDC00:
+            return 12
+        return 6
+
+
+class StreamedArrayItems:
+    """ Pick out the objects in one array field of a JSON object as each of them is completed, while the object streams in """
+
+    def __init__(self, field: str):
+        self.pattern = re.compile(rf'"{re.escape(field)}"\s*:\s*\[')
+        self.buffer = ""
+        self.position = None
+        self.start = None
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.done = False
+
+    def feed(self, delta: str) -> list:
+        """ Add the next piece of the JSON, returning the array items completed by it """
+        self.buffer += delta
+        if self.position is None:
+            match = self.pattern.search(self.buffer)
+            if not match:
+                return []
+            self.position = match.end()
+        items = []
+        buffer = self.buffer
+        for position in range(self.position, len(buffer)):
+            if self.done:
+                break
+            char = buffer[position]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                if self.depth == 0:
+                    self.start = position
+                self.depth += 1
+            elif char in "}]":
+                if self.depth == 0:
+                    self.done = True
+                    continue
+                self.depth -= 1
+                if self.depth == 0:
+                    items.append(json.loads(buffer[self.start : position + 1]))
+        self.position = len(buffer)
+        return items
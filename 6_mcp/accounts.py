@@ -1,14 +1,36 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 import json
+import random
+import time
 from dotenv import load_dotenv
 from datetime import datetime
-from market import get_share_price
-from database import write_account, read_account, write_log
+from market import get_share_price, get_share_prices
+from database import (
+    ConcurrentUpdateError,
+    apply_transaction,
+    create_account,
+    write_account,
+    read_account,
+    write_log,
+    write_trade,
+    read_transactions,
+    read_recent_transactions,
+    write_portfolio_value,
+    read_portfolio_values,
+    read_first_portfolio_value_time,
+    PORTFOLIO_RAW_RETENTION,
+    PORTFOLIO_HOURLY_RETENTION,
+    TIMESTAMP_FORMAT,
+)
 
 load_dotenv(override=True)
 
 INITIAL_BALANCE = 10_000.0
 SPREAD = 0.002
+MAX_CONFLICT_RETRIES = 20
+# The account summary sent to the traders includes only their most recent transactions, with the rationale shortened
+SUMMARY_TRANSACTIONS = 10
+SUMMARY_RATIONALE_CHARS = 200
 
 
 class Transaction(BaseModel):
@@ -30,54 +52,135 @@ class Account(BaseModel):
     balance: float
     strategy: str
     holdings: dict[str, int]
-    transactions: list[Transaction]
-    portfolio_value_time_series: list[tuple[str, float]]
+    net_invested: float = 0.0
+    realized_pnl: float = 0.0
+    cost_basis: dict[str, float] = {}
+    version: int = 0
+    _transactions: list[Transaction] | None = PrivateAttr(default=None)
+    _portfolio_value_time_series: list[tuple[str, float]] | None = PrivateAttr(default=None)
 
     @classmethod
     def get(cls, name: str):
+        """ Load the account; transactions and the portfolio value history are read on first access. """
         fields = read_account(name.lower())
         if not fields:
-            fields = {
-                "name": name.lower(),
-                "balance": INITIAL_BALANCE,
-                "strategy": "",
-                "holdings": {},
-                "transactions": [],
-                "portfolio_value_time_series": []
-            }
-            write_account(name, fields)
+            create_account(name, {"balance": INITIAL_BALANCE, "strategy": ""})
+            fields = read_account(name.lower())
         return cls(**fields)
-    
-    
+
+    def reload(self):
+        """ Refresh the account from the database, discarding any unsaved changes. """
+        for field, value in read_account(self.name).items():
+            setattr(self, field, value)
+        self._transactions = None
+        self._portfolio_value_time_series = None
+
+    def retry_on_conflict(self, change, *args):
+        """
+        Apply change(*args), which must save the account. If another writer updated the account first,
+        reload it and apply the change again to the fresh state. If the change fails any other way it is not retried,
+        but the account is still reloaded, so it never shows a change that wasn't saved.
+        """
+        for attempt in range(MAX_CONFLICT_RETRIES):
+            try:
+                return change(*args)
+            except ConcurrentUpdateError:
+                self.reload()
+                time.sleep(random.uniform(0, min(0.001 * 2**attempt, 0.1)))
+            except Exception:
+                self.reload()
+                raise
+        raise ConcurrentUpdateError(f"Gave up updating account {self.name} after {MAX_CONFLICT_RETRIES} conflicts")
+
+    @property
+    def transactions(self) -> list[Transaction]:
+        if self._transactions is None:
+            self._transactions = [Transaction(**row) for row in read_transactions(self.name)]
+        return self._transactions
+
+    @property
+    def portfolio_value_time_series(self) -> list[tuple[str, float]]:
+        if self._portfolio_value_time_series is None:
+            self._portfolio_value_time_series = read_portfolio_values(self.name)
+        return self._portfolio_value_time_series
+
+    def get_portfolio_value_series(self, since: datetime | None = None) -> list[tuple[str, float]]:
+        """ Return the portfolio values since the given time, at a resolution suited to charting that span. """
+        start = since.strftime(TIMESTAMP_FORMAT) if since else read_first_portfolio_value_time(self.name)
+        if not start:
+            return []
+        span = datetime.now() - datetime.strptime(start, TIMESTAMP_FORMAT)
+        if span <= PORTFOLIO_RAW_RETENTION:
+            resolution = "raw"
+        elif span <= PORTFOLIO_HOURLY_RETENTION:
+            resolution = "hourly"
+        else:
+            resolution = "daily"
+        return read_portfolio_values(self.name, start, resolution)
+
     def save(self):
+        """ Save the balance, strategy and holdings if nobody else has changed them since they were read. """
         write_account(self.name.lower(), self.model_dump())
+        self.version += 1
 
     def reset(self, strategy: str):
+        self.retry_on_conflict(self._reset, strategy)
+
+    def _reset(self, strategy: str):
         self.balance = INITIAL_BALANCE
         self.strategy = strategy
         self.holdings = {}
-        self.transactions = []
-        self.portfolio_value_time_series = []
-        self.save()
+        self.net_invested = 0.0
+        self.realized_pnl = 0.0
+        self.cost_basis = {}
+        self._transactions = []
+        self._portfolio_value_time_series = []
+        write_account(self.name.lower(), {**self.model_dump(), "transactions": [], "portfolio_value_time_series": []})
+        self.version += 1
+
+    def record_trade(self, transaction: Transaction):
+        """ Apply the transaction to the holdings and running aggregates, then persist it with the new balance. """
+        symbol = transaction.symbol
+        # Shares that are completely sold are removed from the holdings
+        invested, realized = apply_transaction(
+            self.holdings, self.cost_basis, symbol, transaction.quantity, transaction.price
+        )
+        self.net_invested += invested
+        self.realized_pnl += realized
+        if self._transactions is not None:
+            self._transactions.append(transaction)
+        write_trade(self.name, self.model_dump(), symbol, transaction.model_dump())
+        self.version += 1
 
     def deposit(self, amount: float):
         """ Deposit funds into the account. """
+        self.retry_on_conflict(self._deposit, amount)
+        print(f"Deposited ${amount}. New balance: ${self.balance}")
+
+    def _deposit(self, amount: float):
         if amount <= 0:
             raise ValueError("Deposit amount must be positive.")
         self.balance += amount
-        print(f"Deposited ${amount}. New balance: ${self.balance}")
         self.save()
 
     def withdraw(self, amount: float):
         """ Withdraw funds from the account, ensuring it doesn't go negative. """
+        self.retry_on_conflict(self._withdraw, amount)
+        print(f"Withdrew ${amount}. New balance: ${self.balance}")
+
+    def _withdraw(self, amount: float):
         if amount > self.balance:
             raise ValueError("Insufficient funds for withdrawal.")
         self.balance -= amount
-        print(f"Withdrew ${amount}. New balance: ${self.balance}")
         self.save()
 
     def buy_shares(self, symbol: str, quantity: int, rationale: str) -> str:
         """ Buy shares of a stock if sufficient funds are available. """
+        self.retry_on_conflict(self._buy_shares, symbol, quantity, rationale)
+        write_log(self.name, "account", f"Bought {quantity} of {symbol}")
+        return "Completed. Latest details:\n" + self.summary()
+
+    def _buy_shares(self, symbol: str, quantity: int, rationale: str):
         price = get_share_price(symbol)
         buy_price = price * (1 + SPREAD)
         total_cost = buy_price * quantity
@@ -87,21 +190,21 @@ class Account(BaseModel):
         elif price==0:
             raise ValueError(f"Unrecognized symbol {symbol}")
         
-        # Update holdings
-        self.holdings[symbol] = self.holdings.get(symbol, 0) + quantity
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         # Record transaction
         transaction = Transaction(symbol=symbol, quantity=quantity, price=buy_price, timestamp=timestamp, rationale=rationale)
-        self.transactions.append(transaction)
-        
+
         # Update balance
         self.balance -= total_cost
-        self.save()
-        write_log(self.name, "account", f"Bought {quantity} of {symbol}")
-        return "Completed. Latest details:\n" + self.report()
+        self.record_trade(transaction)
 
     def sell_shares(self, symbol: str, quantity: int, rationale: str) -> str:
         """ Sell shares of a stock if the user has enough shares. """
+        self.retry_on_conflict(self._sell_shares, symbol, quantity, rationale)
+        write_log(self.name, "account", f"Sold {quantity} of {symbol}")
+        return "Completed. Latest details:\n" + self.summary()
+
+    def _sell_shares(self, symbol: str, quantity: int, rationale: str):
         if self.holdings.get(symbol, 0) < quantity:
             raise ValueError(f"Cannot sell {quantity} shares of {symbol}. Not enough shares held.")
         
@@ -109,34 +212,22 @@ class Account(BaseModel):
         sell_price = price * (1 - SPREAD)
         total_proceeds = sell_price * quantity
         
-        # Update holdings
-        self.holdings[symbol] -= quantity
-        
-        # If shares are completely sold, remove from holdings
-        if self.holdings[symbol] == 0:
-            del self.holdings[symbol]
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         # Record transaction
         transaction = Transaction(symbol=symbol, quantity=-quantity, price=sell_price, timestamp=timestamp, rationale=rationale)  # negative quantity for sell
-        self.transactions.append(transaction)
 
         # Update balance
         self.balance += total_proceeds
-        self.save()
-        write_log(self.name, "account", f"Sold {quantity} of {symbol}")
-        return "Completed. Latest details:\n" + self.report()
+        self.record_trade(transaction)
 
     def calculate_portfolio_value(self):
         """ Calculate the total value of the user's portfolio. """
-        total_value = self.balance
-        for symbol, quantity in self.holdings.items():
-            total_value += get_share_price(symbol) * quantity
-        return total_value
+        prices = get_share_prices(self.holdings)
+        return self.balance + sum(prices[symbol] * quantity for symbol, quantity in self.holdings.items())
 
     def calculate_profit_loss(self, portfolio_value: float):
         """ Calculate profit or loss from the initial spend. """
-        initial_spend = sum(transaction.total() for transaction in self.transactions)
-        return portfolio_value - initial_spend - self.balance
+        return portfolio_value - self.net_invested - self.balance
 
     def get_holdings(self):
         """ Report the current holdings of the user. """
@@ -150,18 +241,64 @@ class Account(BaseModel):
         """ List all transactions made by the user. """
         return [transaction.model_dump() for transaction in self.transactions]
     
+    def record_portfolio_value(self, portfolio_value: float) -> None:
+        """ Append the portfolio value to its history, as of now. """
+        point = (datetime.now().strftime(TIMESTAMP_FORMAT), portfolio_value)
+        if self._portfolio_value_time_series is not None:
+            self._portfolio_value_time_series.append(point)
+        write_portfolio_value(self.name, *point)
+
     def report(self) -> str:
         """ Return a json string representing the account.  """
         portfolio_value = self.calculate_portfolio_value()
-        self.portfolio_value_time_series.append((datetime.now().strftime("%Y-%m-%d %H:%M:%S"), portfolio_value))
-        self.save()
+        self.record_portfolio_value(portfolio_value)
         pnl = self.calculate_profit_loss(portfolio_value)
         data = self.model_dump()
+        data["transactions"] = self.list_transactions()
+        data["portfolio_value_time_series"] = self.portfolio_value_time_series
         data["total_portfolio_value"] = portfolio_value
         data["total_profit_loss"] = pnl
         write_log(self.name, "account", f"Retrieved account details")
         return json.dumps(data)
     
+    def summary(self, recent: int = SUMMARY_TRANSACTIONS) -> str:
+        """
+        Return a compact json string of the account for the traders' prompts: the holdings with their cost basis
+        and unrealized P&L, the most recent transactions, and the aggregate P&L. Unlike report(), its size doesn't
+        grow with the account's history.
+        """
+        prices = get_share_prices(self.holdings)
+        holdings = {}
+        for symbol, quantity in self.holdings.items():
+            market_value = prices[symbol] * quantity
+            cost_basis = self.cost_basis.get(symbol, 0.0)
+            holdings[symbol] = {
+                "quantity": quantity,
+                "price": round(prices[symbol], 2),
+                "cost_basis": round(cost_basis, 2),
+                "unrealized_pnl": round(market_value - cost_basis, 2),
+            }
+        portfolio_value = self.balance + sum(prices[symbol] * quantity for symbol, quantity in self.holdings.items())
+        self.record_portfolio_value(portfolio_value)
+        transactions, count = read_recent_transactions(self.name, recent)
+        for transaction in transactions:
+            transaction["price"] = round(transaction["price"], 2)
+            transaction["rationale"] = (transaction["rationale"] or "")[:SUMMARY_RATIONALE_CHARS]
+        unrealized_pnl = sum(holding["unrealized_pnl"] for holding in holdings.values())
+        data = {
+            "name": self.name,
+            "balance": round(self.balance, 2),
+            "holdings": holdings,
+            "total_portfolio_value": round(portfolio_value, 2),
+            "total_profit_loss": round(self.calculate_profit_loss(portfolio_value), 2),
+            "realized_pnl": round(self.realized_pnl, 2),
+            "unrealized_pnl": round(unrealized_pnl, 2),
+            "transaction_count": count,
+            "recent_transactions": transactions,
+        }
+        write_log(self.name, "account", f"Retrieved account summary")
+        return json.dumps(data, separators=(",", ":"))
+
     def get_strategy(self) -> str:
         """ Return the strategy of the account """
         write_log(self.name, "account", f"Retrieved strategy")
@@ -169,11 +306,14 @@ class Account(BaseModel):
     
     def change_strategy(self, strategy: str) -> str:
         """ At your discretion, if you choose to, call this to change your investment strategy for the future """
-        self.strategy = strategy
-        self.save()
+        self.retry_on_conflict(self._change_strategy, strategy)
         write_log(self.name, "account", f"Changed strategy")
         return "Changed strategy"
 
+    def _change_strategy(self, strategy: str):
+        self.strategy = strategy
+        self.save()
+
 # Example of usage:
 if __name__ == "__main__":
     account = Account("John Doe")
@@ -1,39 +1,162 @@
+import asyncio
+import weakref
+from contextlib import asynccontextmanager
 import mcp
+import anyio
 from mcp.client.stdio import stdio_client
 from mcp import StdioServerParameters
+from mcp.shared.exceptions import McpError
+from mcp.types import CONNECTION_CLOSED
 from agents import FunctionTool
+from agents.mcp import MCPServerStdio
+from mcp_pool import OwnedConnection
 import json
 
 params = StdioServerParameters(command="uv", args=["run", "accounts_server.py"], env=None)
 
+# How long an unused accounts_server process is kept alive for the next call
+IDLE_TIMEOUT_SECONDS = 60
+
+
+class AccountsSession(OwnedConnection):
+    """One accounts_server process with an initialized MCP session"""
+
+    label = "the accounts server"
+
+    def __init__(self, server_params: StdioServerParameters):
+        super().__init__()
+        self.server_params = server_params
+        self.session: mcp.ClientSession | None = None
+        self.refs = 0
+        self.broken = False
+
+    @asynccontextmanager
+    async def connect(self):
+        try:
+            async with stdio_client(self.server_params) as streams:
+                async with mcp.ClientSession(*streams) as session:
+                    await session.initialize()
+                    self.session = session
+                    yield
+        finally:
+            self.session = None
+            self.broken = True
+
+    @property
+    def alive(self) -> bool:
+        return not self.broken and super().alive
+
+
+class AccountsClientPool:
+    """
+    Shares one long-lived accounts_server session between callers, counting references.
+    The session is closed once it has been unused for idle_timeout seconds,
+    and replaced if the server process dies.
+    """
+
+    def __init__(self, server_params: StdioServerParameters, idle_timeout: float = IDLE_TIMEOUT_SECONDS):
+        self.server_params = server_params
+        self.idle_timeout = idle_timeout
+        self.connects = 0
+        self._current: AccountsSession | None = None
+        self._lock = asyncio.Lock()
+        self._idle_handle: asyncio.TimerHandle | None = None
+
+    async def acquire(self) -> AccountsSession:
+        async with self._lock:
+            if self._idle_handle:
+                self._idle_handle.cancel()
+                self._idle_handle = None
+            if self._current is None or not self._current.alive:
+                if self._current is not None:
+                    stale, self._current = self._current, None
+                    await stale.close()
+                current = AccountsSession(self.server_params)
+                await current.start()
+                self._current = current
+                self.connects += 1
+            self._current.refs += 1
+            return self._current
+
+    def release(self, accounts_session: AccountsSession) -> None:
+        accounts_session.refs -= 1
+        if accounts_session is self._current and accounts_session.refs == 0:
+            loop = asyncio.get_running_loop()
+            self._idle_handle = loop.call_later(self.idle_timeout, lambda: asyncio.ensure_future(self._close_idle()))
+        elif accounts_session is not self._current and accounts_session.refs == 0:
+            asyncio.ensure_future(accounts_session.close())
+
+    async def _close_idle(self) -> None:
+        async with self._lock:
+            if self._current is not None and self._current.refs == 0:
+                current, self._current = self._current, None
+                await current.close()
+
+    async def request(self, fn):
+        """Run fn(session), reconnecting and retrying once if the server process has gone away"""
+        for attempt in range(2):
+            accounts_session = await self.acquire()
+            try:
+                return await fn(accounts_session.session)
+            except (anyio.ClosedResourceError, anyio.BrokenResourceError, McpError) as e:
+                if isinstance(e, McpError) and e.error.code != CONNECTION_CLOSED:
+                    raise
+                accounts_session.broken = True
+                if attempt:
+                    raise
+            finally:
+                self.release(accounts_session)
+
+    async def close(self) -> None:
+        async with self._lock:
+            if self._idle_handle:
+                self._idle_handle.cancel()
+                self._idle_handle = None
+            if self._current is not None:
+                current, self._current = self._current, None
+                await current.close()
+
+
+# One pool per event loop, as sessions can't be shared across loops
+_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AccountsClientPool]" = weakref.WeakKeyDictionary()
+
+
+def get_pool() -> AccountsClientPool:
+    loop = asyncio.get_running_loop()
+    if loop not in _pools:
+        _pools[loop] = AccountsClientPool(params)
+    return _pools[loop]
+
+
+async def close_accounts_client():
+    loop = asyncio.get_running_loop()
+    if loop in _pools:
+        await _pools.pop(loop).close()
+
 
 async def list_accounts_tools():
-    async with stdio_client(params) as streams:
-        async with mcp.ClientSession(*streams) as session:
-            await session.initialize()
-            tools_result = await session.list_tools()
-            return tools_result.tools
-        
+    tools_result = await get_pool().request(lambda session: session.list_tools())
+    return tools_result.tools
+
 async def call_accounts_tool(tool_name, tool_args):
-    async with stdio_client(params) as streams:
-        async with mcp.ClientSession(*streams) as session:
-            await session.initialize()
-            result = await session.call_tool(tool_name, tool_args)
-            return result
-            
-async def read_accounts_resource(name):
-    async with stdio_client(params) as streams:
-        async with mcp.ClientSession(*streams) as session:
-            await session.initialize()
-            result = await session.read_resource(f"accounts://accounts_server/{name}")
-            return result.contents[0].text
-        
-async def read_strategy_resource(name):
-    async with stdio_client(params) as streams:
-        async with mcp.ClientSession(*streams) as session:
-            await session.initialize()
-            result = await session.read_resource(f"accounts://strategy/{name}")
-            return result.contents[0].text
+    return await get_pool().request(lambda session: session.call_tool(tool_name, tool_args))
+
+async def read_resource(uri, server: MCPServerStdio | None = None):
+    """Read a resource through an accounts server that is already connected, like the trading floor's, or else this module's own"""
+    if server is not None:
+        result = await server.session.read_resource(uri)
+    else:
+        result = await get_pool().request(lambda session: session.read_resource(uri))
+    return result.contents[0].text
+
+async def read_accounts_resource(name, server: MCPServerStdio | None = None):
+    return await read_resource(f"accounts://accounts_server/{name}", server)
+
+async def read_summary_resource(name, server: MCPServerStdio | None = None):
+    return await read_resource(f"accounts://summary/{name}", server)
+
+async def read_strategy_resource(name, server: MCPServerStdio | None = None):
+    return await read_resource(f"accounts://strategy/{name}", server)
 
 async def get_accounts_tools_openai():
     openai_tools = []
@@ -44,7 +167,7 @@ async def get_accounts_tools_openai():
             description=tool.description,
             params_json_schema=schema,
             on_invoke_tool=lambda ctx, args, toolname=tool.name: call_accounts_tool(toolname, json.loads(args))
-                
+
         )
         openai_tools.append(openai_tool)
-    return openai_tools
\ No newline at end of file
+    return openai_tools
@@ -1,5 +1,6 @@
 from mcp.server.fastmcp import FastMCP
 from accounts import Account
+from analytics import leaderboard, trader_exposure, trader_performance
 
 mcp = FastMCP("accounts_server")
 
@@ -56,11 +57,40 @@ async def change_strategy(name: str, strategy: str) -> str:
     """
     return Account.get(name).change_strategy(strategy)
 
+@mcp.tool()
+async def get_performance(name: str) -> dict:
+    """Get the performance of the given account name: its value, total return, annualized volatility and Sharpe ratio,
+    maximum and current drawdown, turnover and number of trades.
+
+    Args:
+        name: The name of the account holder
+    """
+    return trader_performance(name)
+
+@mcp.tool()
+async def get_exposure(name: str) -> dict[str, float]:
+    """Get how the portfolio value of the given account name is split between its holdings and cash, as fractions.
+
+    Args:
+        name: The name of the account holder
+    """
+    return trader_exposure(name)
+
+@mcp.tool()
+async def get_leaderboard() -> list[dict]:
+    """Compare the performance of every trader, best total return first."""
+    return leaderboard()
+
 @mcp.resource("accounts://accounts_server/{name}")
 async def read_account_resource(name: str) -> str:
     account = Account.get(name.lower())
     return account.report()
 
+@mcp.resource("accounts://summary/{name}")
+async def read_summary_resource(name: str) -> str:
+    account = Account.get(name.lower())
+    return account.summary()
+
 @mcp.resource("accounts://strategy/{name}")
 async def read_strategy_resource(name: str) -> str:
     account = Account.get(name.lower())
@@ -0,0 +1,112 @@
+import json
+import numpy as np
+import pandas as pd
+from database import read_all_portfolio_values, read_all_positions, read_all_transactions
+from market import get_share_prices
+
+# Returns are annualized assuming the traders run through the regular session on each trading day
+PERIODS_PER_YEAR = {"daily": 252, "hourly": 252 * 7}
+PERFORMANCE_COLUMNS = ["value", "total_return", "volatility", "sharpe", "max_drawdown", "drawdown", "turnover", "trades"]
+
+
+def value_frame(names: list[str] | None = None, since: str | None = None, resolution: str = "daily") -> pd.DataFrame:
+    """Portfolio values with a row per period and a column per trader, carried forward over periods without a value"""
+    df = pd.DataFrame(read_all_portfolio_values(names, since, resolution), columns=["name", "datetime", "value"])
+    period = "D" if resolution == "daily" else "h"
+    df["datetime"] = pd.to_datetime(df["datetime"]).dt.floor(period)
+    return df.pivot_table(index="datetime", columns="name", values="value", aggfunc="last").ffill()
+
+
+def transaction_frame(names: list[str] | None = None, since: str | None = None) -> pd.DataFrame:
+    return pd.DataFrame(read_all_transactions(names, since), columns=["name", "symbol", "quantity", "price", "timestamp"])
+
+
+def returns(values: pd.DataFrame) -> pd.DataFrame:
+    return values.pct_change(fill_method=None)
+
+
+def drawdown(values: pd.DataFrame) -> pd.DataFrame:
+    """How far each value is below the highest value before it, as a fraction of that high"""
+    return values / values.cummax() - 1
+
+
+def sharpe(period_returns: pd.DataFrame, periods_per_year: int) -> pd.Series:
+    """Annualized Sharpe ratio with a zero risk-free rate; NaN where the returns don't vary"""
+    return period_returns.mean() / period_returns.std().replace(0, np.nan) * np.sqrt(periods_per_year)
+
+
+def turnover(transactions: pd.DataFrame, values: pd.DataFrame) -> pd.Series:
+    """The value traded over the period as a multiple of the average portfolio value"""
+    traded = (transactions["quantity"].abs() * transactions["price"]).groupby(transactions["name"]).sum()
+    return traded.reindex(values.columns, fill_value=0.0) / values.mean()
+
+
+def performance(
+    values: pd.DataFrame, transactions: pd.DataFrame, periods_per_year: int = PERIODS_PER_YEAR["daily"]
+) -> pd.DataFrame:
+    """Performance metrics with a row per trader, computed for every trader at once from the value and transaction frames"""
+    if values.empty:
+        return pd.DataFrame(columns=PERFORMANCE_COLUMNS)
+    period_returns = returns(values)
+    drawdowns = drawdown(values)
+    first = values.bfill().iloc[0]
+    return pd.DataFrame(
+        {
+            "value": values.iloc[-1],
+            "total_return": values.iloc[-1] / first - 1,
+            "volatility": period_returns.std() * np.sqrt(periods_per_year),
+            "sharpe": sharpe(period_returns, periods_per_year),
+            "max_drawdown": drawdowns.min(),
+            "drawdown": drawdowns.iloc[-1],
+            "turnover": turnover(transactions, values),
+            "trades": transactions.groupby("name").size().reindex(values.columns, fill_value=0),
+        }
+    )
+
+
+def performance_summary(names: list[str] | None = None, since: str | None = None, resolution: str = "daily") -> pd.DataFrame:
+    """Performance metrics for the traders, or every trader, over their value history since the given timestamp"""
+    values = value_frame(names, since, resolution)
+    return performance(values, transaction_frame(names, since), PERIODS_PER_YEAR[resolution])
+
+
+def exposure(names: list[str] | None = None) -> pd.DataFrame:
+    """
+    Each trader's positions as a fraction of its portfolio value at current prices,
+    with a row per trader and a column per symbol, plus one for cash
+    """
+    positions = pd.DataFrame(read_all_positions(names), columns=["name", "balance", "symbol", "quantity"])
+    balances = positions.groupby("name")["balance"].first()
+    held = positions.dropna(subset=["symbol"])
+    prices = pd.Series(get_share_prices(held["symbol"].unique().tolist()), dtype=float)
+    market_values = held["quantity"] * held["symbol"].map(prices)
+    weights = (
+        held.assign(value=market_values)
+        .pivot_table(index="name", columns="symbol", values="value", aggfunc="sum", fill_value=0.0)
+        .reindex(balances.index, fill_value=0.0)
+    )
+    weights["cash"] = balances
+    return weights.div(weights.sum(axis=1), axis=0)
+
+
+def trader_performance(name: str, since: str | None = None) -> dict:
+    """One trader's performance metrics, as a dict with None in place of the metrics there isn't enough history for"""
+    summary = performance_summary([name], since)
+    if name.lower() not in summary.index:
+        return {}
+    return json.loads(summary.loc[name.lower()].to_json())
+
+
+def leaderboard(since: str | None = None) -> list[dict]:
+    """Every trader's performance metrics, best total return first"""
+    summary = performance_summary(since=since).sort_values("total_return", ascending=False)
+    return json.loads(summary.rename_axis("name").reset_index().to_json(orient="records"))
+
+
+def trader_exposure(name: str) -> dict[str, float]:
+    """One trader's positions as fractions of its portfolio value, largest first"""
+    weights = exposure([name])
+    if name.lower() not in weights.index:
+        return {}
+    row = weights.loc[name.lower()]
+    return json.loads(row[row != 0].sort_values(ascending=False).to_json())
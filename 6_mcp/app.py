@@ -1,10 +1,19 @@
 import gradio as gr
+import asyncio
+import os
+import threading
+import time
+from collections import deque
 from util import css, js, Color
-import pandas as pd
-from trading_floor import names, lastnames, short_model_names
-import plotly.express as px
+from registry import load_traders, short_model_name
 from accounts import Account
-from database import read_log
+from database import read_log_since
+from events import bus, watcher, account_topic, log_topic, ACCOUNTS_TOPIC
+from views import TraderViewModel, LeaderboardViewModel, ACCOUNT_REFRESH_SECONDS, LEADERBOARD_COLUMNS
+
+LOG_LINES = 13
+# With a large tournament in the registry, only the first few traders are shown
+DASHBOARD_TRADERS = int(os.getenv("DASHBOARD_TRADERS", "4"))
 
 mapper = {
     "trace": Color.WHITE,
@@ -21,10 +30,14 @@ class Trader:
         self.name = name
         self.lastname = lastname
         self.model_name = model_name
-        self.account = Account.get(name)
+        self.view = TraderViewModel(name)
+        self.log_lines = deque(maxlen=LOG_LINES)
+        self.last_log_id = 0
+        self.log_lock = threading.Lock()
 
-    def reload(self):
-        self.account = Account.get(self.name)
+    @property
+    def account(self) -> Account:
+        return self.view.account
 
     def get_title(self) -> str:
         return f"<div style='text-align: center;font-size:34px;'>{self.name}<span style='color:#ccc;font-size:24px;'> ({self.model_name}) - {self.lastname}</span></div>"
@@ -32,65 +45,18 @@ class Trader:
     def get_strategy(self) -> str:
         return self.account.get_strategy()
 
-    def get_portfolio_value_df(self) -> pd.DataFrame:
-        df = pd.DataFrame(self.account.portfolio_value_time_series, columns=["datetime", "value"])
-        df["datetime"] = pd.to_datetime(df["datetime"])
-        return df
-
-    def get_portfolio_value_chart(self):
-        df = self.get_portfolio_value_df()
-        fig = px.line(df, x="datetime", y="value")
-        margin = dict(l=40, r=20, t=20, b=40)
-        fig.update_layout(
-            height=300,
-            margin=margin,
-            xaxis_title=None,
-            yaxis_title=None,
-            paper_bgcolor="#bbb",
-            plot_bgcolor="#dde",
-        )
-        fig.update_xaxes(tickformat="%m/%d", tickangle=45, tickfont=dict(size=8))
-        fig.update_yaxes(tickfont=dict(size=8), tickformat=",.0f")
-        return fig
-
-    def get_holdings_df(self) -> pd.DataFrame:
-        """Convert holdings to DataFrame for display"""
-        holdings = self.account.get_holdings()
-        if not holdings:
-            return pd.DataFrame(columns=["Symbol", "Quantity"])
-
-        df = pd.DataFrame(
-            [{"Symbol": symbol, "Quantity": quantity} for symbol, quantity in holdings.items()]
-        )
-        return df
-
-    def get_transactions_df(self) -> pd.DataFrame:
-        """Convert transactions to DataFrame for display"""
-        transactions = self.account.list_transactions()
-        if not transactions:
-            return pd.DataFrame(columns=["Timestamp", "Symbol", "Quantity", "Price", "Rationale"])
-
-        return pd.DataFrame(transactions)
-
-    def get_portfolio_value(self) -> str:
-        """Calculate total portfolio value based on current prices"""
-        portfolio_value = self.account.calculate_portfolio_value() or 0.0
-        pnl = self.account.calculate_profit_loss(portfolio_value) or 0.0
-        color = "green" if pnl >= 0 else "red"
-        emoji = "⬆" if pnl >= 0 else "⬇"
-        return f"<div style='text-align: center;background-color:{color};'><span style='font-size:32px'>${portfolio_value:,.0f}</span><span style='font-size:24px'>&nbsp;&nbsp;&nbsp;{emoji}&nbsp;${pnl:,.0f}</span></div>"
-
-    def get_logs(self, previous=None) -> str:
-        logs = read_log(self.name, last_n=13)
-        response = ""
-        for log in logs:
-            timestamp, type, message = log
-            color = mapper.get(type, Color.WHITE).value
-            response += f"<span style='color:{color}'>{timestamp} : [{type}] {message}</span><br/>"
-        response = f"<div style='height:250px; overflow-y:auto;'>{response}</div>"
-        if response != previous:
-            return response
-        return gr.update()
+    def get_account_outputs(self) -> tuple:
+        return self.view.outputs()
+
+    def get_logs(self) -> str:
+        # Only rows written since the last poll are fetched; the recent lines are kept here, shared by every session
+        with self.log_lock:
+            for log_id, timestamp, type, message in read_log_since(self.name, self.last_log_id, LOG_LINES):
+                color = mapper.get(type, Color.WHITE).value
+                self.log_lines.append(f"<span style='color:{color}'>{timestamp} : [{type}] {message}</span><br/>")
+                self.last_log_id = log_id
+            response = "".join(self.log_lines)
+        return f"<div style='height:250px; overflow-y:auto;'>{response}</div>"
 
 
 class TraderView:
@@ -101,20 +67,17 @@ class TraderView:
         self.holdings_table = None
         self.transactions_table = None
 
-    def make_ui(self):
+    def make_ui(self, ui: gr.Blocks):
         with gr.Column():
             gr.HTML(self.trader.get_title())
             with gr.Row():
-                self.portfolio_value = gr.HTML(self.trader.get_portfolio_value)
+                self.portfolio_value = gr.HTML()
             with gr.Row():
-                self.chart = gr.Plot(
-                    self.trader.get_portfolio_value_chart, container=True, show_label=False
-                )
+                self.chart = gr.Plot(container=True, show_label=False)
             with gr.Row(variant="panel"):
-                self.log = gr.HTML(self.trader.get_logs)
+                self.log = gr.HTML()
             with gr.Row():
                 self.holdings_table = gr.Dataframe(
-                    value=self.trader.get_holdings_df,
                     label="Holdings",
                     headers=["Symbol", "Quantity"],
                     row_count=(5, "dynamic"),
@@ -124,7 +87,6 @@ class TraderView:
                 )
             with gr.Row():
                 self.transactions_table = gr.Dataframe(
-                    value=self.trader.get_transactions_df,
                     label="Recent Transactions",
                     headers=["Timestamp", "Symbol", "Quantity", "Price", "Rationale"],
                     row_count=(5, "dynamic"),
@@ -133,10 +95,9 @@ class TraderView:
                     elem_classes=["dataframe-fix"],
                 )
 
-        timer = gr.Timer(value=120)
-        timer.tick(
-            fn=self.refresh,
-            inputs=[],
+        # Each session streams updates pushed by the event bus, rather than polling on timers
+        ui.load(
+            fn=self.stream_account,
             outputs=[
                 self.portfolio_value,
                 self.chart,
@@ -144,25 +105,56 @@ class TraderView:
                 self.transactions_table,
             ],
             show_progress="hidden",
-            queue=False,
+            concurrency_limit=None,
         )
-        log_timer = gr.Timer(value=0.5)
-        log_timer.tick(
-            fn=self.trader.get_logs,
-            inputs=[self.log],
-            outputs=[self.log],
-            show_progress="hidden",
-            queue=False,
+        ui.load(fn=self.stream_logs, outputs=[self.log], show_progress="hidden", concurrency_limit=None)
+
+    async def stream_account(self):
+        """Yield the account's value, chart and tables on load and whenever the account changes"""
+        topic = account_topic(self.trader.name)
+        seen, last = bus.count(topic), None
+        while True:
+            outputs = await asyncio.to_thread(self.trader.get_account_outputs)
+            # The view model hands back the same outputs until something changes, so there's nothing to send
+            if outputs is not last:
+                last = outputs
+                yield outputs
+            timeout = ACCOUNT_REFRESH_SECONDS - time.time() % ACCOUNT_REFRESH_SECONDS
+            seen = await bus.wait(topic, seen, timeout)
+
+    async def stream_logs(self):
+        """Yield the recent logs on load and whenever new ones are written"""
+        topic = log_topic(self.trader.name)
+        seen = bus.count(topic)
+        while True:
+            yield await asyncio.to_thread(self.trader.get_logs)
+            seen = await bus.wait(topic, seen)
+
+
+class LeaderboardView:
+    def __init__(self, traders: list[Trader]):
+        self.view = LeaderboardViewModel([trader.name for trader in traders])
+        self.table = None
+
+    def make_ui(self, ui: gr.Blocks):
+        self.table = gr.Dataframe(
+            label="Leaderboard",
+            headers=LEADERBOARD_COLUMNS,
+            row_count=(len(self.view.names), "dynamic"),
+            col_count=len(LEADERBOARD_COLUMNS),
+            elem_classes=["dataframe-fix-small"],
         )
+        ui.load(fn=self.stream_table, outputs=[self.table], show_progress="hidden", concurrency_limit=None)
 
-    def refresh(self):
-        self.trader.reload()
-        return (
-            self.trader.get_portfolio_value(),
-            self.trader.get_portfolio_value_chart(),
-            self.trader.get_holdings_df(),
-            self.trader.get_transactions_df(),
-        )
+    async def stream_table(self):
+        """Yield the leaderboard on load and whenever one of the accounts changes"""
+        seen, last = bus.count(ACCOUNTS_TOPIC), None
+        while True:
+            table = await asyncio.to_thread(self.view.table)
+            if table is not last:
+                last = table
+                yield table
+            seen = await bus.wait(ACCOUNTS_TOPIC, seen)
 
 
 # Main UI construction
@@ -170,17 +162,21 @@ def create_ui():
     """Create the main Gradio UI for the trading simulation"""
 
     traders = [
-        Trader(trader_name, lastname, model_name)
-        for trader_name, lastname, model_name in zip(names, lastnames, short_model_names)
+        Trader(trader["name"], trader["lastname"], short_model_name(trader["model_name"]))
+        for trader in load_traders()[:DASHBOARD_TRADERS]
     ]
     trader_views = [TraderView(trader) for trader in traders]
+    leaderboard_view = LeaderboardView(traders)
+    watcher.start()
 
     with gr.Blocks(
         title="Traders", css=css, js=js, theme=gr.themes.Default(primary_hue="sky"), fill_width=True
     ) as ui:
         with gr.Row():
             for trader_view in trader_views:
-                trader_view.make_ui()
+                trader_view.make_ui(ui)
+        with gr.Row():
+            leaderboard_view.make_ui(ui)
 
     return ui
 
@@ -0,0 +1,437 @@
+"""
+Offline backtests of the traders: each trader is replayed through Trader.run_agent once per historical trading day,
+with prices from locally stored end of day closes and a stub or recorded model in place of the LLM.
+Each trader runs in its own process against its own throwaway accounts database, so months of trading days
+take minutes, and the result is an equity curve per trader.
+
+Usage:
+  uv run backtest.py load 2024-01-02 2024-06-28              store the daily closes from Polygon in history.db
+  uv run backtest.py synthetic 2024-01-02 2024-06-28         or store made-up closes, to try it without Polygon
+  uv run backtest.py run 2024-01-02 2024-06-28 --model stub  replay the traders and write their equity curves
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import random
+import sqlite3
+import time
+from datetime import date, timedelta
+import pandas as pd
+from agents import Agent, Model, ModelResponse, Usage, function_tool, set_tracing_disabled
+from openai.types.responses import (
+    ResponseFunctionToolCall,
+    ResponseOutputItem,
+    ResponseOutputMessage,
+    ResponseOutputText,
+)
+from pydantic import TypeAdapter
+from dotenv import load_dotenv
+import database
+import market
+from accounts import Account
+from database import write_log
+from providers import get_model, make_limiters, set_limiters
+from registry import load_traders, tournament_traders
+from reset import strategies
+from templates import trader_instructions
+from traders import Trader
+
+load_dotenv(override=True)
+
+HISTORY_DB = os.getenv("HISTORY_DB", "history.db")
+BACKTESTS_DIR = "backtests"
+RECORDINGS_DIR = os.path.join(BACKTESTS_DIR, "recordings")
+# The symbols the stub model trades, and that synthetic history is made up for
+UNIVERSE = ["AAPL", "MSFT", "NVDA", "AMZN", "GOOGL", "META", "TSLA", "JPM", "SPY", "QQQ", "IBIT", "ETHA"]
+STUB_BUY_PROBABILITY = 0.6
+# The free Polygon plan allows 5 requests a minute
+FREE_PLAN_REQUEST_SECONDS = 12
+
+
+def _history_connection(path: str = HISTORY_DB) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS daily_closes (date TEXT, symbol TEXT, close REAL, PRIMARY KEY (date, symbol)) WITHOUT ROWID"
+    )
+    return conn
+
+
+def write_closes(day: str, closes: dict[str, float], path: str = HISTORY_DB) -> None:
+    with _history_connection(path) as conn:
+        conn.execute("DELETE FROM daily_closes WHERE date = ?", (day,))
+        conn.executemany(
+            "INSERT INTO daily_closes (date, symbol, close) VALUES (?, ?, ?)",
+            [(day, symbol, close) for symbol, close in closes.items() if close is not None],
+        )
+
+
+def read_trading_days(start: str, end: str, path: str = HISTORY_DB) -> list[str]:
+    """The days between start and end, inclusive, that have closes stored"""
+    with _history_connection(path) as conn:
+        rows = conn.execute(
+            "SELECT DISTINCT date FROM daily_closes WHERE date BETWEEN ? AND ? ORDER BY date", (start, end)
+        ).fetchall()
+    return [row[0] for row in rows]
+
+
+def weekdays(start: str, end: str) -> list[str]:
+    day, last = date.fromisoformat(start), date.fromisoformat(end)
+    days = []
+    while day <= last:
+        if day.weekday() < 5:
+            days.append(day.isoformat())
+        day += timedelta(days=1)
+    return days
+
+
+def load_history(start: str, end: str, path: str = HISTORY_DB) -> None:
+    """Fetch the close of every symbol for each weekday from Polygon, skipping days already stored and market holidays"""
+    stored = set(read_trading_days(start, end, path))
+    client = market.get_client()
+    for day in weekdays(start, end):
+        if day in stored:
+            continue
+        results = client.get_grouped_daily_aggs(day, adjusted=True, include_otc=False)
+        closes = {result.ticker: result.close for result in results}
+        if closes:
+            write_closes(day, closes, path)
+        print(f"{day}: {len(closes)} closes")
+        if not market.is_paid_polygon:
+            time.sleep(FREE_PLAN_REQUEST_SECONDS)
+
+
+def write_synthetic_history(start: str, end: str, symbols: list[str] = UNIVERSE, seed: int = 0, path: str = HISTORY_DB) -> None:
+    """Store a random walk of closes for every weekday, for trying backtests without market data"""
+    rng = random.Random(seed)
+    closes = {symbol: rng.uniform(20, 500) for symbol in symbols}
+    for day in weekdays(start, end):
+        closes = {symbol: round(close * math.exp(rng.gauss(0.0003, 0.02)), 2) for symbol, close in closes.items()}
+        write_closes(day, closes, path)
+
+
+class HistoricalPrices:
+    """The price source for market.get_share_prices during a backtest: the closes on the day being replayed"""
+
+    def __init__(self, path: str = HISTORY_DB):
+        self.conn = _history_connection(path)
+        self.day: str | None = None
+        self._closes: dict[str, float] = {}
+
+    def set_day(self, day: str) -> None:
+        self.day = day
+        self._closes = {}
+
+    def __call__(self, symbols: list[str]) -> dict[str, float]:
+        missing = [symbol for symbol in symbols if symbol not in self._closes]
+        if missing:
+            placeholders = ",".join("?" * len(missing))
+            rows = self.conn.execute(
+                f"SELECT symbol, close FROM daily_closes WHERE date = ? AND symbol IN ({placeholders})",
+                (self.day, *missing),
+            ).fetchall()
+            self._closes.update({symbol: 0.0 for symbol in missing})
+            self._closes.update(rows)
+        return {symbol: self._closes[symbol] for symbol in symbols}
+
+
+def _message(text: str) -> ResponseOutputMessage:
+    content = [ResponseOutputText(type="output_text", text=text, annotations=[])]
+    return ResponseOutputMessage(id="msg_backtest", type="message", role="assistant", status="completed", content=content)
+
+
+def _after_tool_call(input) -> bool:
+    return isinstance(input, list) and bool(input) and input[-1].get("type") == "function_call_output"
+
+
+class StubModel(Model):
+    """
+    A deterministic stand-in for the LLM: each run it buys or sells a few shares of one symbol from the universe,
+    then says it is done. The choices only depend on the seed and the trader, so every replay is the same.
+    """
+
+    def __init__(self, name: str, seed: int = 0, universe: list[str] = UNIVERSE):
+        self.random = random.Random(f"{seed}-{name}")
+        self.universe = universe
+        self.calls = 0
+
+    async def get_response(self, system_instructions, input, *args, **kwargs) -> ModelResponse:
+        self.calls += 1
+        usage = Usage(requests=1, input_tokens=0, output_tokens=0, total_tokens=0)
+        if _after_tool_call(input):
+            return ModelResponse(output=[_message("Done")], usage=usage, response_id=None)
+        tool = "buy_shares" if self.random.random() < STUB_BUY_PROBABILITY else "sell_shares"
+        arguments = {"symbol": self.random.choice(self.universe), "quantity": self.random.randint(1, 10), "rationale": "Stub"}
+        call = ResponseFunctionToolCall(
+            type="function_call",
+            id=f"fc_{self.calls}",
+            call_id=f"call_{self.calls}",
+            name=tool,
+            arguments=json.dumps(arguments),
+            status="completed",
+        )
+        return ModelResponse(output=[call], usage=usage, response_id=None)
+
+    def stream_response(self, *args, **kwargs):
+        raise NotImplementedError
+
+
+class RecordingModel(Model):
+    """Wraps a real model, appending each of its responses to a JSONL file keyed by trading day, for ReplayModel"""
+
+    def __init__(self, model: Model, path: str, prices: HistoricalPrices):
+        self.model = model
+        self.path = path
+        self.prices = prices
+        self.calls: dict[str, int] = {}
+
+    async def get_response(self, *args, **kwargs) -> ModelResponse:
+        response = await self.model.get_response(*args, **kwargs)
+        call = self.calls[self.prices.day] = self.calls.get(self.prices.day, 0) + 1
+        usage = response.usage
+        record = {
+            "day": self.prices.day,
+            "call": call,
+            "output": [item.model_dump() for item in response.output],
+            "usage": [usage.requests, usage.input_tokens, usage.output_tokens, usage.total_tokens],
+        }
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+        return response
+
+    def stream_response(self, *args, **kwargs):
+        raise NotImplementedError
+
+
+class ReplayModel(Model):
+    """Replays the responses recorded for each trading day in order, falling back to the stub where there are none"""
+
+    def __init__(self, path: str, prices: HistoricalPrices, fallback: Model):
+        self.prices = prices
+        self.fallback = fallback
+        self.calls: dict[str, int] = {}
+        self.responses: dict[tuple[str, int], dict] = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    record = json.loads(line)
+                    self.responses[(record["day"], record["call"])] = record
+        self.replayed = self.missed = 0
+
+    async def get_response(self, *args, **kwargs) -> ModelResponse:
+        call = self.calls[self.prices.day] = self.calls.get(self.prices.day, 0) + 1
+        record = self.responses.get((self.prices.day, call))
+        if record is None:
+            self.missed += 1
+            return await self.fallback.get_response(*args, **kwargs)
+        self.replayed += 1
+        adapter = TypeAdapter(ResponseOutputItem)
+        output = [adapter.validate_python(item) for item in record["output"]]
+        requests, input_tokens, output_tokens, total_tokens = record["usage"]
+        usage = Usage(requests=requests, input_tokens=input_tokens, output_tokens=output_tokens, total_tokens=total_tokens)
+        return ModelResponse(output=output, usage=usage, response_id=None)
+
+    def stream_response(self, *args, **kwargs):
+        raise NotImplementedError
+
+
+def account_tools(name: str) -> list:
+    """The accounts_server and market_server tools for one trader, acting on its account in-process"""
+
+    @function_tool
+    def get_balance() -> float:
+        """Get your cash balance."""
+        return Account.get(name).balance
+
+    @function_tool
+    def get_holdings() -> dict[str, int]:
+        """Get your holdings."""
+        return Account.get(name).holdings
+
+    @function_tool
+    def buy_shares(symbol: str, quantity: int, rationale: str) -> str:
+        """Buy shares of a stock.
+
+        Args:
+            symbol: The symbol of the stock
+            quantity: The quantity of shares to buy
+            rationale: The rationale for the purchase and fit with the account's strategy
+        """
+        return Account.get(name).buy_shares(symbol, quantity, rationale)
+
+    @function_tool
+    def sell_shares(symbol: str, quantity: int, rationale: str) -> str:
+        """Sell shares of a stock.
+
+        Args:
+            symbol: The symbol of the stock
+            quantity: The quantity of shares to sell
+            rationale: The rationale for the sale and fit with the account's strategy
+        """
+        return Account.get(name).sell_shares(symbol, quantity, rationale)
+
+    @function_tool
+    def change_strategy(strategy: str) -> str:
+        """At your discretion, if you choose to, call this to change your investment strategy for the future.
+
+        Args:
+            strategy: The new strategy for the account
+        """
+        return Account.get(name).change_strategy(strategy)
+
+    @function_tool
+    def lookup_share_price(symbol: str) -> float:
+        """This tool provides the current price of the given stock symbol.
+
+        Args:
+            symbol: the symbol of the stock
+        """
+        return market.get_share_price(symbol)
+
+    return [get_balance, get_holdings, buy_shares, sell_shares, change_strategy, lookup_share_price]
+
+
+class BacktestTrader(Trader):
+    """A trader that runs without MCP servers or research, its tools acting on its account directly"""
+
+    def __init__(self, name: str, lastname: str, model_name: str, model: Model):
+        super().__init__(name, lastname, model_name)
+        self.model = model
+        # Building the tool schemas takes longer than a stub run, so it is done once rather than every day
+        self.tools = account_tools(name)
+
+    async def create_agent(self, trader_mcp_servers=None, researcher_mcp_servers=None, hooks=None) -> Agent:
+        self.agent = Agent(
+            name=self.name,
+            instructions=trader_instructions(self.name),
+            model=self.model,
+            tools=self.tools,
+        )
+        return self.agent
+
+    async def get_account_report(self) -> str:
+        return Account.get(self.name).summary()
+
+    async def get_strategy(self) -> str:
+        return Account.get(self.name).get_strategy()
+
+
+def make_model(mode: str, trader: dict, prices: HistoricalPrices, seed: int) -> Model:
+    recording = os.path.join(RECORDINGS_DIR, f"{trader['name'].lower()}.jsonl")
+    if mode == "record":
+        os.makedirs(RECORDINGS_DIR, exist_ok=True)
+        return RecordingModel(get_model(trader["model_name"]), recording, prices)
+    stub = StubModel(trader["name"], seed)
+    if mode == "replay":
+        return ReplayModel(recording, prices, stub)
+    return stub
+
+
+async def replay_days(trader: BacktestTrader, days: list[str], prices: HistoricalPrices) -> list[tuple[str, float]]:
+    """Run the trader once per day, alternating trading and rebalancing as the trading floor does"""
+    curve = []
+    for day in days:
+        prices.set_day(day)
+        try:
+            await trader.run_agent(None, None)
+        except Exception as e:
+            write_log(trader.name, "backtest", f"Run on {day} failed: {e}")
+        trader.do_trade = not trader.do_trade
+        curve.append((day, Account.get(trader.name).calculate_portfolio_value()))
+    return curve
+
+
+def backtest_trader(trader: dict, days: list[str], out_dir: str, mode: str, seed: int, history: str) -> list[tuple[str, float]]:
+    """Replay one trader over the days in this process, against its own fresh accounts database"""
+    path = os.path.join(out_dir, f"{trader['name'].lower()}.db")
+    database.use_database(path)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    set_tracing_disabled(True)
+    prices = HistoricalPrices(history)
+    market.price_source = prices
+    Account.get(trader["name"]).reset(trader["strategy"])
+    backtester = BacktestTrader(trader["name"], trader["lastname"], trader["model_name"], make_model(mode, trader, prices, seed))
+    try:
+        return asyncio.run(replay_days(backtester, days, prices))
+    finally:
+        database.close_logs()
+
+
+def summarize(curves: pd.DataFrame) -> pd.DataFrame:
+    drawdown = curves / curves.cummax() - 1
+    return pd.DataFrame(
+        {
+            "final_value": curves.iloc[-1],
+            "return": curves.iloc[-1] / curves.iloc[0] - 1,
+            "max_drawdown": drawdown.min(),
+        }
+    )
+
+
+def run_backtest(
+    traders: list[dict],
+    start: str,
+    end: str,
+    mode: str = "stub",
+    processes: int | None = None,
+    seed: int = 0,
+    history: str = HISTORY_DB,
+    out_dir: str | None = None,
+) -> pd.DataFrame:
+    """
+    Replay every trader over the stored trading days from start to end, one process per trader up to processes,
+    and return their equity curves with a row per day and a column per trader, also written to equity.csv.
+    """
+    days = read_trading_days(start, end, history)
+    if not days:
+        raise ValueError(f"No closes stored between {start} and {end}; run `uv run backtest.py load {start} {end}` first")
+    out_dir = out_dir or os.path.join(BACKTESTS_DIR, f"{start}_{end}_{mode}")
+    os.makedirs(out_dir, exist_ok=True)
+    traders = [{**trader, "strategy": strategies[i % len(strategies)]} for i, trader in enumerate(traders)]
+    processes = min(processes or os.cpu_count() or 1, len(traders))
+    context = multiprocessing.get_context("spawn")
+    # Recording calls the real providers, so the processes share their concurrency limits as the trading floor's workers do
+    limiters = make_limiters(context)
+    with context.Pool(processes, initializer=set_limiters, initargs=(limiters, processes)) as pool:
+        results = pool.starmap(
+            backtest_trader,
+            [(trader, days, out_dir, mode, seed, os.path.abspath(history)) for trader in traders],
+        )
+    curves = pd.DataFrame(
+        {trader["name"]: dict(curve) for trader, curve in zip(traders, results)}
+    ).rename_axis("date")
+    curves.to_csv(os.path.join(out_dir, "equity.csv"))
+    return curves
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest the traders against historical end of day prices")
+    parser.add_argument("command", choices=["load", "synthetic", "run"])
+    parser.add_argument("start", help="First day, e.g. 2024-01-02")
+    parser.add_argument("end", help="Last day, e.g. 2024-06-28")
+    parser.add_argument("--model", choices=["stub", "replay", "record"], default="stub",
+                        help="stub: deterministic trades; record: call the real models and save their responses; replay: replay them")
+    parser.add_argument("--traders", type=int, help="Backtest a tournament of this many traders instead of the registry")
+    parser.add_argument("--processes", type=int, help="Worker processes; defaults to one per CPU")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.command == "load":
+        load_history(args.start, args.end)
+    elif args.command == "synthetic":
+        write_synthetic_history(args.start, args.end, seed=args.seed)
+    else:
+        traders = tournament_traders(args.traders) if args.traders else load_traders()
+        start = time.perf_counter()
+        curves = run_backtest(traders, args.start, args.end, args.model, args.processes, args.seed)
+        elapsed = time.perf_counter() - start
+        print(summarize(curves).to_string(float_format=lambda x: f"{x:,.3f}"))
+        print(f"Replayed {len(curves)} days for {len(curves.columns)} traders in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,824 @@
+"""
+Micro-benchmarks for the trading floor's hot paths.
+Each benchmark runs against a throwaway database so it never touches accounts.db.
+
+Usage: uv run benchmarks.py [name ...]   (runs every benchmark when no names are given)
+"""
+
+import os
+import sys
+import random
+import multiprocessing
+import sqlite3
+import tempfile
+import time
+import json
+import itertools
+import threading
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import database
+
+
+def use_temp_db() -> str:
+    """Point the database module at a fresh temporary file"""
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    database.use_database(path)
+    return path
+
+
+def legacy_db() -> str:
+    """A database with the original schema: one JSON document per account"""
+    path = os.path.join(tempfile.mkdtemp(), "legacy.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE accounts (name TEXT PRIMARY KEY, account TEXT)")
+        conn.execute(
+            "CREATE TABLE logs (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, datetime DATETIME, type TEXT, message TEXT)"
+        )
+    return path
+
+
+def report(label: str, ops: int, elapsed: float) -> float:
+    rate = ops / elapsed
+    print(f"  {label:<40} {ops:>8} ops in {elapsed:6.2f}s = {rate:>10,.0f} ops/sec")
+    return rate
+
+
+def bench_connections(n: int = 5000):
+    """Connect-per-call (the original database.py) versus the pooled WAL connection"""
+    print("Database connections: write_account + read_account + write_log")
+    path = legacy_db()
+    account = {"name": "warren", "balance": 10_000.0, "strategy": "", "holdings": {"AAPL": 10}}
+
+    start = time.perf_counter()
+    for i in range(n):
+        with sqlite3.connect(path) as conn:
+            conn.execute(
+                "INSERT INTO accounts (name, account) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET account=excluded.account",
+                ("warren", json.dumps(account)),
+            )
+            conn.commit()
+        with sqlite3.connect(path) as conn:
+            conn.execute("SELECT account FROM accounts WHERE name = ?", ("warren",)).fetchone()
+        with sqlite3.connect(path) as conn:
+            conn.execute(
+                "INSERT INTO logs (name, datetime, type, message) VALUES (?, datetime('now'), ?, ?)",
+                ("warren", "account", f"message {i}"),
+            )
+            conn.commit()
+    before = report("connect per call", n * 3, time.perf_counter() - start)
+
+    use_temp_db()
+    start = time.perf_counter()
+    for i in range(n):
+        database.write_account("warren", account)
+        database.read_account("warren")
+        database.write_log("warren", "account", f"message {i}")
+    after = report("pooled connection", n * 3, time.perf_counter() - start)
+    print(f"  speedup: {after / before:.1f}x")
+
+
+def bench_logs(n: int = 20000):
+    """Per-span cost of a synchronous insert + commit versus the batched background log writer"""
+    print("Log writes: cost seen by the caller")
+    use_temp_db()
+    conn = database.get_connection()
+
+    start = time.perf_counter()
+    for i in range(n):
+        conn.execute(
+            "INSERT INTO logs (name, datetime, type, message) VALUES (?, datetime('now'), ?, ?)",
+            ("warren", "function", f"Started function {i}"),
+        )
+    before = report("synchronous insert + commit", n, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for i in range(n):
+        database.write_log("warren", "function", f"Started function {i}")
+    after = report("queued write_log", n, time.perf_counter() - start)
+    start = time.perf_counter()
+    database.flush_logs()
+    print(f"  drained remaining queue in {time.perf_counter() - start:.2f}s")
+    print(f"  speedup: {after / before:.1f}x")
+
+
+def bench_trades(history: int = 10000, n: int = 100):
+    """Cost of recording one trade on an account that already has a long transaction history"""
+    print(f"Recording a trade with {history} prior transactions")
+    transaction = {"symbol": "AAPL", "quantity": 1, "price": 100.0, "timestamp": "2025-01-01 10:00:00", "rationale": "x" * 200}
+    account = {
+        "name": "warren",
+        "balance": 10_000.0,
+        "strategy": "",
+        "holdings": {"AAPL": history},
+        "transactions": [transaction] * history,
+        "portfolio_value_time_series": [("2025-01-01 10:00:00", 10_000.0)] * history,
+    }
+
+    conn = sqlite3.connect(legacy_db(), isolation_level=None)
+    start = time.perf_counter()
+    for _ in range(n):
+        account["transactions"].append(transaction)
+        conn.execute(
+            "INSERT INTO accounts (name, account) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET account=excluded.account",
+            ("warren", json.dumps(account)),
+        )
+    before = report("rewrite JSON document", n, time.perf_counter() - start)
+    conn.close()
+
+    use_temp_db()
+    database.write_account("warren", account)
+    start = time.perf_counter()
+    for i in range(n):
+        state = {"balance": 10_000.0 - i, "holdings": {"AAPL": history + i}, "net_invested": 0.0, "realized_pnl": 0.0, "cost_basis": {}}
+        database.write_trade("warren", state, "AAPL", transaction)
+    after = report("append transaction row", n, time.perf_counter() - start)
+    print(f"  speedup: {after / before:.1f}x")
+
+
+def bench_profit_loss(history: int = 10000, symbols: int = 20, n: int = 50):
+    """Account P&L and valuation: re-summing the ledger and per-holding lookups versus running aggregates"""
+    print(f"Profit/loss and valuation with {history} transactions across {symbols} symbols")
+    import accounts
+
+    use_temp_db()
+    transactions = [
+        {"symbol": f"S{i % symbols}", "quantity": 2 if i % 3 else -1, "price": 100.0 + i % 7, "timestamp": "2025-01-01 10:00:00", "rationale": "x"}
+        for i in range(history)
+    ]
+    holdings = {}
+    for t in transactions:
+        holdings[t["symbol"]] = holdings.get(t["symbol"], 0) + t["quantity"]
+    database.write_account("warren", {"name": "warren", "balance": 1_000.0, "strategy": "", "holdings": holdings, "transactions": transactions})
+
+    calls = {"count": 0}
+
+    def price(symbol):
+        calls["count"] += 1
+        return 100.0
+
+    def prices(symbols):
+        calls["count"] += 1
+        return {symbol: 100.0 for symbol in symbols}
+
+    accounts.get_share_price, accounts.get_share_prices = price, prices
+
+    start = time.perf_counter()
+    for _ in range(n):
+        account = accounts.Account.get("warren")
+        value = account.balance + sum(price(symbol) * quantity for symbol, quantity in account.holdings.items())
+        value - sum(t.total() for t in account.transactions) - account.balance
+    before = report("ledger re-sum + per-holding prices", n, time.perf_counter() - start)
+    print(f"  market data calls per valuation: {calls['count'] / n:.0f}")
+
+    calls["count"] = 0
+    start = time.perf_counter()
+    for _ in range(n):
+        account = accounts.Account.get("warren")
+        account.calculate_profit_loss(account.calculate_portfolio_value())
+    after = report("running aggregates + batched prices", n, time.perf_counter() - start)
+    print(f"  market data calls per valuation: {calls['count'] / n:.0f}")
+    print(f"  speedup: {after / before:.1f}x")
+
+
+class FakePolygonHandler(BaseHTTPRequestHandler):
+    """Serves the two Polygon snapshot endpoints with deterministic prices, counting requests"""
+
+    requests = 0
+
+    def do_GET(self):
+        FakePolygonHandler.requests += 1
+        url = urlparse(self.path)
+        prefix = "/v2/snapshot/locale/us/markets/stocks/tickers"
+
+        def snapshot(ticker):
+            return {"ticker": ticker, "min": {"c": 100.0 + len(ticker)}, "prevDay": {"c": 99.0}}
+
+        if url.path == prefix:
+            tickers = parse_qs(url.query).get("tickers", [""])[0].split(",")
+            body = {"status": "OK", "tickers": [snapshot(ticker) for ticker in tickers]}
+        else:
+            body = {"status": "OK", "ticker": snapshot(url.path.rsplit("/", 1)[-1])}
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def fake_polygon_server() -> str:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakePolygonHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+class FakeModelHandler(BaseHTTPRequestHandler):
+    """An OpenAI-compatible chat completions endpoint that answers 429 beyond limit requests per second"""
+
+    limit = 20
+    latency = 0.05
+    accepted: list = []
+    lock = threading.Lock()
+    counts = {"ok": 0, "429": 0}
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        now = time.monotonic()
+        with FakeModelHandler.lock:
+            FakeModelHandler.accepted = [t for t in FakeModelHandler.accepted if now - t < 1]
+            allowed = len(FakeModelHandler.accepted) < FakeModelHandler.limit
+            if allowed:
+                FakeModelHandler.accepted.append(now)
+            FakeModelHandler.counts["ok" if allowed else "429"] += 1
+        if allowed:
+            time.sleep(FakeModelHandler.latency)
+            status, body = 200, {
+                "id": "fake",
+                "object": "chat.completion",
+                "created": 0,
+                "model": "fake",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "Done"}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 500, "completion_tokens": 50, "total_tokens": 550},
+            }
+        else:
+            status, body = 429, {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if status == 429:
+            self.send_header("retry-after", "1")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def bench_providers(traders: int = 50, requests: int = 4, limit: int = 20):
+    """A burst of model requests against a provider that rate limits: the default client versus the provider layer"""
+    print(f"{traders} traders x {requests} requests against a fake provider allowing {limit} requests/second")
+    import asyncio
+    from agents import Agent, OpenAIChatCompletionsModel, RunConfig, Runner
+    from openai import AsyncOpenAI
+    import providers
+
+    FakeModelHandler.limit = limit
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeModelHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    async def burst(model) -> tuple[int, int]:
+        agent = Agent(name="Trader", instructions="Trade", model=model)
+
+        async def trader():
+            completed = failed = 0
+            for _ in range(requests):
+                try:
+                    await Runner.run(agent, "Trade", run_config=RunConfig(tracing_disabled=True))
+                    completed += 1
+                except Exception:
+                    failed += 1
+            return completed, failed
+
+        results = await asyncio.gather(*[trader() for _ in range(traders)])
+        return sum(r[0] for r in results), sum(r[1] for r in results)
+
+    def run(label: str, make_model) -> None:
+        FakeModelHandler.accepted, FakeModelHandler.counts = [], {"ok": 0, "429": 0}
+
+        async def main():
+            return await burst(make_model())
+
+        start = time.perf_counter()
+        completed, failed = asyncio.run(main())
+        elapsed = time.perf_counter() - start
+        counts = FakeModelHandler.counts
+        print(f"  {label:<28} completed {completed:>4}, failed {failed:>3}, 429s {counts['429']:>5}, in {elapsed:5.1f}s")
+
+    run("default client (2 retries)", lambda: OpenAIChatCompletionsModel(
+        model="deepseek-chat", openai_client=AsyncOpenAI(base_url=base, api_key="fake")
+    ))
+
+    providers.PROVIDERS["deepseek"]["base_url"] = base
+    os.environ["DEEPSEEK_API_KEY"] = "fake"
+    os.environ["DEEPSEEK_RPM"] = str(limit * 60)
+    providers.get_client.cache_clear()
+    providers._limiters.clear()
+    run("rate limited provider layer", lambda: providers.get_model("deepseek-chat"))
+    print(f"  metrics: {providers.provider_metrics()['deepseek']}")
+    server.shutdown()
+
+
+def bench_prices(traders: int = 4, holdings: int = 10, rounds: int = 25):
+    """Share price lookups on the paid plan against a local fake Polygon server"""
+    print(f"Valuing {traders} traders x {holdings} holdings, {rounds} rounds, against a fake Polygon server")
+    from polygon import RESTClient
+    import market
+
+    use_temp_db()
+    base = fake_polygon_server()
+    market.polygon_api_key, market.polygon_base_url, market.is_paid_polygon = "fake", base, True
+    market.get_client.cache_clear()
+    market.price_cache.clear()
+    symbols = [f"SYM{i}" for i in range(holdings)]
+
+    FakePolygonHandler.requests = 0
+    start = time.perf_counter()
+    for _ in range(rounds * traders):
+        for symbol in symbols:
+            result = RESTClient("fake", base=base).get_snapshot_ticker("stocks", symbol)
+            result.min.close or result.prev_day.close
+    before = report("new client + one request per symbol", rounds * traders, time.perf_counter() - start)
+    print(f"  HTTP requests: {FakePolygonHandler.requests}")
+
+    FakePolygonHandler.requests = 0
+    start = time.perf_counter()
+    for _ in range(rounds * traders):
+        market.get_share_prices(symbols)
+    after = report("shared client + bulk snapshot + cache", rounds * traders, time.perf_counter() - start)
+    print(f"  HTTP requests: {FakePolygonHandler.requests}, cache: {market.price_cache.stats()}")
+    print(f"  speedup: {after / before:.1f}x")
+
+
+def bench_market(tickers: int = 10000, lookups: int = 20):
+    """Cold-start single-symbol lookups: JSON snapshot document versus indexed per-symbol rows"""
+    print(f"EOD snapshot of {tickers} tickers, {lookups} cold single-symbol lookups")
+    data = {f"T{i:05d}": 10.0 + i / 100 for i in range(tickers)}
+    date = "2025-01-02"
+
+    path = legacy_db()
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE market (date TEXT PRIMARY KEY, data TEXT)")
+        conn.execute("INSERT INTO market (date, data) VALUES (?, ?)", (date, json.dumps(data)))
+    tracemalloc.start()
+    start = time.perf_counter()
+    for i in range(lookups):
+        with sqlite3.connect(path) as conn:
+            market_data = json.loads(conn.execute("SELECT data FROM market WHERE date = ?", (date,)).fetchone()[0])
+        market_data.get(f"T{i:05d}", 0.0)
+    before = report("load and parse JSON document", lookups, time.perf_counter() - start)
+    print(f"  resident snapshot: {tracemalloc.get_traced_memory()[0] / 1e6:.2f} MB")
+    tracemalloc.stop()
+    del market_data
+
+    use_temp_db()
+    database.write_market(date, data)
+    tracemalloc.start()
+    start = time.perf_counter()
+    for i in range(lookups):
+        database.close_connection()
+        database.has_market(date)
+        database.read_market_prices(date, [f"T{i:05d}"])
+    after = report("indexed row lookup", lookups, time.perf_counter() - start)
+    print(f"  resident snapshot: {tracemalloc.get_traced_memory()[0] / 1e6:.2f} MB")
+    tracemalloc.stop()
+    print(f"  speedup: {after / before:.1f}x")
+
+
+def bench_accounts_client(n: int = 10):
+    """MCP calls to accounts_server: a new process and handshake per call versus the shared session pool"""
+    print(f"{n} read_strategy_resource calls to accounts_server")
+    import asyncio
+    import mcp
+    from mcp import StdioServerParameters
+    from mcp.client.stdio import stdio_client
+    import accounts_client
+
+    server = os.path.join(os.path.dirname(os.path.abspath(__file__)), "accounts_server.py")
+    server_params = StdioServerParameters(command=sys.executable, args=[server], cwd=tempfile.mkdtemp())
+
+    async def spawn_per_call():
+        async with stdio_client(server_params) as streams:
+            async with mcp.ClientSession(*streams) as session:
+                await session.initialize()
+                await session.read_resource("accounts://strategy/warren")
+
+    async def run():
+        start = time.perf_counter()
+        for _ in range(n):
+            await spawn_per_call()
+        before = report("process per call", n, time.perf_counter() - start)
+
+        pool = accounts_client.AccountsClientPool(server_params)
+        start = time.perf_counter()
+        for _ in range(n):
+            await pool.request(lambda session: session.read_resource("accounts://strategy/warren"))
+        after = report("pooled session", n, time.perf_counter() - start)
+        print(f"  processes started: {pool.connects}")
+        print(f"  speedup: {after / before:.1f}x")
+        await pool.close()
+
+    asyncio.run(run())
+
+
+def _trade_worker(path: str, seed: int, n: int) -> int:
+    """Run n random buys and sells against the shared account, returning how many succeeded"""
+    database.DB = path
+    import accounts
+
+    rng = random.Random(seed)
+    completed = 0
+    for _ in range(n):
+        account = accounts.Account.get("warren")
+        symbol = rng.choice(["AAPL", "MSFT", "NVDA"])
+        try:
+            if rng.random() < 0.6:
+                account.retry_on_conflict(account._buy_shares, symbol, rng.randint(1, 3), "stress")
+            else:
+                account.retry_on_conflict(account._sell_shares, symbol, rng.randint(1, 3), "stress")
+            completed += 1
+        except ValueError:
+            pass
+    database.close_logs()
+    return completed
+
+
+def bench_concurrency(processes: int = 8, n: int = 500):
+    """Concurrent buys and sells on one account from several processes; the ledger must reconcile exactly"""
+    print(f"{processes} processes x {n} random trades on one account")
+    import accounts
+
+    path = use_temp_db()
+    accounts.Account.get("warren").reset("stress")
+    database.close_connection()
+
+    start = time.perf_counter()
+    with multiprocessing.get_context("spawn").Pool(processes) as pool:
+        completed = sum(pool.starmap(_trade_worker, [(path, seed, n) for seed in range(processes)]))
+    report("trades attempted", processes * n, time.perf_counter() - start)
+
+    account = accounts.Account.get("warren")
+    transactions = database.read_transactions("warren")
+    holdings = {}
+    for t in transactions:
+        holdings[t["symbol"]] = holdings.get(t["symbol"], 0) + t["quantity"]
+    holdings = {symbol: quantity for symbol, quantity in holdings.items() if quantity}
+    expected_balance = accounts.INITIAL_BALANCE - sum(t["quantity"] * t["price"] for t in transactions)
+    print(f"  completed trades: {completed}, transactions recorded: {len(transactions)}, version: {account.version}")
+    print(f"  balance: {account.balance:.6f}, expected from ledger: {expected_balance:.6f}")
+    print(f"  holdings: {account.holdings}, expected from ledger: {holdings}")
+    reconciled = (
+        completed == len(transactions)
+        and abs(account.balance - expected_balance) < 1e-6
+        and account.holdings == holdings
+    )
+    print(f"  reconciled: {reconciled}")
+
+
+def _tournament_worker(path: str, shard: int, workers: int, count: int, seconds: float, latency: float, limiters: dict, results) -> None:
+    """Run one shard of a tournament of stub-LLM traders for a while, reporting how many runs completed"""
+    database.DB = path
+    import asyncio
+    import accounts
+    from agents import Agent, Model, ModelResponse, Runner, RunConfig, Usage
+    from openai.types.responses import ResponseOutputMessage, ResponseOutputText
+    from providers import LimitedModel, get_limiter, set_limiters
+    from registry import shard_of, tournament_traders
+    from scheduler import Scheduler
+
+    set_limiters(limiters, workers)
+
+    class StubModel(Model):
+        """Answers after a fixed latency, standing in for a model provider"""
+
+        async def get_response(self, *args, **kwargs):
+            await asyncio.sleep(latency)
+            text = ResponseOutputText(type="output_text", text="Done", annotations=[])
+            message = ResponseOutputMessage(id="stub", type="message", role="assistant", status="completed", content=[text])
+            usage = Usage(requests=1, input_tokens=2000, output_tokens=200, total_tokens=2200)
+            return ModelResponse(output=[message], usage=usage, response_id=None)
+
+        def stream_response(self, *args, **kwargs):
+            raise NotImplementedError
+
+    class StubTrader:
+        def __init__(self, name: str):
+            self.name = name
+            self.last_error = None
+            self.account = accounts.Account.get(name)
+            self.agent = Agent(name=name, instructions="Trade", model=LimitedModel(StubModel(), get_limiter("openai")))
+
+        async def run(self, pool, hooks=None):
+            await Runner.run(self.agent, "Trade", hooks=hooks, run_config=RunConfig(tracing_disabled=True))
+            await asyncio.to_thread(self.account.buy_shares, "AAPL", 1, "tournament")
+
+    class NoServers:
+        async def health_check(self):
+            pass
+
+    async def run() -> int:
+        scheduler = Scheduler(NoServers(), max_concurrent=count)
+        for trader in tournament_traders(count):
+            if shard_of(trader["name"], workers) == shard:
+                scheduler.add(StubTrader(trader["name"]), every=latency)
+        task = asyncio.create_task(scheduler.run())
+        await asyncio.sleep(seconds)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return sum(stats.get("completed", 0) for stats in scheduler.stats().values())
+
+    completed = asyncio.run(run())
+    database.close_logs()
+    results.put(completed)
+
+
+def bench_tournament(
+    counts: tuple = (4, 50, 200),
+    worker_counts: tuple = (1, 4),
+    provider_limits: tuple = (16, 1000),
+    seconds: float = 10.0,
+    latency: float = 0.5,
+):
+    """Trader runs per hour with a stub LLM, by number of traders, worker processes and provider concurrency limit"""
+    print(f"Tournament throughput with a stub LLM answering in {latency}s and one trade per run, over {seconds:.0f}s")
+    import providers
+
+    context = multiprocessing.get_context("spawn")
+    for limit, count, workers in itertools.product(provider_limits, counts, worker_counts):
+        os.environ["OPENAI_MAX_CONCURRENT"] = str(limit)
+        # Only the concurrency limit is under test here, so the per-minute quotas are set out of the way
+        os.environ["OPENAI_RPM"] = os.environ["OPENAI_TPM"] = str(10**9)
+        path = use_temp_db()
+        database.get_connection()
+        database.close_connection()
+        # The limiters can only be handed to processes as they start, as trading_floor.run_sharded does
+        limiters = providers.make_limiters(context)
+        results = context.Queue()
+        processes = [
+            context.Process(target=_tournament_worker, args=(path, shard, workers, count, seconds, latency, limiters, results))
+            for shard in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        completed = sum(results.get() for _ in processes)
+        for process in processes:
+            process.join()
+        print(f"  provider limit {limit:>4}, {count:>4} traders, {workers} worker(s): {completed * 3600 / seconds:>10,.0f} runs/hour")
+
+
+def bench_logs_tail(rows: int = 1_000_000, names: int = 4, polls: int = 50):
+    """Dashboard log polling on a large log table: unindexed ORDER BY datetime versus the (name, id) cursor"""
+    print(f"Polling the latest logs for one of {names} traders in a {rows:,} row log table")
+    batch = [(f"trader{i % names}", f"2025-01-01 {i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}", "span", f"message {i}") for i in range(rows)]
+
+    conn = sqlite3.connect(legacy_db())
+    conn.executemany("INSERT INTO logs (name, datetime, type, message) VALUES (?, ?, ?, ?)", batch)
+    conn.commit()
+    start = time.perf_counter()
+    for _ in range(polls):
+        conn.execute(
+            "SELECT datetime, type, message FROM logs WHERE name = ? ORDER BY datetime DESC LIMIT ?", ("trader1", 13)
+        ).fetchall()
+    before = report("read_log: unindexed sort", polls, time.perf_counter() - start)
+    conn.close()
+
+    use_temp_db()
+    with database.transaction() as conn:
+        conn.executemany("INSERT INTO logs (name, datetime, type, message) VALUES (?, ?, ?, ?)", batch)
+
+    # New rows go in directly rather than through the log writer, which would prune the table on its first batch
+    last_id = database.read_log_since("trader1", 0, 13)[-1][0]
+    reads = 0.0
+    for i in range(polls):
+        with database.transaction() as conn:
+            conn.execute(
+                "INSERT INTO logs (name, datetime, type, message) VALUES (?, ?, ?, ?)",
+                ("trader1", "2025-01-02 00:00:00", "span", f"new message {i}"),
+            )
+        start = time.perf_counter()
+        new_rows = database.read_log_since("trader1", last_id, 13)
+        reads += time.perf_counter() - start
+        last_id = new_rows[-1][0]
+    after = report(f"read_log_since cursor, {rows:,} rows", polls, reads)
+    print(f"  speedup: {after / before:.1f}x")
+
+    start = time.perf_counter()
+    deleted = database.prune_logs()
+    print(f"  prune_logs kept {database.LOG_RETENTION_ROWS:,} rows per trader, deleted {deleted:,} in {time.perf_counter() - start:.2f}s")
+
+def bench_dashboard(viewers: tuple = (1, 10, 50), updates: int = 10, history: int = 500):
+    """CPU spent by the dashboard per connected viewer: rebuilding everything per session versus the shared view model"""
+    print(f"Dashboard refreshes for one trader with {history} transactions, {updates} account updates")
+    import accounts
+    import views
+
+    use_temp_db()
+    calls = {"count": 0}
+
+    def prices(symbols):
+        calls["count"] += 1
+        return {symbol: 100.0 for symbol in symbols}
+
+    accounts.get_share_prices = prices
+    transactions = [
+        {"symbol": f"S{i % 10}", "quantity": 1, "price": 100.0, "timestamp": "2025-01-01 10:00:00", "rationale": "x"}
+        for i in range(history)
+    ]
+    database.write_account("warren", {"name": "warren", "balance": 1_000.0, "strategy": "", "holdings": {f"S{i}": history // 10 for i in range(10)}, "transactions": transactions})
+    account = accounts.Account.get("warren")
+
+    def update():
+        account.deposit(1)
+        account.report()
+
+    def legacy_refresh():
+        viewer_account = accounts.Account.get("warren")
+        views.render_portfolio_value(viewer_account)
+        views.render_chart(viewer_account)
+        views.holdings_df(viewer_account)
+        views.transactions_df(viewer_account)
+
+    view = views.TraderViewModel("warren")
+    for label, refresh in [("rebuild per session", legacy_refresh), ("shared view model", view.outputs)]:
+        costs = {}
+        for n in viewers:
+            calls["count"] = 0
+            cpu = 0.0
+            for _ in range(updates):
+                update()
+                start = time.process_time()
+                for _ in range(n):
+                    refresh()
+                cpu += time.process_time() - start
+            costs[n] = cpu / updates * 1000
+            print(f"  {label:<22} {n:>3} viewers: {costs[n]:8.1f} ms CPU per update, {calls['count'] / updates - 1:.0f} price lookups")
+        marginal = (costs[viewers[-1]] - costs[viewers[0]]) / (viewers[-1] - viewers[0])
+        print(f"  {label:<22} each additional viewer costs {marginal:.2f} ms CPU per update")
+
+
+def bench_backtest(traders: int = 8, months: int = 6, process_counts: tuple = (1, 4)):
+    """Offline backtest speed with the stub model over synthetic history, by number of worker processes"""
+    print(f"Backtest of {traders} stub-model traders over {months} months of synthetic daily closes")
+    import backtest
+    from registry import tournament_traders
+
+    directory = tempfile.mkdtemp()
+    history = os.path.join(directory, "history.db")
+    backtest.write_synthetic_history("2024-01-01", f"2024-{months:02d}-28", path=history)
+    for processes in process_counts:
+        out_dir = os.path.join(directory, f"run{processes}")
+        start = time.perf_counter()
+        curves = backtest.run_backtest(
+            tournament_traders(traders), "2024-01-01", "2024-12-31", processes=processes, history=history, out_dir=out_dir
+        )
+        elapsed = time.perf_counter() - start
+        report(f"{processes} process(es), trader-days", curves.size, elapsed)
+
+
+def _python_performance(values: list[float], transactions: list[dict], periods_per_year: int) -> dict:
+    """The metrics the analytics module computes, for one trader in plain Python, as a baseline"""
+    import math
+    import statistics
+
+    returns = [b / a - 1 for a, b in zip(values, values[1:])]
+    high, max_drawdown = values[0], 0.0
+    for value in values:
+        high = max(high, value)
+        max_drawdown = min(max_drawdown, value / high - 1)
+    traded = sum(abs(t["quantity"]) * t["price"] for t in transactions)
+    stdev = statistics.stdev(returns)
+    return {
+        "total_return": values[-1] / values[0] - 1,
+        "sharpe": statistics.mean(returns) / stdev * math.sqrt(periods_per_year) if stdev else None,
+        "max_drawdown": max_drawdown,
+        "turnover": traded / statistics.mean(values),
+    }
+
+
+def bench_analytics(traders: int = 100, days: int = 252, ticks_per_day: int = 26, trades_per_day: int = 4):
+    """Performance metrics for every trader over a year of 15-minute portfolio values: one trader at a time versus vectorized"""
+    print(f"Analytics for {traders} traders over {days} days of {ticks_per_day} portfolio values and {trades_per_day} trades a day")
+    from datetime import datetime, timedelta
+    import pandas as pd
+    import analytics
+
+    use_temp_db()
+    rng = random.Random(0)
+    names = [f"trader{i}" for i in range(traders)]
+    start = datetime(2024, 1, 2, 9, 30)
+    values, transactions = [], []
+    for name in names:
+        value = 10_000.0
+        for day in range(days):
+            opening = start + timedelta(days=day)
+            for tick in range(ticks_per_day):
+                value *= 1 + rng.gauss(0.0001, 0.004)
+                values.append((name, (opening + timedelta(minutes=15 * tick)).strftime(database.TIMESTAMP_FORMAT), value))
+            for _ in range(trades_per_day):
+                timestamp = opening.strftime(database.TIMESTAMP_FORMAT)
+                transactions.append((name, "AAPL", rng.choice([-5, 5]), rng.uniform(100, 200), timestamp, "benchmark"))
+    with database.transaction() as conn:
+        conn.executemany("INSERT INTO portfolio_values (name, datetime, value) VALUES (?, ?, ?)", values)
+        conn.executemany(
+            "INSERT INTO transactions (name, symbol, quantity, price, timestamp, rationale) VALUES (?, ?, ?, ?, ?, ?)",
+            transactions,
+        )
+
+    print("  daily values, read alone:")
+    start_time = time.perf_counter()
+    for name in names:
+        database.read_portfolio_values(name, resolution="daily")
+    before = report("one trader at a time", traders, time.perf_counter() - start_time)
+    start_time = time.perf_counter()
+    database.read_all_portfolio_values(resolution="daily")
+    after = report("every trader at once", traders, time.perf_counter() - start_time)
+    print(f"  speedup: {after / before:.1f}x")
+
+    print("  daily metrics, read from the database:")
+    start_time = time.perf_counter()
+    baseline = {
+        name: _python_performance(
+            [value for _, value in database.read_portfolio_values(name, resolution="daily")],
+            database.read_transactions(name),
+            analytics.PERIODS_PER_YEAR["daily"],
+        )
+        for name in names
+    }
+    before = report("one trader at a time", traders, time.perf_counter() - start_time)
+    start_time = time.perf_counter()
+    summary = analytics.performance_summary()
+    after = report("every trader at once", traders, time.perf_counter() - start_time)
+    assert abs(summary.loc[names[0], "sharpe"] - baseline[names[0]]["sharpe"]) < 1e-9
+    assert abs(summary.loc[names[0], "turnover"] - baseline[names[0]]["turnover"]) < 1e-9
+    print(f"  speedup: {after / before:.1f}x")
+
+    print("  15-minute metrics, already in memory:")
+    per_trader = {name: [] for name in names}
+    for name, _, value in values:
+        per_trader[name].append(value)
+    trades = {name: [] for name in names}
+    for name, symbol, quantity, price, _, _ in transactions:
+        trades[name].append({"quantity": quantity, "price": price})
+    periods_per_year = 252 * ticks_per_day
+    start_time = time.perf_counter()
+    for name in names:
+        _python_performance(per_trader[name], trades[name], periods_per_year)
+    before = report("one trader at a time", traders, time.perf_counter() - start_time)
+    frame = pd.DataFrame(per_trader)
+    trade_frame = pd.DataFrame(transactions, columns=["name", "symbol", "quantity", "price", "timestamp", "rationale"])
+    start_time = time.perf_counter()
+    analytics.performance(frame, trade_frame, periods_per_year)
+    after = report("every trader at once", traders, time.perf_counter() - start_time)
+    print(f"  speedup: {after / before:.1f}x")
+
+
+def bench_account_report(ages: tuple = (0, 10, 100, 1000), symbols: int = 8):
+    """Prompt tokens for the account in the trade message as the trade history grows: full report versus summary"""
+    print("Trade message size by number of past transactions, at about 4 characters per token")
+    import market
+    from accounts import Account
+    from providers import estimate_tokens
+    from templates import trade_message
+
+    use_temp_db()
+    market.price_source = lambda symbols: {symbol: 50.0 for symbol in symbols}
+    rationale = "Strong free cash flow and a durable competitive advantage; trading below my estimate of intrinsic value " * 2
+    strategy = "You are a value investor."
+    for age in ages:
+        account = Account.get(f"trader{age}")
+        account.reset(strategy)
+        for i in range(age):
+            if i % 2:
+                account.sell_shares(f"SYM{i // 2 % symbols}", 1, rationale)
+            else:
+                account.buy_shares(f"SYM{i // 2 % symbols}", 1, rationale)
+        report = json.loads(account.report())
+        report.pop("portfolio_value_time_series", None)
+        before = estimate_tokens(None, trade_message(account.name, strategy, json.dumps(report)))
+        after = estimate_tokens(None, trade_message(account.name, strategy, account.summary()))
+        print(f"  {age:>5} transactions: full report {before:>8,} tokens, summary {after:>6,} tokens")
+    market.price_source = None
+
+
+BENCHMARKS = {
+    "connections": bench_connections,
+    "logs": bench_logs,
+    "trades": bench_trades,
+    "profit_loss": bench_profit_loss,
+    "prices": bench_prices,
+    "market": bench_market,
+    "accounts_client": bench_accounts_client,
+    "concurrency": bench_concurrency,
+    "logs_tail": bench_logs_tail,
+    "dashboard": bench_dashboard,
+    "tournament": bench_tournament,
+    "providers": bench_providers,
+    "backtest": bench_backtest,
+    "analytics": bench_analytics,
+    "account_report": bench_account_report,
+}
+
+
+if __name__ == "__main__":
+    selected = sys.argv[1:] or list(BENCHMARKS)
+    for name in selected:
+        BENCHMARKS[name]()
+        print()
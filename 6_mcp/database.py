@@ -1,17 +1,98 @@
 import sqlite3
 import json
-from datetime import datetime
+import os
+import queue
+import threading
+import time
+import atexit
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 
 load_dotenv(override=True)
 
 DB = "accounts.db"
 
+# Pragmas applied to every connection: WAL lets readers (the UI) run alongside the writers (the traders),
+# and synchronous=NORMAL is safe with WAL while avoiding an fsync on every commit
+PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+]
 
-with sqlite3.connect(DB) as conn:
-    cursor = conn.cursor()
-    cursor.execute('CREATE TABLE IF NOT EXISTS accounts (name TEXT PRIMARY KEY, account TEXT)')
-    cursor.execute('''
+# Log rows are buffered in memory and written by a background thread in batches of up to LOG_BATCH_SIZE,
+# at least every LOG_FLUSH_SECONDS
+LOG_BATCH_SIZE = 500
+LOG_FLUSH_SECONDS = 0.5
+# Only the most recent LOG_RETENTION_ROWS log rows are kept for each name; older rows are pruned
+# by the log writer at most once every LOG_PRUNE_EVERY_SECONDS
+LOG_RETENTION_ROWS = int(os.getenv("LOG_RETENTION_ROWS", "20000"))
+LOG_PRUNE_EVERY_SECONDS = 600
+
+# Portfolio values are kept at full resolution for PORTFOLIO_RAW_RETENTION, then downsampled to the last
+# value per hour until PORTFOLIO_HOURLY_RETENTION, and to the last value per day beyond that
+PORTFOLIO_RAW_RETENTION = timedelta(days=int(os.getenv("PORTFOLIO_RAW_RETENTION_DAYS", "1")))
+PORTFOLIO_HOURLY_RETENTION = timedelta(days=int(os.getenv("PORTFOLIO_HOURLY_RETENTION_DAYS", "30")))
+PORTFOLIO_COMPACT_EVERY = timedelta(hours=1)
+# Each period is identified by a prefix of its timestamps, which is much cheaper to group by than strftime
+RESOLUTIONS = {"raw": None, "hourly": len("2024-01-02 09"), "daily": len("2024-01-02")}
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_local = threading.local()
+_last_compaction: dict[str, datetime] = {}
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+
+def _create_schema(conn: sqlite3.Connection) -> None:
+    conn.execute("BEGIN IMMEDIATE")
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(accounts)")]
+    if "account" in columns:
+        conn.execute("ALTER TABLE accounts RENAME TO accounts_json")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS accounts (
+            name TEXT PRIMARY KEY,
+            balance REAL NOT NULL,
+            strategy TEXT NOT NULL DEFAULT '',
+            net_invested REAL NOT NULL DEFAULT 0,
+            realized_pnl REAL NOT NULL DEFAULT 0,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS holdings (
+            name TEXT NOT NULL,
+            symbol TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            cost_basis REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (name, symbol)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            symbol TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            price REAL NOT NULL,
+            timestamp TEXT NOT NULL,
+            rationale TEXT
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_name ON transactions (name, id)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS portfolio_values (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            datetime TEXT NOT NULL,
+            value REAL NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_portfolio_values_name ON portfolio_values (name, datetime)')
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS logs (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT,
@@ -20,82 +101,745 @@ with sqlite3.connect(DB) as conn:
             message TEXT
         )
     ''')
-    cursor.execute('CREATE TABLE IF NOT EXISTS market (date TEXT PRIMARY KEY, data TEXT)')
-    conn.commit()
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_name_id ON logs (name, id)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS traders (
+            name TEXT PRIMARY KEY,
+            lastname TEXT NOT NULL DEFAULT '',
+            model_name TEXT NOT NULL,
+            every_minutes REAL,
+            enabled INTEGER NOT NULL DEFAULT 1
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS market_prices (
+            date TEXT NOT NULL,
+            symbol TEXT NOT NULL,
+            price REAL NOT NULL,
+            PRIMARY KEY (date, symbol)
+        ) WITHOUT ROWID
+    ''')
+    if conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'market'").fetchone():
+        _migrate_json_market(conn)
+    if "account" in columns:
+        _migrate_json_accounts(conn)
+    elif "net_invested" in _add_missing_columns(conn):
+        _backfill_aggregates(conn)
+    conn.execute("COMMIT")
+
+
+def _migrate_json_accounts(conn: sqlite3.Connection) -> None:
+    """Move accounts stored as one JSON document per row into the normalized tables"""
+    for (data,) in conn.execute("SELECT account FROM accounts_json").fetchall():
+        _write_account(conn, json.loads(data))
+    conn.execute("DROP TABLE accounts_json")
+
+
+def _migrate_json_market(conn: sqlite3.Connection) -> None:
+    """Move market snapshots stored as one JSON document per date into per-symbol rows"""
+    for date, data in conn.execute("SELECT date, data FROM market").fetchall():
+        _write_market(conn, date, json.loads(data))
+    conn.execute("DROP TABLE market")
+
+
+def _add_missing_columns(conn: sqlite3.Connection) -> list[str]:
+    """Bring tables created by an earlier version up to date, returning the columns added"""
+    added = []
+    for table, column, definition in [
+        ("accounts", "net_invested", "REAL NOT NULL DEFAULT 0"),
+        ("accounts", "realized_pnl", "REAL NOT NULL DEFAULT 0"),
+        ("accounts", "version", "INTEGER NOT NULL DEFAULT 0"),
+        ("holdings", "cost_basis", "REAL NOT NULL DEFAULT 0"),
+    ]:
+        if column not in [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            added.append(column)
+    return added
+
+
+def _backfill_aggregates(conn: sqlite3.Connection) -> None:
+    for (name,) in conn.execute("SELECT name FROM accounts").fetchall():
+        net_invested, realized_pnl, cost_basis = replay_aggregates(read_transactions(name, conn))
+        conn.execute(
+            "UPDATE accounts SET net_invested = ?, realized_pnl = ? WHERE name = ?", (net_invested, realized_pnl, name)
+        )
+        conn.executemany(
+            "UPDATE holdings SET cost_basis = ? WHERE name = ? AND symbol = ?",
+            [(basis, name, symbol) for symbol, basis in cost_basis.items()],
+        )
+
+
+def apply_transaction(
+    holdings: dict[str, int], cost_basis: dict[str, float], symbol: str, quantity: int, price: float
+) -> tuple[float, float]:
+    """
+    Apply one transaction to the holdings and cost basis in place, using average cost for sales.
+    Returns its change to (net_invested, realized_pnl). Used both when trading and when replaying a history,
+    so the two can't drift apart.
+    """
+    held = holdings.get(symbol, 0)
+    realized_pnl = 0.0
+    if quantity > 0:
+        cost_basis[symbol] = cost_basis.get(symbol, 0.0) + quantity * price
+    else:
+        sold_cost = cost_basis.get(symbol, 0.0) * min(-quantity, held) / held if held > 0 else 0.0
+        cost_basis[symbol] = cost_basis.get(symbol, 0.0) - sold_cost
+        realized_pnl = -quantity * price - sold_cost
+    holdings[symbol] = held + quantity
+    if holdings[symbol] <= 0:
+        holdings.pop(symbol)
+        cost_basis.pop(symbol, None)
+    return quantity * price, realized_pnl
+
+
+def replay_aggregates(transactions: list[dict]) -> tuple[float, float, dict[str, float]]:
+    """
+    Rebuild the running aggregates from a transaction history.
+    Returns (net_invested, realized_pnl, cost_basis per symbol held).
+    """
+    net_invested = 0.0
+    realized_pnl = 0.0
+    holdings: dict[str, int] = {}
+    cost_basis: dict[str, float] = {}
+    for t in transactions:
+        invested, realized = apply_transaction(holdings, cost_basis, t["symbol"], t["quantity"], t["price"])
+        net_invested += invested
+        realized_pnl += realized
+    return net_invested, realized_pnl, cost_basis
+
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Return the connection for the current thread, opening it on first use.
+    Connections are reused for the life of the thread; asyncio tasks on the same thread share one,
+    which is safe because each statement runs to completion without yielding to the event loop.
+    """
+    global _schema_ready
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        # isolation_level=None puts the connection in autocommit mode; multi-statement writes use transaction()
+        conn = sqlite3.connect(DB, isolation_level=None, cached_statements=256)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        if not _schema_ready:
+            with _schema_lock:
+                if not _schema_ready:
+                    try:
+                        _create_schema(conn)
+                    except BaseException:
+                        if conn.in_transaction:
+                            conn.execute("ROLLBACK")
+                        raise
+                    _schema_ready = True
+        _local.conn = conn
+    return conn
+
+
+def close_connection() -> None:
+    """Close the connection for the current thread, if one is open"""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+
+@contextmanager
+def transaction():
+    """Run the enclosed statements as one atomic write, taking the write lock up front"""
+    conn = get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+class ConcurrentUpdateError(Exception):
+    """Raised when an account was changed by another writer since it was read"""
+
+
+def _check_version(conn: sqlite3.Connection, name: str, expected: int | None) -> None:
+    """Compare-and-swap guard; must run inside a write transaction so nobody can change the row in between"""
+    if expected is None:
+        return
+    row = conn.execute('SELECT version FROM accounts WHERE name = ?', (name,)).fetchone()
+    if row and row[0] != expected:
+        raise ConcurrentUpdateError(f"Account {name} is at version {row[0]}, expected {expected}")
+
+
+def _write_account(conn: sqlite3.Connection, account_dict: dict) -> None:
+    name = account_dict["name"].lower()
+    if "transactions" in account_dict:
+        net_invested, realized_pnl, cost_basis = replay_aggregates(account_dict["transactions"])
+    else:
+        net_invested = account_dict.get("net_invested", 0.0)
+        realized_pnl = account_dict.get("realized_pnl", 0.0)
+        cost_basis = account_dict.get("cost_basis", {})
+    conn.execute('''
+        INSERT INTO accounts (name, balance, strategy, net_invested, realized_pnl)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(name) DO UPDATE SET
+            balance=excluded.balance,
+            strategy=excluded.strategy,
+            net_invested=excluded.net_invested,
+            realized_pnl=excluded.realized_pnl,
+            version=accounts.version + 1
+    ''', (name, account_dict["balance"], account_dict["strategy"], net_invested, realized_pnl))
+    conn.execute('DELETE FROM holdings WHERE name = ?', (name,))
+    conn.executemany(
+        'INSERT INTO holdings (name, symbol, quantity, cost_basis) VALUES (?, ?, ?, ?)',
+        [
+            (name, symbol, quantity, cost_basis.get(symbol, 0.0))
+            for symbol, quantity in account_dict["holdings"].items()
+        ],
+    )
+    if "transactions" in account_dict:
+        conn.execute('DELETE FROM transactions WHERE name = ?', (name,))
+        conn.executemany(
+            'INSERT INTO transactions (name, symbol, quantity, price, timestamp, rationale) VALUES (?, ?, ?, ?, ?, ?)',
+            [
+                (name, t["symbol"], t["quantity"], t["price"], t["timestamp"], t["rationale"])
+                for t in account_dict["transactions"]
+            ],
+        )
+    if "portfolio_value_time_series" in account_dict:
+        conn.execute('DELETE FROM portfolio_values WHERE name = ?', (name,))
+        conn.executemany(
+            'INSERT INTO portfolio_values (name, datetime, value) VALUES (?, ?, ?)',
+            [(name, timestamp, value) for timestamp, value in account_dict["portfolio_value_time_series"]],
+        )
+
 
 def write_account(name, account_dict):
-    json_data = json.dumps(account_dict)
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO accounts (name, account)
-            VALUES (?, ?)
-            ON CONFLICT(name) DO UPDATE SET account=excluded.account
-        ''', (name.lower(), json_data))
-        conn.commit()
+    """
+    Write the account's balance, strategy, holdings and running aggregates.
+    The transactions and portfolio value history are replaced only if they are present in account_dict,
+    in which case the aggregates are recomputed from the transactions.
+    If account_dict has a version, the write only succeeds if the stored account is still at that version;
+    otherwise ConcurrentUpdateError is raised. Every write increments the version.
+    """
+    with transaction() as conn:
+        _check_version(conn, name.lower(), account_dict.get("version"))
+        _write_account(conn, {**account_dict, "name": name})
+
+def create_account(name, account_dict):
+    """Insert a new account unless one with this name already exists"""
+    get_connection().execute('''
+        INSERT INTO accounts (name, balance, strategy)
+        VALUES (?, ?, ?)
+        ON CONFLICT(name) DO NOTHING
+    ''', (name.lower(), account_dict["balance"], account_dict["strategy"]))
 
 def read_account(name):
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT account FROM accounts WHERE name = ?', (name.lower(),))
-        row = cursor.fetchone()
-        return json.loads(row[0]) if row else None
-    
+    """Read the account's balance, strategy, holdings and running aggregates; the history is read separately"""
+    conn = get_connection()
+    row = conn.execute(
+        'SELECT name, balance, strategy, net_invested, realized_pnl, version FROM accounts WHERE name = ?',
+        (name.lower(),),
+    ).fetchone()
+    if not row:
+        return None
+    holdings = conn.execute(
+        'SELECT symbol, quantity, cost_basis FROM holdings WHERE name = ?', (name.lower(),)
+    ).fetchall()
+    return {
+        "name": row[0],
+        "balance": row[1],
+        "strategy": row[2],
+        "holdings": {symbol: quantity for symbol, quantity, _ in holdings},
+        "net_invested": row[3],
+        "realized_pnl": row[4],
+        "cost_basis": {symbol: cost_basis for symbol, _, cost_basis in holdings},
+        "version": row[5],
+    }
+
+def write_trade(name: str, account_dict: dict, symbol: str, transaction_dict: dict) -> None:
+    """
+    Record a trade atomically: append the transaction and write the account's new balance,
+    aggregates and holding for the symbol.
+
+    Args:
+        name (str): The account name
+        account_dict (dict): The account fields after the trade, with the version they were read at
+        symbol (str): The symbol traded; its holding is removed once the quantity reaches 0
+        transaction_dict (dict): The transaction fields
+
+    Raises:
+        ConcurrentUpdateError: If the account has changed since it was read
+    """
+    name = name.lower()
+    a = account_dict
+    t = transaction_dict
+    quantity_held = a["holdings"].get(symbol, 0)
+    with transaction() as conn:
+        _check_version(conn, name, a.get("version"))
+        conn.execute(
+            'UPDATE accounts SET balance = ?, net_invested = ?, realized_pnl = ?, version = version + 1 WHERE name = ?',
+            (a["balance"], a["net_invested"], a["realized_pnl"], name),
+        )
+        if quantity_held:
+            conn.execute('''
+                INSERT INTO holdings (name, symbol, quantity, cost_basis)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(name, symbol) DO UPDATE SET quantity=excluded.quantity, cost_basis=excluded.cost_basis
+            ''', (name, symbol, quantity_held, a["cost_basis"].get(symbol, 0.0)))
+        else:
+            conn.execute('DELETE FROM holdings WHERE name = ? AND symbol = ?', (name, symbol))
+        conn.execute(
+            'INSERT INTO transactions (name, symbol, quantity, price, timestamp, rationale) VALUES (?, ?, ?, ?, ?, ?)',
+            (name, t["symbol"], t["quantity"], t["price"], t["timestamp"], t["rationale"]),
+        )
+
+def read_transactions(name: str, conn: sqlite3.Connection | None = None) -> list[dict]:
+    rows = (conn or get_connection()).execute('''
+        SELECT symbol, quantity, price, timestamp, rationale FROM transactions
+        WHERE name = ?
+        ORDER BY id
+    ''', (name.lower(),)).fetchall()
+    return [
+        {"symbol": symbol, "quantity": quantity, "price": price, "timestamp": timestamp, "rationale": rationale}
+        for symbol, quantity, price, timestamp, rationale in rows
+    ]
+
+def read_recent_transactions(name: str, limit: int) -> tuple[list[dict], int]:
+    """Read the account's last limit transactions, oldest first, and how many transactions it has in all"""
+    conn = get_connection()
+    rows = conn.execute('''
+        SELECT symbol, quantity, price, timestamp, rationale FROM transactions
+        WHERE name = ?
+        ORDER BY id DESC
+        LIMIT ?
+    ''', (name.lower(), limit)).fetchall()
+    count = conn.execute('SELECT COUNT(*) FROM transactions WHERE name = ?', (name.lower(),)).fetchone()[0]
+    transactions = [
+        {"symbol": symbol, "quantity": quantity, "price": price, "timestamp": timestamp, "rationale": rationale}
+        for symbol, quantity, price, timestamp, rationale in reversed(rows)
+    ]
+    return transactions, count
+
+def write_portfolio_value(name: str, timestamp: str, value: float) -> None:
+    """Append a portfolio value point, downsampling the account's older points at most once per PORTFOLIO_COMPACT_EVERY"""
+    name = name.lower()
+    get_connection().execute(
+        'INSERT INTO portfolio_values (name, datetime, value) VALUES (?, ?, ?)', (name, timestamp, value)
+    )
+    now = datetime.now()
+    if now - _last_compaction.get(name, datetime.min) >= PORTFOLIO_COMPACT_EVERY:
+        compact_portfolio_values(name, now)
+        _last_compaction[name] = now
+
+def compact_portfolio_values(name: str, now: datetime | None = None) -> int:
+    """
+    Apply the retention policy to an account's portfolio values.
+
+    Args:
+        name (str): The account name
+        now (datetime): The time the retention ages are measured from; defaults to now
+
+    Returns:
+        int: The number of points removed
+    """
+    now = now or datetime.now()
+    removed = 0
+    tiers = [(PORTFOLIO_RAW_RETENTION, RESOLUTIONS["hourly"]), (PORTFOLIO_HOURLY_RETENTION, RESOLUTIONS["daily"])]
+    with transaction() as conn:
+        for age, bucket in tiers:
+            cutoff = (now - age).strftime(TIMESTAMP_FORMAT)
+            removed += conn.execute('''
+                DELETE FROM portfolio_values
+                WHERE name = ? AND datetime < ? AND id NOT IN (
+                    SELECT MAX(id) FROM portfolio_values
+                    WHERE name = ? AND datetime < ?
+                    GROUP BY substr(datetime, 1, ?)
+                )
+            ''', (name.lower(), cutoff, name.lower(), cutoff, bucket)).rowcount
+    return removed
+
+def read_portfolio_values(name: str, since: str | None = None, resolution: str = "raw") -> list[tuple[str, float]]:
+    """
+    Read an account's portfolio values in time order.
+
+    Args:
+        name (str): The account name
+        since (str): Only return points at or after this timestamp
+        resolution (str): "raw" for every stored point, or "hourly" / "daily" for the last value in each period
+
+    Returns:
+        list: A list of (datetime, value) tuples
+    """
+    return [(timestamp, value) for timestamp, value, _ in _read_portfolio_values(get_connection(), name, since, resolution)]
+
+def _read_portfolio_values(conn, name: str, since: str | None, resolution: str) -> list[tuple[str, float, int]]:
+    """The (datetime, value, id) of an account's portfolio values in time order, read through its (name, datetime) index"""
+    since = since or ""
+    bucket = RESOLUTIONS[resolution]
+    if bucket is None:
+        return conn.execute('''
+            SELECT datetime, value, id FROM portfolio_values
+            WHERE name = ? AND datetime >= ?
+            ORDER BY datetime, id
+        ''', (name.lower(), since)).fetchall()
+    return conn.execute('''
+        SELECT datetime, value, id FROM portfolio_values
+        WHERE id IN (
+            SELECT MAX(id) FROM portfolio_values
+            WHERE name = ? AND datetime >= ?
+            GROUP BY substr(datetime, 1, ?)
+        )
+        ORDER BY datetime, id
+    ''', (name.lower(), since, bucket)).fetchall()
+
+def read_first_portfolio_value_time(name: str) -> str | None:
+    row = get_connection().execute(
+        'SELECT MIN(datetime) FROM portfolio_values WHERE name = ?', (name.lower(),)
+    ).fetchone()
+    return row[0]
+
+def _names_clause(names: list[str] | None, column: str = "name") -> tuple[str, list[str]]:
+    if names is None:
+        return "", []
+    return f"AND {column} IN ({','.join('?' * len(names))})", [name.lower() for name in names]
+
+def read_all_portfolio_values(names: list[str] | None = None, since: str | None = None, resolution: str = "raw") -> list[tuple[str, str, float]]:
+    """
+    Read the portfolio values of many accounts, for analytics across traders.
+    Each account is read through its own index range: grouping the whole table at once is slower than that.
+
+    Args:
+        names (list): The account names, or None for every account
+        since (str): Only return points at or after this timestamp
+        resolution (str): "raw" for every stored point, or "hourly" / "daily" for the last value in each period
+
+    Returns:
+        list: A list of (name, datetime, value) tuples in time order
+    """
+    conn = get_connection()
+    if names is None:
+        names = [row[0] for row in conn.execute('SELECT DISTINCT name FROM portfolio_values')]
+    rows = []
+    for name in names:
+        rows.extend((name.lower(), *row) for row in _read_portfolio_values(conn, name, since, resolution))
+    rows.sort(key=lambda row: (row[1], row[3]))
+    return [row[:3] for row in rows]
+
+def read_all_transactions(names: list[str] | None = None, since: str | None = None) -> list[tuple[str, str, int, float, str]]:
+    """Read the (name, symbol, quantity, price, timestamp) of many accounts' transactions in one query"""
+    clause, params = _names_clause(names)
+    return get_connection().execute(f'''
+        SELECT name, symbol, quantity, price, timestamp FROM transactions
+        WHERE timestamp >= ? {clause}
+        ORDER BY id
+    ''', (since or "", *params)).fetchall()
+
+def read_all_positions(names: list[str] | None = None) -> list[tuple[str, float, str | None, int | None]]:
+    """Read the (name, balance, symbol, quantity) of many accounts' holdings in one query, with a row for cash-only accounts"""
+    clause, params = _names_clause(names, "accounts.name")
+    return get_connection().execute(f'''
+        SELECT accounts.name, balance, symbol, quantity FROM accounts
+        LEFT JOIN holdings ON holdings.name = accounts.name AND quantity != 0
+        WHERE 1 = 1 {clause}
+    ''', params).fetchall()
+
+def write_traders(traders: list[dict], replace: bool = False) -> None:
+    """
+    Add or update traders in the registry.
+
+    Args:
+        traders (list): Dicts with name, model_name and optionally lastname, every_minutes and enabled
+        replace (bool): Remove every trader not in the list
+    """
+    with transaction() as conn:
+        if replace:
+            conn.execute('DELETE FROM traders')
+        conn.executemany('''
+            INSERT INTO traders (name, lastname, model_name, every_minutes, enabled) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET lastname=excluded.lastname, model_name=excluded.model_name,
+                every_minutes=excluded.every_minutes, enabled=excluded.enabled
+        ''', [
+            (t["name"], t.get("lastname", ""), t["model_name"], t.get("every_minutes"), int(t.get("enabled", True)))
+            for t in traders
+        ])
+
+def read_traders(enabled_only: bool = True) -> list[dict]:
+    """The traders in the registry, in the order they were added"""
+    rows = get_connection().execute(f'''
+        SELECT name, lastname, model_name, every_minutes, enabled FROM traders
+        {"WHERE enabled = 1" if enabled_only else ""}
+        ORDER BY rowid
+    ''').fetchall()
+    return [
+        {"name": name, "lastname": lastname, "model_name": model_name, "every_minutes": every_minutes, "enabled": bool(enabled)}
+        for name, lastname, model_name, every_minutes, enabled in rows
+    ]
+
+class LogWriter:
+    """
+    Background sink for log rows: write() is an in-memory append, and a flusher thread
+    coalesces the queued rows into executemany batches so callers never wait on the disk
+    """
+
+    _STOP = object()
+
+    def __init__(self, batch_size: int = LOG_BATCH_SIZE, flush_seconds: float = LOG_FLUSH_SECONDS):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._last_prune = float("-inf")
+
+    def _running(self) -> bool:
+        return self._thread is not None and self._pid == os.getpid() and self._thread.is_alive()
+
+    def _ensure_started(self) -> None:
+        # Also restarts the thread in a forked child, which inherits the object but not the thread,
+        # and if the thread has died, in which case the rows it left queued are still written
+        if not self._running():
+            with self._lock:
+                if not self._running():
+                    if self._pid != os.getpid():
+                        self._queue = queue.SimpleQueue()
+                    self._pid = os.getpid()
+                    self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                    self._thread.start()
+
+    def write(self, name: str, type: str, message: str) -> None:
+        self._ensure_started()
+        timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        self._queue.put((name.lower(), timestamp, type, message))
+
+    def flush(self, timeout: float | None = 10) -> None:
+        """Block until every row written before this call is committed"""
+        if not self._running():
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def shutdown(self, timeout: float | None = 10) -> None:
+        """Drain the queue and stop the flusher thread"""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        with self._lock:
+            self._queue.put(self._STOP)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _write_batch(self, batch: list) -> None:
+        if batch:
+            with transaction() as conn:
+                conn.executemany(
+                    "INSERT INTO logs (name, datetime, type, message) VALUES (?, ?, ?, ?)", batch
+                )
+            batch.clear()
+
+    def _write_or_drop(self, batch: list) -> None:
+        """Write the batch, retrying it once, e.g. when another process held the database lock past the busy timeout"""
+        for attempt in range(2):
+            try:
+                self._write_batch(batch)
+                return
+            except Exception as e:
+                if attempt:
+                    print(f"Dropped {len(batch)} log rows: {e}")
+                    batch.clear()
+                else:
+                    print(f"Failed to write {len(batch)} log rows, retrying: {e}")
+                    time.sleep(self.flush_seconds)
+
+    def _prune(self) -> None:
+        if time.monotonic() - self._last_prune >= LOG_PRUNE_EVERY_SECONDS:
+            self._last_prune = time.monotonic()
+            try:
+                prune_logs()
+            except Exception as e:
+                print(f"Failed to prune logs: {e}")
+
+    def _run(self) -> None:
+        batch = []
+        waiters = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if isinstance(item, tuple):
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_seconds
+                if len(batch) < self.batch_size and time.monotonic() < deadline:
+                    continue
+            elif isinstance(item, threading.Event):
+                waiters.append(item)
+            # Nothing a batch raises ends the thread, which would leave the queue growing and flush() waiting
+            try:
+                self._write_or_drop(batch)
+                self._prune()
+            finally:
+                deadline = None
+                for waiter in waiters:
+                    waiter.set()
+                waiters.clear()
+            if item is self._STOP:
+                close_connection()
+                return
+
+
+_log_writer = LogWriter()
+atexit.register(_log_writer.shutdown)
+
+
 def write_log(name: str, type: str, message: str):
     """
-    Write a log entry to the logs table.
-    
+    Write a log entry to the logs table. The row is queued and committed by the background log writer.
+
     Args:
         name (str): The name associated with the log
         type (str): The type of log entry
         message (str): The log message
     """
-    now = datetime.now().isoformat()
-    
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO logs (name, datetime, type, message)
-            VALUES (?, datetime('now'), ?, ?)
-        ''', (name.lower(), type, message))
-        conn.commit()
+    _log_writer.write(name, type, message)
+
+def flush_logs():
+    """Wait until all queued log entries have been written"""
+    _log_writer.flush()
+
+def close_logs():
+    """Write any queued log entries and stop the background log writer"""
+    _log_writer.shutdown()
+
+def use_database(path: str) -> None:
+    """Point this process at another database file, finishing with the current one first"""
+    global DB, _schema_ready
+    close_logs()
+    close_connection()
+    DB = path
+    _schema_ready = False
 
 def read_log(name: str, last_n=10):
     """
     Read the most recent log entries for a given name.
-    
+
     Args:
         name (str): The name to retrieve logs for
         last_n (int): Number of most recent entries to retrieve
-        
+
     Returns:
         list: A list of tuples containing (datetime, type, message)
     """
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT datetime, type, message FROM logs 
-            WHERE name = ? 
-            ORDER BY datetime DESC
-            LIMIT ?
-        ''', (name.lower(), last_n))
-        
-        return reversed(cursor.fetchall())
+    flush_logs()
+    rows = get_connection().execute('''
+        SELECT datetime, type, message FROM logs
+        WHERE name = ?
+        ORDER BY id DESC
+        LIMIT ?
+    ''', (name.lower(), last_n)).fetchall()
+    return reversed(rows)
+
+def read_log_since(name: str, last_id: int = 0, limit: int = 100):
+    """
+    Read the log entries for a given name written after the entry with id last_id,
+    so a caller tailing the log only fetches new rows.
+
+    Args:
+        name (str): The name to retrieve logs for
+        last_id (int): The id of the last entry already seen; 0 to start from the most recent entries
+        limit (int): The maximum number of entries to return; if more are available, the most recent are returned
+
+    Returns:
+        list: A list of tuples containing (id, datetime, type, message) in the order written
+    """
+    flush_logs()
+    rows = get_connection().execute('''
+        SELECT id, datetime, type, message FROM logs
+        WHERE name = ? AND id > ?
+        ORDER BY id DESC
+        LIMIT ?
+    ''', (name.lower(), last_id, limit)).fetchall()
+    return rows[::-1]
+
+def prune_logs(keep: int = LOG_RETENTION_ROWS) -> int:
+    """
+    Delete all but the most recent keep log entries for each name.
+
+    Returns:
+        int: The number of entries deleted
+    """
+    conn = get_connection()
+    deleted = 0
+    for (name,) in conn.execute('SELECT DISTINCT name FROM logs').fetchall():
+        row = conn.execute(
+            'SELECT id FROM logs WHERE name = ? ORDER BY id DESC LIMIT 1 OFFSET ?', (name, keep)
+        ).fetchone()
+        if row:
+            deleted += conn.execute('DELETE FROM logs WHERE name = ? AND id <= ?', (name, row[0])).rowcount
+    return deleted
+
+def data_version() -> int:
+    """A number that changes whenever another connection commits to the database, cheap enough to poll often"""
+    return get_connection().execute('PRAGMA data_version').fetchone()[0]
+
+def _read_change_marker(conn: sqlite3.Connection, name: str, version: int) -> tuple[int, int, int]:
+    last_log = conn.execute('SELECT MAX(id) FROM logs WHERE name = ?', (name,)).fetchone()[0]
+    last_value = conn.execute(
+        'SELECT id FROM portfolio_values WHERE name = ? ORDER BY datetime DESC LIMIT 1', (name,)
+    ).fetchone()
+    return version, last_log or 0, last_value[0] if last_value else 0
+
+def read_change_markers() -> dict[str, tuple[int, int, int]]:
+    """
+    For each account, the values that move when something shown about it changes:
+    its version, the id of its latest log entry and the id of its latest portfolio value.
+
+    Returns:
+        dict: The name of each account mapped to (version, last log id, last portfolio value id)
+    """
+    conn = get_connection()
+    return {
+        name: _read_change_marker(conn, name, version)
+        for name, version in conn.execute('SELECT name, version FROM accounts').fetchall()
+    }
+
+def read_change_marker(name: str) -> tuple[int, int, int] | None:
+    """The (version, last log id, last portfolio value id) of one account, or None if it doesn't exist"""
+    conn = get_connection()
+    row = conn.execute('SELECT version FROM accounts WHERE name = ?', (name.lower(),)).fetchone()
+    return _read_change_marker(conn, name.lower(), row[0]) if row else None
+
+def _write_market(conn: sqlite3.Connection, date: str, data: dict) -> None:
+    conn.execute('DELETE FROM market_prices WHERE date = ?', (date,))
+    conn.executemany(
+        'INSERT INTO market_prices (date, symbol, price) VALUES (?, ?, ?)',
+        [(date, symbol, price) for symbol, price in data.items() if price is not None],
+    )
 
 def write_market(date: str, data: dict) -> None:
-    data_json = json.dumps(data)
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO market (date, data)
-            VALUES (?, ?)
-            ON CONFLICT(date) DO UPDATE SET data=excluded.data
-        ''', (date, data_json))
-        conn.commit()
+    """Store the prices for a date as one indexed row per symbol, replacing any already stored"""
+    with transaction() as conn:
+        _write_market(conn, date, data)
+
+def has_market(date: str) -> bool:
+    return get_connection().execute('SELECT 1 FROM market_prices WHERE date = ? LIMIT 1', (date,)).fetchone() is not None
+
+def read_market_prices(date: str, symbols: list[str]) -> dict[str, float]:
+    """Look up the prices of the given symbols for a date, using the (date, symbol) primary key"""
+    prices = {}
+    conn = get_connection()
+    # Stay well inside SQLite's limit on the number of bound parameters
+    for i in range(0, len(symbols), 500):
+        chunk = symbols[i : i + 500]
+        placeholders = ",".join("?" * len(chunk))
+        prices.update(conn.execute(
+            f'SELECT symbol, price FROM market_prices WHERE date = ? AND symbol IN ({placeholders})',
+            (date, *chunk),
+        ).fetchall())
+    return prices
 
 def read_market(date: str) -> dict | None:
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT data FROM market WHERE date = ?', (date,))
-        row = cursor.fetchone()
-        return json.loads(row[0]) if row else None
\ No newline at end of file
+    rows = get_connection().execute('SELECT symbol, price FROM market_prices WHERE date = ?', (date,)).fetchall()
+    return dict(rows) if rows else None
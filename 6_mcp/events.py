@@ -0,0 +1,122 @@
+import asyncio
+import threading
+from collections import defaultdict
+from database import data_version, read_change_markers
+
+# How often the watcher asks SQLite whether anything has been committed
+WATCH_INTERVAL_SECONDS = 0.25
+
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class EventBus:
+    """
+    Counts the change events published on each topic and wakes up whoever is waiting for the next one.
+    Events can be published from any thread and awaited from any event loop.
+    Waiters only see the latest count, so a burst of changes wakes each of them once.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: dict[str, int] = defaultdict(int)
+        self._waiters: dict[str, list[tuple[asyncio.AbstractEventLoop, asyncio.Future]]] = defaultdict(list)
+
+    def count(self, topic: str) -> int:
+        with self._lock:
+            return self._counts[topic]
+
+    def publish(self, topic: str) -> None:
+        with self._lock:
+            self._counts[topic] += 1
+            waiters = self._waiters.pop(topic, [])
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+    async def wait(self, topic: str, seen: int, timeout: float | None = None) -> int:
+        """Wait until the topic's count has moved past seen, or the timeout expires; return the current count"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if self._counts[topic] != seen:
+                return self._counts[topic]
+            self._waiters[topic].append((loop, future))
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                if (loop, future) in self._waiters.get(topic, []):
+                    self._waiters[topic].remove((loop, future))
+        return self.count(topic)
+
+
+# Published once for every batch of changes to any account, for views that cover all the traders
+ACCOUNTS_TOPIC = "accounts"
+
+
+def account_topic(name: str) -> str:
+    return f"account:{name.lower()}"
+
+
+def log_topic(name: str) -> str:
+    return f"log:{name.lower()}"
+
+
+class DatabaseWatcher:
+    """
+    Turns database commits from any process into events on the bus.
+    A background thread polls PRAGMA data_version, and only when it moves reads each account's change markers,
+    publishing account events when the version or portfolio values change and log events when new logs arrive.
+    """
+
+    def __init__(self, bus: EventBus, interval: float = WATCH_INTERVAL_SECONDS):
+        self.bus = bus
+        self.interval = interval
+        self._markers: dict[str, tuple[int, int, int]] = {}
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def check(self) -> None:
+        markers = read_change_markers()
+        accounts_changed = False
+        for name, (version, last_log, last_value) in markers.items():
+            previous = self._markers.get(name)
+            if previous is None or (version, last_value) != (previous[0], previous[2]):
+                self.bus.publish(account_topic(name))
+                accounts_changed = True
+            if previous is None or last_log != previous[1]:
+                self.bus.publish(log_topic(name))
+        if accounts_changed:
+            self.bus.publish(ACCOUNTS_TOPIC)
+        self._markers = markers
+
+    def _run(self) -> None:
+        last_version = None
+        while not self._stop.is_set():
+            try:
+                version = data_version()
+                if version != last_version:
+                    last_version = version
+                    self.check()
+            except Exception as e:
+                print(f"Database watcher failed to check for changes: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="database-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+
+bus = EventBus()
+watcher = DatabaseWatcher(bus)
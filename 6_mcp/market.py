@@ -1,30 +1,219 @@
 from polygon import RESTClient
 from dotenv import load_dotenv
 import os
+import threading
+import time
 from datetime import datetime
 import random
-from database import write_market, read_market
+from database import write_market, has_market, read_market_prices
 from functools import lru_cache
-from datetime import timezone
+from datetime import date, time as dtime, timedelta, timezone
+from typing import Callable
+from zoneinfo import ZoneInfo
 
 load_dotenv(override=True)
 
 polygon_api_key = os.getenv("POLYGON_API_KEY")
 polygon_plan = os.getenv("POLYGON_PLAN")
+polygon_base_url = os.getenv("POLYGON_BASE_URL", "https://api.polygon.io")
 
 is_paid_polygon = polygon_plan == "paid"
 is_realtime_polygon = polygon_plan == "realtime"
 
+# How long a looked-up price is reused: end of day prices only change once a day,
+# the paid plan's snapshots are on a 15 minute delay, and realtime prices go stale quickly
+if is_realtime_polygon:
+    default_price_ttl = 2
+elif is_paid_polygon:
+    default_price_ttl = 60
+else:
+    default_price_ttl = 3600
+PRICE_TTL_SECONDS = float(os.getenv("PRICE_TTL_SECONDS", default_price_ttl))
+
+
+class PriceCache:
+    """Thread-safe in-process cache of share prices, each entry expiring ttl seconds after it was fetched"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._prices: dict[str, tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, symbols: list[str]) -> tuple[dict[str, float], list[str]]:
+        """Return the fresh cached prices and the list of symbols that need fetching"""
+        now = time.monotonic()
+        found, missing = {}, []
+        with self._lock:
+            for symbol in symbols:
+                entry = self._prices.get(symbol)
+                if entry and now - entry[1] < self.ttl:
+                    found[symbol] = entry[0]
+                else:
+                    missing.append(symbol)
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def put_many(self, prices: dict[str, float]) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for symbol, price in prices.items():
+                self._prices[symbol] = (price, now)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._prices.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._prices),
+            }
+
+
+price_cache = PriceCache(PRICE_TTL_SECONDS)
+
+# When set, prices are looked up here instead of from the market, as the backtest does to replay history
+price_source: Callable[[list[str]], dict[str, float]] | None = None
+
+
+@lru_cache(maxsize=1)
+def get_client() -> RESTClient:
+    """The Polygon client shared by every call in this process, so its connection pool is reused"""
+    return RESTClient(polygon_api_key, base=polygon_base_url)
+
+
+MARKET_TIMEZONE = ZoneInfo("America/New_York")
+REGULAR_OPEN = dtime(9, 30)
+REGULAR_CLOSE = dtime(16, 0)
+# Polygon's live status is only checked within this many seconds of a scheduled open or close,
+# and each answer is reused for STATUS_TTL_SECONDS
+STATUS_WINDOW_SECONDS = 300
+STATUS_TTL_SECONDS = 60
+HOLIDAYS_TTL_SECONDS = 24 * 60 * 60
+
+
+class MarketCalendar:
+    """
+    Answers whether the market is open, and when it next opens or closes, from the regular schedule:
+    weekdays 9:30 to 16:00 New York time, less the holidays and early closes fetched from Polygon once a day.
+    Polygon's live market status is only asked for near a scheduled open or close, to catch anything
+    the schedule gets wrong there; everywhere else no network call is made.
+    """
+
+    def __init__(self):
+        self.status_calls = 0
+        self._lock = threading.Lock()
+        self._holidays: dict[date, tuple[datetime, datetime] | None] = {}
+        self._holidays_fetched = float("-inf")
+        self._status: tuple[bool, float] | None = None
+
+    def _refresh_holidays(self) -> None:
+        if not polygon_api_key or time.monotonic() - self._holidays_fetched < HOLIDAYS_TTL_SECONDS:
+            return
+        self._holidays_fetched = time.monotonic()
+        try:
+            holidays = {}
+            for holiday in get_client().get_market_holidays():
+                if holiday.exchange != "NYSE":
+                    continue
+                day = date.fromisoformat(holiday.date)
+                if holiday.status == "early-close" and holiday.open and holiday.close:
+                    holidays[day] = (
+                        datetime.fromisoformat(holiday.open.replace("Z", "+00:00")).astimezone(MARKET_TIMEZONE),
+                        datetime.fromisoformat(holiday.close.replace("Z", "+00:00")).astimezone(MARKET_TIMEZONE),
+                    )
+                else:
+                    holidays[day] = None
+            self._holidays = holidays
+        except Exception as e:
+            print(f"Was not able to fetch market holidays due to {e}; using the regular schedule")
+
+    def session(self, day: date) -> tuple[datetime, datetime] | None:
+        """The open and close times on a day, or None if the market doesn't open"""
+        if day.weekday() >= 5:
+            return None
+        if day in self._holidays:
+            return self._holidays[day]
+        return datetime.combine(day, REGULAR_OPEN, MARKET_TIMEZONE), datetime.combine(day, REGULAR_CLOSE, MARKET_TIMEZONE)
+
+    def _now(self, now: datetime | None) -> datetime:
+        return (now or datetime.now(timezone.utc)).astimezone(MARKET_TIMEZONE)
+
+    def _scheduled_open(self, now: datetime) -> bool:
+        session = self.session(now.date())
+        return session is not None and session[0] <= now < session[1]
+
+    def next_open(self, now: datetime | None = None) -> datetime:
+        now = self._now(now)
+        with self._lock:
+            self._refresh_holidays()
+            for offset in range(15):
+                session = self.session(now.date() + timedelta(days=offset))
+                if session and session[0] > now:
+                    return session[0]
+        raise RuntimeError("No market session found in the next two weeks")
+
+    def next_close(self, now: datetime | None = None) -> datetime:
+        now = self._now(now)
+        with self._lock:
+            self._refresh_holidays()
+            for offset in range(15):
+                session = self.session(now.date() + timedelta(days=offset))
+                if session and session[1] > now:
+                    return session[1]
+        raise RuntimeError("No market session found in the next two weeks")
+
+    def is_open(self, now: datetime | None = None) -> bool:
+        now = self._now(now)
+        with self._lock:
+            self._refresh_holidays()
+            scheduled = self._scheduled_open(now)
+            session = self.session(now.date())
+            near = session is not None and any(
+                abs((transition - now).total_seconds()) <= STATUS_WINDOW_SECONDS for transition in session
+            )
+            if not near or not polygon_api_key:
+                return scheduled
+            if self._status and time.monotonic() - self._status[1] < STATUS_TTL_SECONDS:
+                return self._status[0]
+            try:
+                self.status_calls += 1
+                is_open = get_client().get_market_status().market == "open"
+            except Exception as e:
+                print(f"Was not able to fetch the market status due to {e}; using the schedule")
+                is_open = scheduled
+            self._status = (is_open, time.monotonic())
+            return is_open
+
+    def seconds_until_open(self, now: datetime | None = None) -> float:
+        """0 if the market is open, otherwise how long until its next scheduled open"""
+        now = self._now(now)
+        if self.is_open(now):
+            return 0.0
+        if self._scheduled_open(now):
+            # Polygon says closed when the schedule says open, around the open or on an unscheduled closure
+            return STATUS_TTL_SECONDS
+        return max(0.0, (self.next_open(now) - now).total_seconds())
+
+
+market_calendar = MarketCalendar()
+
 
 def is_market_open() -> bool:
-    client = RESTClient(polygon_api_key)
-    market_status = client.get_market_status()
-    return market_status.market == "open"
+    return market_calendar.is_open()
 
 
 def get_all_share_prices_polygon_eod() -> dict[str, float]:
     """With much thanks to student Reema R. for fixing the timezone issue with this!"""
-    client = RESTClient(polygon_api_key)
+    client = get_client()
 
     probe = client.get_previous_close_agg("SPY")[0]
     last_close = datetime.fromtimestamp(probe.timestamp / 1000, tz=timezone.utc).date()
@@ -34,37 +223,51 @@ def get_all_share_prices_polygon_eod() -> dict[str, float]:
 
 
 @lru_cache(maxsize=2)
-def get_market_for_prior_date(today):
-    market_data = read_market(today)
-    if not market_data:
-        market_data = get_all_share_prices_polygon_eod()
-        write_market(today, market_data)
-    return market_data
+def load_market_for_prior_date(today) -> None:
+    """Fetch and store the prior close for every symbol, once per day"""
+    if not has_market(today):
+        write_market(today, get_all_share_prices_polygon_eod())
 
 
-def get_share_price_polygon_eod(symbol) -> float:
+def get_share_prices_polygon_eod(symbols: list[str]) -> dict[str, float]:
     today = datetime.now().date().strftime("%Y-%m-%d")
-    market_data = get_market_for_prior_date(today)
-    return market_data.get(symbol, 0.0)
+    load_market_for_prior_date(today)
+    prices = read_market_prices(today, symbols)
+    return {symbol: prices.get(symbol, 0.0) for symbol in symbols}
 
 
-def get_share_price_polygon_min(symbol) -> float:
-    client = RESTClient(polygon_api_key)
-    result = client.get_snapshot_ticker("stocks", symbol)
-    return result.min.close or result.prev_day.close
+def get_share_prices_polygon_min(symbols: list[str]) -> dict[str, float]:
+    """One multi-ticker snapshot request for all the symbols"""
+    results = get_client().get_snapshot_all("stocks", tickers=symbols)
+    prices = {result.ticker: result.min.close or result.prev_day.close for result in results}
+    return {symbol: prices.get(symbol, 0.0) for symbol in symbols}
 
 
-def get_share_price_polygon(symbol) -> float:
+def get_share_prices_polygon(symbols: list[str]) -> dict[str, float]:
     if is_paid_polygon:
-        return get_share_price_polygon_min(symbol)
+        return get_share_prices_polygon_min(symbols)
     else:
-        return get_share_price_polygon_eod(symbol)
+        return get_share_prices_polygon_eod(symbols)
 
 
-def get_share_price(symbol) -> float:
-    if polygon_api_key:
+def get_share_prices(symbols) -> dict[str, float]:
+    """Look up the prices of several symbols, fetching any that aren't freshly cached with a single market data call"""
+    symbols = list(dict.fromkeys(symbols))
+    if price_source:
+        return price_source(symbols)
+    if not polygon_api_key:
+        return {symbol: float(random.randint(1, 100)) for symbol in symbols}
+    prices, missing = price_cache.get_many(symbols)
+    if missing:
         try:
-            return get_share_price_polygon(symbol)
+            fetched = get_share_prices_polygon(missing)
+            price_cache.put_many(fetched)
+            prices.update(fetched)
         except Exception as e:
-            print(f"Was not able to use the polygon API due to {e}; using a random number")
-    return float(random.randint(1, 100))
+            print(f"Was not able to use the polygon API due to {e}; using random numbers")
+            prices.update({symbol: float(random.randint(1, 100)) for symbol in missing})
+    return prices
+
+
+def get_share_price(symbol) -> float:
+    return get_share_prices([symbol])[symbol]
@@ -21,8 +21,10 @@ else:
 
 # The full set of MCP servers for the trader: Accounts, Push Notification and the Market
 
+accounts_mcp = {"command": "uv", "args": ["run", "accounts_server.py"]}
+
 trader_mcp_server_params = [
-    {"command": "uv", "args": ["run", "accounts_server.py"]},
+    accounts_mcp,
     {"command": "uv", "args": ["run", "push_server.py"]},
     market_mcp,
 ]
@@ -0,0 +1,143 @@
+import asyncio
+import json
+from contextlib import AbstractAsyncContextManager, asynccontextmanager
+from agents.mcp import MCPServerStdio
+
+CLIENT_SESSION_TIMEOUT_SECONDS = 120
+HEALTH_CHECK_TIMEOUT_SECONDS = 10
+
+
+class OwnedConnection:
+    """
+    A connection that stays open until closed.
+    A dedicated task opens and closes it, as the stdio transport must be
+    entered and exited by the same task, while any task may use it in between.
+    Subclasses provide connect(), a context manager that is open for as long as the connection is.
+    """
+
+    label = "connection"
+
+    def __init__(self):
+        self._ready = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._error: BaseException | None = None
+        self._task: asyncio.Task | None = None
+
+    def connect(self) -> AbstractAsyncContextManager:
+        raise NotImplementedError
+
+    async def _run(self) -> None:
+        try:
+            async with self.connect():
+                self._ready.set()
+                await self._closing.wait()
+        except Exception as e:
+            self._error = e
+        finally:
+            self._ready.set()
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+        await self._ready.wait()
+        if self._task.done():
+            raise RuntimeError(f"Could not start {self.label}: {self._error}")
+
+    @property
+    def alive(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def close(self) -> None:
+        self._closing.set()
+        if self._task:
+            await self._task
+
+
+class PooledServer(OwnedConnection):
+    """An MCP server that stays connected until closed"""
+
+    def __init__(self, params: dict):
+        super().__init__()
+        self.params = params
+        self.label = f"MCP server {params['command']} {params['args']}"
+        self.server = MCPServerStdio(
+            params, client_session_timeout_seconds=CLIENT_SESSION_TIMEOUT_SECONDS, cache_tools_list=True
+        )
+
+    @asynccontextmanager
+    async def connect(self):
+        try:
+            await self.server.connect()
+            yield
+        finally:
+            try:
+                await self.server.cleanup()
+            except Exception:
+                pass
+
+    async def is_healthy(self) -> bool:
+        if not self.alive or self.server.session is None:
+            return False
+        try:
+            await asyncio.wait_for(self.server.session.send_ping(), HEALTH_CHECK_TIMEOUT_SECONDS)
+            return True
+        except Exception:
+            return False
+
+
+class MCPServerPool:
+    """
+    Starts each distinct MCP server once and shares it between traders and across runs.
+    Servers are keyed by their launch parameters, so stateless servers with identical parameters are
+    shared by everyone, while servers whose parameters carry per-trader state (like the memory database path)
+    naturally get one instance per trader.
+    """
+
+    def __init__(self):
+        self._servers: dict[str, PooledServer] = {}
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def key(params: dict) -> str:
+        return json.dumps(params, sort_keys=True)
+
+    async def get(self, params: dict) -> MCPServerStdio:
+        key = self.key(params)
+        async with self._lock:
+            if key not in self._servers:
+                pooled = PooledServer(params)
+                await pooled.start()
+                self._servers[key] = pooled
+            return self._servers[key].server
+
+    async def get_all(self, params_list: list[dict]) -> list[MCPServerStdio]:
+        return [await self.get(params) for params in params_list]
+
+    async def health_check(self) -> None:
+        """Ping every server, restarting any that have died or stopped responding"""
+        async with self._lock:
+            for key, pooled in list(self._servers.items()):
+                if not await pooled.is_healthy():
+                    print(f"Restarting MCP server {pooled.params['command']} {pooled.params['args']}")
+                    await pooled.close()
+                    del self._servers[key]
+                    replacement = PooledServer(pooled.params)
+                    try:
+                        await replacement.start()
+                        self._servers[key] = replacement
+                    except Exception as e:
+                        print(e)
+
+    async def close(self) -> None:
+        async with self._lock:
+            for pooled in self._servers.values():
+                await pooled.close()
+            self._servers.clear()
+
+    def __len__(self) -> int:
+        return len(self._servers)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
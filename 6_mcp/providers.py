@@ -0,0 +1,316 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from contextlib import asynccontextmanager
+from functools import lru_cache
+import httpx
+from openai import APIConnectionError, APIStatusError, AsyncOpenAI, DefaultAsyncHttpxClient, RateLimitError
+from agents import Model, OpenAIChatCompletionsModel, OpenAIResponsesModel
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+# Where each provider is, the environment variable with its key, and its default requests and tokens per minute;
+# override the limits with e.g. DEEPSEEK_RPM=100 and DEEPSEEK_TPM=500000
+PROVIDERS = {
+    "openai": {"base_url": None, "api_key": "OPENAI_API_KEY", "rpm": 500, "tpm": 200_000},
+    "openrouter": {"base_url": "https://openrouter.ai/api/v1", "api_key": "OPENROUTER_API_KEY", "rpm": 200, "tpm": 1_000_000},
+    "deepseek": {"base_url": "https://api.deepseek.com/v1", "api_key": "DEEPSEEK_API_KEY", "rpm": 600, "tpm": 1_000_000},
+    "grok": {"base_url": "https://api.x.ai/v1", "api_key": "GROK_API_KEY", "rpm": 480, "tpm": 1_000_000},
+    "gemini": {"base_url": "https://generativelanguage.googleapis.com/v1beta/openai/", "api_key": "GOOGLE_API_KEY", "rpm": 1000, "tpm": 1_000_000},
+}
+
+# How many model requests may be in flight at once for each provider, across every worker process;
+# override per provider with e.g. DEEPSEEK_MAX_CONCURRENT=8
+DEFAULT_MAX_CONCURRENT = int(os.getenv("PROVIDER_MAX_CONCURRENT", "16"))
+REQUEST_TIMEOUT_SECONDS = 120
+# The token buckets hold this many seconds' worth of quota, so requests are spread out rather than sent in bursts
+BURST_SECONDS = 1
+# On a 429 the provider's rate is halved, down to this fraction of its limit, and recovers a little with each success
+MIN_RATE_FACTOR = 0.1
+RATE_RECOVERY = 0.02
+MAX_RATE_LIMIT_RETRIES = 5
+# Dropped connections, timeouts and server errors are retried this many times, as the OpenAI client does by default
+MAX_TRANSIENT_RETRIES = 2
+BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 60.0
+
+
+def provider_for(model_name: str) -> str:
+    if "/" in model_name:
+        return "openrouter"
+    elif "deepseek" in model_name:
+        return "deepseek"
+    elif "grok" in model_name:
+        return "grok"
+    elif "gemini" in model_name:
+        return "gemini"
+    else:
+        return "openai"
+
+
+def is_transient(error: Exception) -> bool:
+    """The errors other than 429s that the OpenAI client retries by default: dropped connections, timeouts, 408, 409 and 5xx"""
+    if isinstance(error, APIConnectionError):
+        return True
+    return isinstance(error, APIStatusError) and (error.status_code in (408, 409) or error.status_code >= 500)
+
+
+def max_concurrent(provider: str) -> int:
+    return int(os.getenv(f"{provider.upper()}_MAX_CONCURRENT", DEFAULT_MAX_CONCURRENT))
+
+
+def per_minute(provider: str, kind: str) -> float:
+    return float(os.getenv(f"{provider.upper()}_{kind.upper()}", PROVIDERS[provider][kind]))
+
+
+def estimate_tokens(system_instructions: str | None, input) -> int:
+    """A rough count of the prompt tokens, at about 4 characters per token, to reserve before a request"""
+    text = input if isinstance(input, str) else json.dumps(input, default=str)
+    return (len(system_instructions or "") + len(text)) // 4
+
+
+class TokenBucket:
+    """Refills at rate per minute, scaled by the provider's current rate factor, holding up to BURST_SECONDS of quota"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.capacity = rate * BURST_SECONDS / 60
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self, amount: float, factor: float) -> float:
+        now = time.monotonic()
+        refill = self.rate * factor / 60
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * refill)
+        self.updated = now
+        # A request larger than the whole bucket goes through once the bucket is full, leaving it in debt
+        needed = min(amount, self.capacity)
+        return 0.0 if self.tokens >= needed else (needed - self.tokens) / refill
+
+    def take(self, amount: float) -> None:
+        self.tokens -= amount
+
+
+class ProviderMetrics:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.latency_seconds = 0.0
+        self.waiting_seconds = 0.0
+
+    def snapshot(self, rate_factor: float) -> dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "rate_limited": self.rate_limited,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "mean_latency_seconds": self.latency_seconds / self.requests if self.requests else 0.0,
+            "waiting_seconds": self.waiting_seconds,
+            "rate_factor": rate_factor,
+        }
+
+
+class ProviderLimiter:
+    """
+    Admission control for one provider: a semaphore caps the requests in flight, and token buckets
+    keep requests and tokens per minute within the provider's limits.
+    The semaphore may be a multiprocessing semaphore shared by every worker process, in which case each worker
+    gets an equal share of the per-minute limits. Waiting polls rather than blocking, so it never ties up the event loop.
+    On a 429 the rate is cut back and the request retried after a backoff; it recovers gradually as requests succeed.
+    """
+
+    POLL_SECONDS = 0.01
+
+    def __init__(self, provider: str, semaphore=None, share: int = 1):
+        self.provider = provider
+        self.semaphore = semaphore or threading.BoundedSemaphore(max_concurrent(provider))
+        self.requests = TokenBucket(per_minute(provider, "rpm") / share)
+        self.tokens = TokenBucket(per_minute(provider, "tpm") / share)
+        self.rate_factor = 1.0
+        self.last_cut = 0.0
+        self.metrics = ProviderMetrics()
+
+    async def _admit(self, estimate: int) -> None:
+        while True:
+            wait = max(self.requests.wait_time(1, self.rate_factor), self.tokens.wait_time(estimate, self.rate_factor))
+            if wait <= 0:
+                self.requests.take(1)
+                self.tokens.take(estimate)
+                break
+            await asyncio.sleep(wait)
+        while not self.semaphore.acquire(False):
+            await asyncio.sleep(self.POLL_SECONDS)
+
+    @asynccontextmanager
+    async def slot(self, estimate: int = 0):
+        start = time.monotonic()
+        await self._admit(estimate)
+        self.metrics.waiting_seconds += time.monotonic() - start
+        try:
+            yield
+        finally:
+            self.semaphore.release()
+
+    def succeeded(self, usage, estimate: int, latency: float) -> None:
+        self.metrics.requests += 1
+        self.metrics.latency_seconds += latency
+        if usage:
+            self.metrics.input_tokens += usage.input_tokens
+            self.metrics.output_tokens += usage.output_tokens
+            # Settle the reservation against what the request actually used
+            self.tokens.take(usage.total_tokens - estimate)
+        self.rate_factor = min(1.0, self.rate_factor + RATE_RECOVERY)
+
+    def failed(self) -> None:
+        self.metrics.requests += 1
+        self.metrics.errors += 1
+
+    def throttled(self, error: RateLimitError, attempt: int) -> float:
+        """Record a 429, slow the provider down, and return how long to wait before retrying"""
+        self.metrics.requests += 1
+        self.metrics.rate_limited += 1
+        # A burst of 429s from requests that were already in flight only counts as one signal
+        if time.monotonic() - self.last_cut > 1:
+            self.rate_factor = max(MIN_RATE_FACTOR, self.rate_factor / 2)
+            self.last_cut = time.monotonic()
+        backoff = min(MAX_BACKOFF_SECONDS, BACKOFF_SECONDS * 2**attempt) + random.uniform(0, BACKOFF_SECONDS)
+        try:
+            retry_after = float(error.response.headers.get("retry-after", 0))
+        except (AttributeError, ValueError):
+            retry_after = 0.0
+        return max(backoff, retry_after)
+
+    def transient(self, attempt: int) -> float:
+        """Record a dropped connection, timeout or server error, and return how long to wait before retrying"""
+        self.metrics.requests += 1
+        self.metrics.errors += 1
+        return min(MAX_BACKOFF_SECONDS, BACKOFF_SECONDS * 2**attempt) + random.uniform(0, BACKOFF_SECONDS)
+
+
+def make_limiters(context) -> dict:
+    """Semaphores for every provider, created with a multiprocessing context so they can be handed to workers"""
+    return {provider: context.BoundedSemaphore(max_concurrent(provider)) for provider in PROVIDERS}
+
+
+_limiters: dict[str, ProviderLimiter] = {}
+
+
+def set_limiters(semaphores: dict, workers: int = 1) -> None:
+    """Use semaphores shared with the other worker processes, as made by make_limiters"""
+    _limiters.clear()
+    _limiters.update(
+        {provider: ProviderLimiter(provider, semaphore, workers) for provider, semaphore in semaphores.items()}
+    )
+
+
+def get_limiter(provider: str) -> ProviderLimiter:
+    if provider not in _limiters:
+        _limiters[provider] = ProviderLimiter(provider)
+    return _limiters[provider]
+
+
+def provider_metrics() -> dict[str, dict]:
+    return {provider: limiter.metrics.snapshot(limiter.rate_factor) for provider, limiter in _limiters.items()}
+
+
+@lru_cache(maxsize=None)
+def get_client(provider: str) -> AsyncOpenAI:
+    """
+    One client per provider, shared by every model using it, so connections are pooled and kept alive.
+    The client doesn't retry anything itself; LimitedModel retries 429s, so that it can slow the provider down,
+    and the dropped connections, timeouts and server errors the client would have retried.
+    """
+    settings = PROVIDERS[provider]
+    http_client = DefaultAsyncHttpxClient(
+        limits=httpx.Limits(max_connections=max_concurrent(provider), max_keepalive_connections=max_concurrent(provider)),
+        timeout=httpx.Timeout(REQUEST_TIMEOUT_SECONDS, connect=10),
+    )
+    return AsyncOpenAI(
+        base_url=settings["base_url"],
+        api_key=os.getenv(settings["api_key"]),
+        http_client=http_client,
+        max_retries=0,
+    )
+
+
+class LimitedModel(Model):
+    """
+    Wraps a model so that each request is admitted by its provider's limiter, and retried after a 429
+    or a transient error. A stream is only retried if it fails before any of its events have been passed on.
+    """
+
+    def __init__(self, model: Model, limiter: ProviderLimiter):
+        self.model = model
+        self.limiter = limiter
+
+    def _retry_delay(self, error: Exception, retries: dict[str, int]) -> float | None:
+        """How long to wait before retrying after the error, or None if it is not to be retried"""
+        if isinstance(error, RateLimitError):
+            if retries["rate_limited"] < MAX_RATE_LIMIT_RETRIES:
+                retries["rate_limited"] += 1
+                return self.limiter.throttled(error, retries["rate_limited"] - 1)
+        elif is_transient(error) and retries["transient"] < MAX_TRANSIENT_RETRIES:
+            retries["transient"] += 1
+            return self.limiter.transient(retries["transient"] - 1)
+        self.limiter.failed()
+        return None
+
+    async def get_response(self, system_instructions, input, *args, **kwargs):
+        estimate = estimate_tokens(system_instructions, input)
+        retries = {"rate_limited": 0, "transient": 0}
+        while True:
+            async with self.limiter.slot(estimate):
+                start = time.monotonic()
+                try:
+                    response = await self.model.get_response(system_instructions, input, *args, **kwargs)
+                except Exception as e:
+                    delay = self._retry_delay(e, retries)
+                    if delay is None:
+                        raise
+                else:
+                    self.limiter.succeeded(response.usage, estimate, time.monotonic() - start)
+                    return response
+            await asyncio.sleep(delay)
+
+    async def stream_response(self, system_instructions, input, *args, **kwargs):
+        estimate = estimate_tokens(system_instructions, input)
+        retries = {"rate_limited": 0, "transient": 0}
+        while True:
+            started = False
+            async with self.limiter.slot(estimate):
+                start = time.monotonic()
+                usage = None
+                try:
+                    async for event in self.model.stream_response(system_instructions, input, *args, **kwargs):
+                        if event.type == "response.completed":
+                            usage = event.response.usage
+                        started = True
+                        yield event
+                except Exception as e:
+                    delay = None if started else self._retry_delay(e, retries)
+                    if delay is None:
+                        if started:
+                            self.limiter.failed()
+                        raise
+                else:
+                    self.limiter.succeeded(usage, estimate, time.monotonic() - start)
+                    return
+            await asyncio.sleep(delay)
+
+
+def get_model(model_name: str) -> Model:
+    """The model for the name, using its provider's shared client and rate limited with every other model there"""
+    provider = provider_for(model_name)
+    if provider == "openai":
+        model = OpenAIResponsesModel(model=model_name, openai_client=get_client(provider))
+    else:
+        model = OpenAIChatCompletionsModel(model=model_name, openai_client=get_client(provider))
+    return LimitedModel(model, get_limiter(provider))
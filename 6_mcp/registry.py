@@ -0,0 +1,81 @@
+import os
+import zlib
+from dotenv import load_dotenv
+from database import read_traders, write_traders
+
+load_dotenv(override=True)
+
+USE_MANY_MODELS = os.getenv("USE_MANY_MODELS", "false").strip().lower() == "true"
+
+# The original four traders, used to seed an empty registry
+
+names = ["Warren", "George", "Ray", "Cathie"]
+lastnames = ["Patience", "Bold", "Systematic", "Crypto"]
+
+many_model_names = [
+    "gpt-4.1-mini",
+    "deepseek-chat",
+    "gemini-2.5-flash-preview-04-17",
+    "grok-3-mini-beta",
+]
+single_model_names = ["gpt-4o-mini"] * 4
+model_names = many_model_names if USE_MANY_MODELS else single_model_names
+
+SHORT_MODEL_NAMES = {
+    "gpt-4o-mini": "GPT 4o mini",
+    "gpt-4.1-mini": "GPT 4.1 Mini",
+    "deepseek-chat": "DeepSeek V3",
+    "gemini-2.5-flash-preview-04-17": "Gemini 2.5 Flash",
+    "grok-3-mini-beta": "Grok 3 Mini",
+}
+
+
+def short_model_name(model_name: str) -> str:
+    return SHORT_MODEL_NAMES.get(model_name, model_name)
+
+
+def default_traders() -> list[dict]:
+    return [
+        {"name": name, "lastname": lastname, "model_name": model_name}
+        for name, lastname, model_name in zip(names, lastnames, model_names)
+    ]
+
+
+def tournament_traders(count: int) -> list[dict]:
+    """count traders cycling through the original four personas and models, e.g. Warren1, George1, ... Warren2"""
+    return [
+        {"name": f"{names[i % 4]}{i // 4 + 1}", "lastname": lastnames[i % 4], "model_name": model_names[i % 4]}
+        for i in range(count)
+    ]
+
+
+def apply_default_models(traders: list[dict]) -> list[dict]:
+    """
+    The original four traders switched to the models USE_MANY_MODELS picks, unless their model has been set
+    to something other than either default; returns the traders that were switched
+    """
+    switched = []
+    for trader in traders:
+        if trader["name"] in names:
+            i = names.index(trader["name"])
+            if trader["model_name"] in (many_model_names[i], single_model_names[i]) and trader["model_name"] != model_names[i]:
+                switched.append({**trader, "model_name": model_names[i]})
+    return switched
+
+
+def load_traders() -> list[dict]:
+    """
+    The enabled traders in the registry, seeding it with the original four the first time.
+    Changing USE_MANY_MODELS switches the original four's models the next time the registry is loaded.
+    """
+    if not read_traders(enabled_only=False):
+        write_traders(default_traders())
+    switched = apply_default_models(read_traders(enabled_only=False))
+    if switched:
+        write_traders(switched)
+    return read_traders()
+
+
+def shard_of(name: str, workers: int) -> int:
+    """The worker that owns a trader; stable across restarts, unlike hash()"""
+    return zlib.crc32(name.lower().encode()) % workers
@@ -1,4 +1,7 @@
+import sys
 from accounts import Account
+from database import write_traders
+from registry import default_traders, tournament_traders
 
 waren_strategy = """
 You are Warren, and you are named in homage to your role model, Warren Buffett.
@@ -39,12 +42,19 @@ You focus your trading on crypto ETFs.
 """
 
 
-def reset_traders():
-    Account.get("Warren").reset(waren_strategy)
-    Account.get("George").reset(george_strategy)
-    Account.get("Ray").reset(ray_strategy)
-    Account.get("Cathie").reset(cathie_strategy)
+strategies = [waren_strategy, george_strategy, ray_strategy, cathie_strategy]
+
+
+def reset_traders(count: int | None = None):
+    """
+    Reset the registry to the original four traders, or to a tournament of count traders
+    cycling through the four personas, and give every trader a fresh account.
+    """
+    traders = tournament_traders(count) if count else default_traders()
+    write_traders(traders, replace=True)
+    for i, trader in enumerate(traders):
+        Account.get(trader["name"]).reset(strategies[i % len(strategies)])
 
 
 if __name__ == "__main__":
-    reset_traders()
+    reset_traders(int(sys.argv[1]) if len(sys.argv) > 1 else None)
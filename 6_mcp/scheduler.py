@@ -0,0 +1,207 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable
+from agents import RunHooks
+from dotenv import load_dotenv
+from database import write_log
+from mcp_pool import MCPServerPool
+from traders import Trader
+
+load_dotenv(override=True)
+
+# How many traders may be running at once; runs that are due while the limit is reached wait their turn
+MAX_CONCURRENT_RUNS = int(os.getenv("MAX_CONCURRENT_RUNS", "4"))
+# A run that takes longer than this is cancelled
+RUN_TIMEOUT_SECONDS = float(os.getenv("RUN_TIMEOUT_SECONDS", "900"))
+# A run whose model calls use more tokens than this is stopped; 0 for no limit
+RUN_TOKEN_BUDGET = int(os.getenv("RUN_TOKEN_BUDGET", "0"))
+# What to do when a trader is due while its previous run is still going: "skip" the run, or "queue" one more
+OVERLAP_POLICY = os.getenv("OVERLAP_POLICY", "skip").strip().lower()
+DURATION_HISTORY = 100
+
+
+class TokenBudgetExceeded(Exception):
+    pass
+
+
+class TokenBudget(RunHooks):
+    """
+    Run hooks that stop a run once its model calls have used more than max_tokens.
+    The trader passes them on to the Researcher tool's own run, so its calls are counted too. Each response's usage
+    is added up, as the two runs keep separate totals. An error raised inside a tool is handed to the model
+    rather than ending the run, so the next model call after the budget is spent is refused as well.
+    """
+
+    def __init__(self, max_tokens: int = 0):
+        self.max_tokens = max_tokens
+        self.used = 0
+        self.exceeded = False
+
+    def _check(self, agent) -> None:
+        if self.max_tokens and self.used > self.max_tokens:
+            self.exceeded = True
+            raise TokenBudgetExceeded(f"{agent.name} used {self.used} tokens, over its budget of {self.max_tokens}")
+
+    async def on_llm_start(self, context, agent, system_prompt, input_items) -> None:
+        self._check(agent)
+
+    async def on_llm_end(self, context, agent, response) -> None:
+        self.used += response.usage.total_tokens
+        self._check(agent)
+
+
+class ScheduledTrader:
+    """A trader with its own cadence and budgets, and a record of how its runs went"""
+
+    def __init__(self, trader: Trader, every: float, timeout: float, max_tokens: int, start: float):
+        self.trader = trader
+        self.every = every
+        self.timeout = timeout
+        self.max_tokens = max_tokens
+        self.next_run = start
+        self.task: asyncio.Task | None = None
+        self.queued = False
+        self.outcomes: dict[str, int] = {}
+        self.skipped = 0
+        self.missed = 0
+        self.durations: deque[float] = deque(maxlen=DURATION_HISTORY)
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def advance(self, now: float) -> None:
+        """Move to the next slot at a fixed rate, so the cadence doesn't drift by the run time"""
+        self.next_run += self.every
+        if self.next_run <= now:
+            behind = math.ceil((now - self.next_run) / self.every) or 1
+            self.missed += behind
+            self.next_run += behind * self.every
+
+    def record(self, outcome: str, duration: float) -> None:
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        self.durations.append(duration)
+
+    def stats(self) -> dict:
+        durations = sorted(self.durations)
+        return {
+            "runs": sum(self.outcomes.values()),
+            **self.outcomes,
+            "skipped": self.skipped,
+            "missed": self.missed,
+            "mean_seconds": sum(durations) / len(durations) if durations else None,
+            "p95_seconds": durations[int(0.95 * (len(durations) - 1))] if durations else None,
+            "max_seconds": durations[-1] if durations else None,
+        }
+
+
+class Scheduler:
+    """
+    Runs each trader on its own fixed-rate cadence, at most max_concurrent at a time.
+    Each run is cancelled if it exceeds its wall-clock timeout, and stopped if it exceeds its token budget.
+    A trader that is due while its previous run is still going is skipped, or with overlap="queue",
+    run once more as soon as the previous run finishes.
+    While should_run says no, due runs are skipped, and if until_open says how long that will last,
+    the scheduler sleeps until then rather than waking up for every slot.
+    """
+
+    def __init__(
+        self,
+        pool: MCPServerPool,
+        max_concurrent: int = MAX_CONCURRENT_RUNS,
+        overlap: str = OVERLAP_POLICY,
+        should_run: Callable[[], Awaitable[bool]] | None = None,
+        until_open: Callable[[], Awaitable[float]] | None = None,
+    ):
+        self.pool = pool
+        self.overlap = overlap
+        self.should_run = should_run
+        self.until_open = until_open
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.jobs: list[ScheduledTrader] = []
+
+    def add(
+        self,
+        trader: Trader,
+        every: float,
+        timeout: float = RUN_TIMEOUT_SECONDS,
+        max_tokens: int = RUN_TOKEN_BUDGET,
+        delay: float = 0.0,
+    ) -> ScheduledTrader:
+        """Schedule the trader every `every` seconds, first running after `delay` seconds"""
+        job = ScheduledTrader(trader, every, timeout, max_tokens, time.monotonic() + delay)
+        self.jobs.append(job)
+        return job
+
+    async def _run_job(self, job: ScheduledTrader) -> None:
+        async with self.semaphore:
+            budget = TokenBudget(job.max_tokens)
+            start = time.monotonic()
+            try:
+                await asyncio.wait_for(job.trader.run(self.pool, hooks=budget), job.timeout)
+                if budget.exceeded:
+                    outcome = "over_budget"
+                elif job.trader.last_error:
+                    outcome = "failed"
+                else:
+                    outcome = "completed"
+            except asyncio.TimeoutError:
+                outcome = "timed_out"
+            duration = time.monotonic() - start
+        job.record(outcome, duration)
+        write_log(job.trader.name, "schedule", f"Run {outcome} in {duration:.1f}s using {budget.used} tokens")
+        if job.queued:
+            job.queued = False
+            job.task = asyncio.create_task(self._run_job(job))
+
+    def _dispatch(self, job: ScheduledTrader) -> None:
+        if not job.running:
+            job.task = asyncio.create_task(self._run_job(job))
+        elif self.overlap == "queue":
+            job.queued = True
+        else:
+            job.skipped += 1
+            write_log(job.trader.name, "schedule", "Skipped run as the previous run is still going")
+
+    async def tick(self) -> None:
+        """Start every run that is due"""
+        now = time.monotonic()
+        due = [job for job in self.jobs if job.next_run <= now]
+        if not due:
+            return
+        delay = 0.0
+        if self.should_run is None or await self.should_run():
+            await self.pool.health_check()
+            for job in due:
+                self._dispatch(job)
+        else:
+            delay = await self.until_open() if self.until_open else 0.0
+            if delay > 0:
+                print(f"Market is closed, sleeping {delay / 60:.0f} minutes until it opens")
+            else:
+                print("Market is closed, skipping run")
+        for job in due:
+            job.advance(now)
+        for job in self.jobs:
+            job.next_run = max(job.next_run, now + delay)
+
+    async def run(self) -> None:
+        if not self.jobs:
+            print("No traders to schedule")
+            return
+        try:
+            while True:
+                await self.tick()
+                next_run = min(job.next_run for job in self.jobs)
+                await asyncio.sleep(max(0.0, next_run - time.monotonic()))
+        finally:
+            tasks = [job.task for job in self.jobs if job.running]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict[str, dict]:
+        return {job.trader.name: job.stats() for job in self.jobs}
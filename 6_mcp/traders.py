@@ -1,11 +1,8 @@
 from contextlib import AsyncExitStack
-from accounts_client import read_accounts_resource, read_strategy_resource
+from accounts_client import read_summary_resource, read_strategy_resource
 from tracers import make_trace_id
-from agents import Agent, Tool, Runner, OpenAIChatCompletionsModel, trace
-from openai import AsyncOpenAI
+from agents import Agent, Tool, Runner, RunHooks, trace
 from dotenv import load_dotenv
-import os
-import json
 from agents.mcp import MCPServerStdio
 from templates import (
     researcher_instructions,
@@ -14,40 +11,14 @@ from templates import (
     rebalance_message,
     research_tool,
 )
-from mcp_params import trader_mcp_server_params, researcher_mcp_server_params
+from mcp_params import accounts_mcp, trader_mcp_server_params, researcher_mcp_server_params
+from mcp_pool import MCPServerPool
+from providers import get_model
 
 load_dotenv(override=True)
 
-deepseek_api_key = os.getenv("DEEPSEEK_API_KEY")
-google_api_key = os.getenv("GOOGLE_API_KEY")
-grok_api_key = os.getenv("GROK_API_KEY")
-openrouter_api_key = os.getenv("OPENROUTER_API_KEY")
-
-DEEPSEEK_BASE_URL = "https://api.deepseek.com/v1"
-GROK_BASE_URL = "https://api.x.ai/v1"
-GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/openai/"
-OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
-
 MAX_TURNS = 30
 
-openrouter_client = AsyncOpenAI(base_url=OPENROUTER_BASE_URL, api_key=openrouter_api_key)
-deepseek_client = AsyncOpenAI(base_url=DEEPSEEK_BASE_URL, api_key=deepseek_api_key)
-grok_client = AsyncOpenAI(base_url=GROK_BASE_URL, api_key=grok_api_key)
-gemini_client = AsyncOpenAI(base_url=GEMINI_BASE_URL, api_key=google_api_key)
-
-
-def get_model(model_name: str):
-    if "/" in model_name:
-        return OpenAIChatCompletionsModel(model=model_name, openai_client=openrouter_client)
-    elif "deepseek" in model_name:
-        return OpenAIChatCompletionsModel(model=model_name, openai_client=deepseek_client)
-    elif "grok" in model_name:
-        return OpenAIChatCompletionsModel(model=model_name, openai_client=grok_client)
-    elif "gemini" in model_name:
-        return OpenAIChatCompletionsModel(model=model_name, openai_client=gemini_client)
-    else:
-        return model_name
-
 
 async def get_researcher(mcp_servers, model_name) -> Agent:
     researcher = Agent(
@@ -59,9 +30,10 @@ async def get_researcher(mcp_servers, model_name) -> Agent:
     return researcher
 
 
-async def get_researcher_tool(mcp_servers, model_name) -> Tool:
+async def get_researcher_tool(mcp_servers, model_name, hooks: RunHooks | None = None) -> Tool:
+    """The Researcher as a tool; its run gets the trader's hooks, so a token budget counts its calls too"""
     researcher = await get_researcher(mcp_servers, model_name)
-    return researcher.as_tool(tool_name="Researcher", tool_description=research_tool())
+    return researcher.as_tool(tool_name="Researcher", tool_description=research_tool(), hooks=hooks)
 
 
 class Trader:
@@ -71,9 +43,12 @@ class Trader:
         self.agent = None
         self.model_name = model_name
         self.do_trade = True
+        self.last_error: Exception | None = None
+        # The accounts server connected for this run, which the account summary and strategy are read through
+        self.accounts_server: MCPServerStdio | None = None
 
-    async def create_agent(self, trader_mcp_servers, researcher_mcp_servers) -> Agent:
-        tool = await get_researcher_tool(researcher_mcp_servers, self.model_name)
+    async def create_agent(self, trader_mcp_servers, researcher_mcp_servers, hooks: RunHooks | None = None) -> Agent:
+        tool = await get_researcher_tool(researcher_mcp_servers, self.model_name, hooks)
         self.agent = Agent(
             name=self.name,
             instructions=trader_instructions(self.name),
@@ -84,23 +59,37 @@ class Trader:
         return self.agent
 
     async def get_account_report(self) -> str:
-        account = await read_accounts_resource(self.name)
-        account_json = json.loads(account)
-        account_json.pop("portfolio_value_time_series", None)
-        return json.dumps(account_json)
+        """The compact account summary, so the prompt doesn't grow with the trade history"""
+        return await read_summary_resource(self.name, self.accounts_server)
+
+    async def get_strategy(self) -> str:
+        return await read_strategy_resource(self.name, self.accounts_server)
 
-    async def run_agent(self, trader_mcp_servers, researcher_mcp_servers):
-        self.agent = await self.create_agent(trader_mcp_servers, researcher_mcp_servers)
+    async def run_agent(self, trader_mcp_servers, researcher_mcp_servers, hooks: RunHooks | None = None):
+        self.agent = await self.create_agent(trader_mcp_servers, researcher_mcp_servers, hooks)
         account = await self.get_account_report()
-        strategy = await read_strategy_resource(self.name)
+        strategy = await self.get_strategy()
         message = (
             trade_message(self.name, strategy, account)
             if self.do_trade
             else rebalance_message(self.name, strategy, account)
         )
-        await Runner.run(self.agent, message, max_turns=MAX_TURNS)
+        await Runner.run(self.agent, message, max_turns=MAX_TURNS, hooks=hooks)
 
-    async def run_with_mcp_servers(self):
+    async def run_with_servers(self, trader_mcp_servers, researcher_mcp_servers, hooks: RunHooks | None = None):
+        """Run the agent, reading the account through the accounts server among its own rather than starting another"""
+        self.accounts_server = trader_mcp_servers[trader_mcp_server_params.index(accounts_mcp)]
+        try:
+            await self.run_agent(trader_mcp_servers, researcher_mcp_servers, hooks)
+        finally:
+            self.accounts_server = None
+
+    async def run_with_mcp_servers(self, pool: MCPServerPool | None = None, hooks: RunHooks | None = None):
+        if pool:
+            trader_mcp_servers = await pool.get_all(trader_mcp_server_params)
+            researcher_mcp_servers = await pool.get_all(researcher_mcp_server_params(self.name))
+            await self.run_with_servers(trader_mcp_servers, researcher_mcp_servers, hooks)
+            return
         async with AsyncExitStack() as stack:
             trader_mcp_servers = [
                 await stack.enter_async_context(
@@ -115,17 +104,19 @@ class Trader:
                     )
                     for params in researcher_mcp_server_params(self.name)
                 ]
-                await self.run_agent(trader_mcp_servers, researcher_mcp_servers)
+                await self.run_with_servers(trader_mcp_servers, researcher_mcp_servers, hooks)
 
-    async def run_with_trace(self):
+    async def run_with_trace(self, pool: MCPServerPool | None = None, hooks: RunHooks | None = None):
         trace_name = f"{self.name}-trading" if self.do_trade else f"{self.name}-rebalancing"
         trace_id = make_trace_id(f"{self.name.lower()}")
         with trace(trace_name, trace_id=trace_id):
-            await self.run_with_mcp_servers()
+            await self.run_with_mcp_servers(pool, hooks)
 
-    async def run(self):
+    async def run(self, pool: MCPServerPool | None = None, hooks: RunHooks | None = None):
+        self.last_error = None
         try:
-            await self.run_with_trace()
+            await self.run_with_trace(pool, hooks)
         except Exception as e:
+            self.last_error = e
             print(f"Error running trader {self.name}: {e}")
         self.do_trade = not self.do_trade
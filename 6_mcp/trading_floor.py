@@ -3,8 +3,13 @@ from typing import List
 import asyncio
 from tracers import LogTracer
 from agents import add_trace_processor
-from market import is_market_open
+from market import market_calendar
+from mcp_pool import MCPServerPool
+from scheduler import Scheduler
+from registry import load_traders, shard_of
+from providers import make_limiters, set_limiters
 from dotenv import load_dotenv
+import multiprocessing
 import os
 
 load_dotenv(override=True)
@@ -13,42 +18,73 @@ RUN_EVERY_N_MINUTES = int(os.getenv("RUN_EVERY_N_MINUTES", "60"))
 RUN_EVEN_WHEN_MARKET_IS_CLOSED = (
     os.getenv("RUN_EVEN_WHEN_MARKET_IS_CLOSED", "false").strip().lower() == "true"
 )
-USE_MANY_MODELS = os.getenv("USE_MANY_MODELS", "false").strip().lower() == "true"
+# Run the traders in this many worker processes, each owning a shard of the traders and its own MCP servers
+TRADING_FLOOR_WORKERS = int(os.getenv("TRADING_FLOOR_WORKERS", "1"))
 
-names = ["Warren", "George", "Ray", "Cathie"]
-lastnames = ["Patience", "Bold", "Systematic", "Crypto"]
 
-if USE_MANY_MODELS:
-    model_names = [
-        "gpt-4.1-mini",
-        "deepseek-chat",
-        "gemini-2.5-flash-preview-04-17",
-        "grok-3-mini-beta",
-    ]
-    short_model_names = ["GPT 4.1 Mini", "DeepSeek V3", "Gemini 2.5 Flash", "Grok 3 Mini"]
-else:
-    model_names = ["gpt-4o-mini"] * 4
-    short_model_names = ["GPT 4o mini"] * 4
+def load_shard(shard: int = 0, workers: int = 1) -> list[dict]:
+    """The registry entries of the traders owned by one shard"""
+    return [trader for trader in load_traders() if shard_of(trader["name"], workers) == shard]
+
+
+def create_traders(shard: int = 0, workers: int = 1) -> List[Trader]:
+    return [Trader(trader["name"], trader["lastname"], trader["model_name"]) for trader in load_shard(shard, workers)]
+
+
+def run_every_n_minutes_for(trader: dict) -> float:
+    """A trader's cadence from the registry, or e.g. RUN_EVERY_N_MINUTES_WARREN=30, or RUN_EVERY_N_MINUTES"""
+    default = os.getenv(f"RUN_EVERY_N_MINUTES_{trader['name'].upper()}", RUN_EVERY_N_MINUTES)
+    return float(trader["every_minutes"] or default)
+
 
+async def should_run() -> bool:
+    return RUN_EVEN_WHEN_MARKET_IS_CLOSED or await asyncio.to_thread(market_calendar.is_open)
 
-def create_traders() -> List[Trader]:
-    traders = []
-    for name, lastname, model_name in zip(names, lastnames, model_names):
-        traders.append(Trader(name, lastname, model_name))
-    return traders
 
+async def until_open() -> float:
+    return await asyncio.to_thread(market_calendar.seconds_until_open)
 
-async def run_every_n_minutes():
+
+async def run_every_n_minutes(shard: int = 0, workers: int = 1):
     add_trace_processor(LogTracer())
-    traders = create_traders()
-    while True:
-        if RUN_EVEN_WHEN_MARKET_IS_CLOSED or is_market_open():
-            await asyncio.gather(*[trader.run() for trader in traders])
-        else:
-            print("Market is closed, skipping run")
-        await asyncio.sleep(RUN_EVERY_N_MINUTES * 60)
+    async with MCPServerPool() as pool:
+        scheduler = Scheduler(pool, should_run=should_run, until_open=until_open)
+        for trader in load_shard(shard, workers):
+            scheduler.add(
+                Trader(trader["name"], trader["lastname"], trader["model_name"]),
+                every=run_every_n_minutes_for(trader) * 60,
+            )
+        await scheduler.run()
+
+
+def run_worker(shard: int, workers: int, limiters: dict, share: int):
+    set_limiters(limiters, share)
+    asyncio.run(run_every_n_minutes(shard, workers))
+
+
+def run_sharded(workers: int):
+    """Run the traders across worker processes that share a rate limiter per model provider"""
+    context = multiprocessing.get_context("spawn")
+    limiters = make_limiters(context)
+    # With few traders some shards own none of them, and get no worker
+    shards = sorted({shard_of(trader["name"], workers) for trader in load_traders()})
+    processes = [
+        context.Process(target=run_worker, args=(shard, workers, limiters, len(shards)))
+        for shard in shards
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            process.terminate()
 
 
 if __name__ == "__main__":
     print(f"Starting scheduler to run every {RUN_EVERY_N_MINUTES} minutes")
-    asyncio.run(run_every_n_minutes())
+    if TRADING_FLOOR_WORKERS > 1:
+        run_sharded(TRADING_FLOOR_WORKERS)
+    else:
+        asyncio.run(run_every_n_minutes())
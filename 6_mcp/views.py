@@ -0,0 +1,157 @@
+import threading
+import time
+import pandas as pd
+import plotly.express as px
+from accounts import Account
+from analytics import performance_summary
+from database import read_change_marker, read_change_markers
+
+# Prices move without the account changing, so the portfolio value is refreshed at least this often
+ACCOUNT_REFRESH_SECONDS = 120
+
+HOLDINGS_COLUMNS = ["Symbol", "Quantity"]
+TRANSACTIONS_COLUMNS = ["Timestamp", "Symbol", "Quantity", "Price", "Rationale"]
+LEADERBOARD_COLUMNS = ["Trader", "Value", "Return", "Volatility", "Sharpe", "Max Drawdown", "Turnover", "Trades"]
+
+
+def render_portfolio_value(account: Account) -> str:
+    """Calculate total portfolio value based on current prices"""
+    portfolio_value = account.calculate_portfolio_value() or 0.0
+    pnl = account.calculate_profit_loss(portfolio_value) or 0.0
+    color = "green" if pnl >= 0 else "red"
+    emoji = "⬆" if pnl >= 0 else "⬇"
+    return f"<div style='text-align: center;background-color:{color};'><span style='font-size:32px'>${portfolio_value:,.0f}</span><span style='font-size:24px'>&nbsp;&nbsp;&nbsp;{emoji}&nbsp;${pnl:,.0f}</span></div>"
+
+
+def render_chart(account: Account):
+    df = pd.DataFrame(account.get_portfolio_value_series(), columns=["datetime", "value"])
+    df["datetime"] = pd.to_datetime(df["datetime"])
+    fig = px.line(df, x="datetime", y="value")
+    margin = dict(l=40, r=20, t=20, b=40)
+    fig.update_layout(
+        height=300,
+        margin=margin,
+        xaxis_title=None,
+        yaxis_title=None,
+        paper_bgcolor="#bbb",
+        plot_bgcolor="#dde",
+    )
+    fig.update_xaxes(tickformat="%m/%d", tickangle=45, tickfont=dict(size=8))
+    fig.update_yaxes(tickfont=dict(size=8), tickformat=",.0f")
+    return fig
+
+
+def holdings_df(account: Account) -> pd.DataFrame:
+    """Convert holdings to DataFrame for display"""
+    holdings = account.get_holdings()
+    if not holdings:
+        return pd.DataFrame(columns=HOLDINGS_COLUMNS)
+    return pd.DataFrame([{"Symbol": symbol, "Quantity": quantity} for symbol, quantity in holdings.items()])
+
+
+def transactions_df(account: Account) -> pd.DataFrame:
+    """Convert transactions to DataFrame for display"""
+    transactions = account.list_transactions()
+    if not transactions:
+        return pd.DataFrame(columns=TRANSACTIONS_COLUMNS)
+    return pd.DataFrame(transactions)
+
+
+def _formatted(values: pd.Series, spec: str) -> pd.Series:
+    return values.map(spec.format, na_action="ignore").fillna("-")
+
+
+def leaderboard_df(names: list[str] | None = None) -> pd.DataFrame:
+    """The traders' performance metrics for display, best total return first"""
+    summary = performance_summary(names).sort_values("total_return", ascending=False)
+    if summary.empty:
+        # No trader has a portfolio value yet, e.g. just after a reset
+        return pd.DataFrame(columns=LEADERBOARD_COLUMNS)
+    table = pd.DataFrame(
+        {
+            "Trader": summary.index.str.capitalize(),
+            "Value": _formatted(summary["value"], "${:,.0f}"),
+            "Return": _formatted(summary["total_return"], "{:+.1%}"),
+            "Volatility": _formatted(summary["volatility"], "{:.1%}"),
+            "Sharpe": _formatted(summary["sharpe"], "{:.2f}"),
+            "Max Drawdown": _formatted(summary["max_drawdown"], "{:.1%}"),
+            "Turnover": _formatted(summary["turnover"], "{:.2f}"),
+            "Trades": summary["trades"],
+        },
+        columns=LEADERBOARD_COLUMNS,
+    )
+    return table.reset_index(drop=True)
+
+
+class LeaderboardViewModel:
+    """
+    The leaderboard across the dashboard's traders, rebuilt only when one of their accounts has changed
+    or recorded a new portfolio value; new log entries don't affect it
+    """
+
+    def __init__(self, names: list[str]):
+        self.names = names
+        self.builds = 0
+        self._lock = threading.Lock()
+        self._markers = None
+        self._table: pd.DataFrame | None = None
+
+    def table(self) -> pd.DataFrame:
+        with self._lock:
+            changes = read_change_markers()
+            markers = {}
+            for name in self.names:
+                marker = changes.get(name.lower())
+                # The version and the latest portfolio value; the latest log entry isn't shown on the leaderboard
+                markers[name] = (marker[0], marker[2]) if marker else None
+            if markers != self._markers:
+                self._table = leaderboard_df(self.names)
+                self._markers = markers
+                self.builds += 1
+            return self._table
+
+
+class TraderViewModel:
+    """
+    The dashboard outputs for one trader, built once on the server and shared by every session.
+    Each output is memoized against the part of the account it depends on: the tables against the account version,
+    the chart against the latest portfolio value, and the value against the version and the price refresh window.
+    A session asking for outputs that haven't changed gets the same objects back, so it can skip re-sending them.
+    """
+
+    def __init__(self, name: str, refresh_seconds: float = ACCOUNT_REFRESH_SECONDS):
+        self.name = name
+        self.refresh_seconds = refresh_seconds
+        self.builds = 0
+        self.account = Account.get(name)
+        self._lock = threading.Lock()
+        self._version = None
+        self._last_value_id = None
+        self._value_key = None
+        self._value = self._chart = self._holdings = self._transactions = None
+        self._outputs: tuple | None = None
+
+    def outputs(self) -> tuple:
+        """Return (portfolio value html, chart, holdings, transactions), rebuilding only what has changed"""
+        with self._lock:
+            version, _, last_value_id = read_change_marker(self.name)
+            changed = False
+            if version != self._version:
+                self.account.reload()
+                self._holdings = holdings_df(self.account)
+                self._transactions = transactions_df(self.account)
+                self._version = version
+                changed = True
+            value_key = (version, int(time.time() // self.refresh_seconds))
+            if value_key != self._value_key:
+                self._value = render_portfolio_value(self.account)
+                self._value_key = value_key
+                changed = True
+            if last_value_id != self._last_value_id:
+                self._chart = render_chart(self.account)
+                self._last_value_id = last_value_id
+                changed = True
+            if changed:
+                self.builds += 1
+                self._outputs = (self._value, self._chart, self._holdings, self._transactions)
+            return self._outputs